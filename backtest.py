@@ -0,0 +1,39 @@
+"""Command line tool to backtest trained models over a date range"""
+import argparse
+import asyncio
+import logging
+
+from services.backtest import BACKTEST_CHUNK_DAYS, BACKTEST_WORKERS, list_backtests, run_backtest
+from utils.logger import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of trained models")
+    parser.add_argument("models", nargs="*", help="Model names")
+    parser.add_argument("--start", help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date (YYYY-MM-DD), inclusive")
+    parser.add_argument("--chunk-days", type=int, default=BACKTEST_CHUNK_DAYS, help="Days per pool task")
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS, help="Processes of the backtest pool")
+    parser.add_argument("--list", action="store_true", help="Only list the saved backtests")
+    args = parser.parse_args()
+
+    if args.list:
+        for backtest in list_backtests():
+            logger.info(f"{backtest['backtest_id']}: {backtest['models']} {backtest['start_date']} to {backtest['end_date']}, {backtest['bytes']} bytes")
+        return
+    if not (args.models and args.start and args.end):
+        parser.error("models, --start and --end are required")
+
+    result = asyncio.run(run_backtest(args.models, args.start, args.end, chunk_days=args.chunk_days, workers=args.workers))
+    logger.info(f"Backtest {result['backtest_id']} saved to {result['path']} in {result['seconds']:.1f}s")
+    for name, metrics in result["metrics"]["by_model"].items():
+        logger.info(f"{name}: MAE {metrics['mae']}, RMSE {metrics['rmse']}, MAPE {metrics['mape']} over {metrics['hours']} hours")
+    for name, error in result["errors"].items():
+        logger.error(f"{name}: {error}")
+
+
+if __name__ == "__main__":
+    setup_logging(log_level="INFO")
+    main()
@@ -0,0 +1,53 @@
+"""
+Compare two benchmark result files and report regressions
+
+Usage:
+    python -m benchmarks.compare baseline.json current.json --threshold 1.2
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+# Fields that identify a result, everything else is a measurement
+_KEY_FIELDS = ("case", "years", "models", "parallel")
+
+
+def result_key(result: Dict[str, Any]) -> Tuple:
+    return tuple(result.get(field) for field in _KEY_FIELDS)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="JSON written by run_benchmarks.py")
+    parser.add_argument("current", help="JSON written by run_benchmarks.py")
+    parser.add_argument("--metric", default="p50_s", choices=["p50_s", "p95_s", "mean_s"])
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio above which a case counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = {result_key(result): result for result in json.load(file)["results"]}
+    with open(args.current) as file:
+        current = {result_key(result): result for result in json.load(file)["results"]}
+
+    regressions = 0
+    print(f"{'case':<32}{'years':>6}{'models':>7}{'baseline':>11}{'current':>11}{'ratio':>8}")
+    for key, result in current.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key][args.metric], result[args.metric]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > args.threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        case, years, models, _ = key
+        print(f"{case:<32}{years:>6g}{models or '':>7}{before:>11.4f}{after:>11.4f}{ratio:>8.2f}{flag}")
+
+    if regressions:
+        print(f"{regressions} case(s) slower than {args.threshold}x the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Benchmarks of the service hot paths on synthetic data
+
+Every data size runs in its own spawned process inside a temporary workspace
+(static/ and trained_models/ as the services expect), so peak RSS is measured
+per size and the real data and models are never touched.
+
+Usage:
+    python -m benchmarks.run_benchmarks --years 1 5 20 --output benchmark_results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic_data import generate_master_data, write_master_data_csv
+
+MODEL_COUNTS = (1, 4, 16)
+TRAIN_HYPERPARAMS = {"learning_rate": 0.1, "early_stopping_rounds": 10, "n_estimators": 100, "max_depth": 6}
+BENCHMARK_MODEL = "bench_model"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MiB, None where the platform does not report it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """p50/p95 and range of a list of durations in seconds"""
+    values = np.asarray(timings)
+    return {
+        "repeats": len(values),
+        "p50_s": float(np.percentile(values, 50)),
+        "p95_s": float(np.percentile(values, 95)),
+        "mean_s": float(values.mean()),
+        "min_s": float(values.min()),
+        "max_s": float(values.max()),
+    }
+
+
+def measure(case: str, func: Callable[[int], Any], repeats: int, warmup: int = 0, **labels: Any) -> Dict[str, Any]:
+    """
+    Time func(i) for warmup + repeats iterations, the warmup iterations are not recorded
+
+    Args:
+        case: Benchmark name
+        func: Called with the iteration number, so every iteration can use fresh inputs
+        repeats: Recorded iterations
+        warmup: Iterations run before recording
+        labels: Extra fields stored with the result, e.g. the number of models
+
+    Returns:
+        Result dict with timing summary and peak RSS after the case
+    """
+    timings = []
+    for iteration in range(warmup + repeats):
+        start = time.perf_counter()
+        func(iteration)
+        if iteration >= warmup:
+            timings.append(time.perf_counter() - start)
+    result = {"case": case, **labels, **summarize(timings), "peak_rss_mb": peak_rss_mb()}
+    print(f"{case} {labels}: p50 {result['p50_s']:.4f}s, p95 {result['p95_s']:.4f}s", flush=True)
+    return result
+
+
+def run_size(years: float, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Run every benchmark on one synthetic data size, in a fresh workspace
+
+    Args:
+        years: Length of the synthetic history
+        options: Parsed command line options as a dict
+
+    Returns:
+        One result dict per benchmark case
+    """
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    workspace = tempfile.mkdtemp(prefix=f"benchmark_{years:g}y_")
+    os.makedirs(os.path.join(workspace, "static"))
+    os.makedirs(os.path.join(workspace, "trained_models"))
+    os.chdir(workspace)
+
+    # The services resolve their data and model paths relative to the working directory
+    from services.columnar_store import ingest_csv
+    from services.master_data import MASTER_DATA_DATASET_PATH, TRAINING_DATA_PATH, MasterDataStore, master_data_store
+    from services.model_service import ModelService, _prepare_forecast_input, model_cache
+
+    repeats, warmup = options["repeats"], options["warmup"]
+    frame = generate_master_data(years, seed=options["seed"])
+    write_master_data_csv(frame, TRAINING_DATA_PATH)
+    labels = {"years": years, "rows": len(frame)}
+    results = []
+
+    try:
+        results.append(measure(
+            "load_master_data_csv",
+            lambda _: MasterDataStore(dataset_path=os.path.join("static", "missing")).get(),
+            repeats, warmup, **labels,
+        ))
+        ingest_csv(TRAINING_DATA_PATH, MASTER_DATA_DATASET_PATH)
+        results.append(measure(
+            "load_master_data_columnar", lambda _: MasterDataStore().get(), repeats, warmup, **labels,
+        ))
+
+        # Train on the year before the last forecast_days days, which are kept for forecasting
+        data_end = frame.index[-1].tz_convert("UTC")
+        forecast_days = (options["repeats"] + options["warmup"]) * (len(MODEL_COUNTS) + 2)
+        train_end = (data_end - timedelta(days=forecast_days + 1)).date()
+        train_start = max(train_end - timedelta(days=options["train_days"]), (frame.index[0].tz_convert("UTC") + timedelta(days=15)).date())
+        results.append(measure(
+            "train_model",
+            lambda _: asyncio.run(ModelService.train_model(
+                "xgb", BENCHMARK_MODEL, str(train_start), str(train_end), TRAIN_HYPERPARAMS,
+            )),
+            options["train_repeats"], 0, train_days=(train_end - train_start).days, **labels,
+        ))
+        # Loading a trained model from the MLflow store vs from its native export
+        from openstef.model.serializer import MLflowSerializer
+        from services.model_artifacts import load_native
+
+        model_dir = os.path.join("trained_models", BENCHMARK_MODEL)
+        experiment_name = str(model_cache.get(BENCHMARK_MODEL).pj["id"])
+        results.append(measure(
+            "load_model_mlflow",
+            lambda _: MLflowSerializer(mlflow_tracking_uri=os.path.join(model_dir, "mlflow_trained_models")).load_model(experiment_name=experiment_name),
+            repeats, warmup, **labels,
+        ))
+        results.append(measure(
+            "load_model_native", lambda _: load_native(model_dir, experiment_name), repeats, warmup, **labels,
+        ))
+
+        for copy in range(1, max(MODEL_COUNTS)):
+            shutil.copytree(os.path.join("trained_models", BENCHMARK_MODEL), os.path.join("trained_models", f"{BENCHMARK_MODEL}_{copy:02d}"))
+        model_names = [BENCHMARK_MODEL] + [f"{BENCHMARK_MODEL}_{copy:02d}" for copy in range(1, max(MODEL_COUNTS))]
+
+        # Every iteration forecasts a new day, so the day forecast cache never serves a result
+        dates = [str((data_end - timedelta(days=offset)).date()) for offset in range(forecast_days, 0, -1)]
+        next_date = iter(dates)
+
+        input_data = master_data_store.get()
+        lookback = model_cache.get(BENCHMARK_MODEL).lookback
+        first_index = len(input_data) - 24 * forecast_days
+        results.append(measure(
+            "prepare_forecast_input",
+            lambda i: _prepare_forecast_input(input_data, first_index + 24 * (i % forecast_days), lookback),
+            repeats, warmup, **labels,
+        ))
+        results.append(measure(
+            "forecast_from_model",
+            lambda _: asyncio.run(ModelService.forecast_from_model(BENCHMARK_MODEL, next(next_date), 12)),
+            repeats, warmup, **labels,
+        ))
+        for count in MODEL_COUNTS:
+            results.append(measure(
+                "forecast_from_mulitple_models",
+                lambda _: asyncio.run(ModelService.forecast_from_mulitple_models(
+                    model_names[:count], next(next_date), parallel=options["parallel"],
+                )),
+                repeats, warmup, models=count, parallel=options["parallel"], **labels,
+            ))
+    finally:
+        if not options["keep_workspace"]:
+            os.chdir(tempfile.gettempdir())
+            shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the service hot paths on synthetic data")
+    parser.add_argument("--years", type=float, nargs="+", default=[1.0], help="Synthetic data sizes in years (1-20)")
+    parser.add_argument("--repeats", type=int, default=5, help="Recorded iterations per case")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded iterations before each case")
+    parser.add_argument("--train-repeats", type=int, default=1, help="Recorded training runs")
+    parser.add_argument("--train-days", type=int, default=365, help="Length of the training window in days")
+    parser.add_argument("--parallel", action="store_true", help="Forecast multiple models in the process pool")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-workspace", action="store_true", help="Keep the generated data and models")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    args = parser.parse_args()
+
+    for years in args.years:
+        if not 1 <= years <= 20:
+            parser.error("--years must be between 1 and 20")
+
+    options = vars(args)
+    started_at = datetime.now(timezone.utc).isoformat()
+    results = []
+    for years in args.years:
+        # A fresh process per size keeps the peak RSS of one size from leaking into the next
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results.extend(executor.submit(run_size, years, options).result())
+
+    report = {
+        "meta": {
+            "started_at": started_at,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": options,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
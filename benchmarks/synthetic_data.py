@@ -0,0 +1,109 @@
+"""Generator of synthetic hourly master data with the schema of master_data_with_forecasted.csv"""
+import argparse
+from datetime import timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+UTC_OFFSET = timezone(timedelta(hours=6))
+DEFAULT_END = "2025-09-30 23:00"
+
+# Holiday type codes and how often they occur among holidays in the real data
+_HOLIDAY_TYPES = np.array([1, 3, 5, 6, 7, 8, 10])
+_HOLIDAY_TYPE_WEIGHTS = np.array([552, 288, 264, 312, 120, 72, 96]) / 1704
+
+# Weather condition codes, mostly 5 (clear/cloudy) like the real data
+_CONDITION_CODES = np.array([1, 2, 3, 5, 7, 8, 9, 25])
+_CONDITION_WEIGHTS = np.array([2318, 396, 1117, 18939, 329, 446, 344, 85]) / 23974
+
+
+def generate_master_data(years: float, end: str = DEFAULT_END, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate hourly master data with daily, weekly and seasonal load patterns
+
+    Args:
+        years: Length of the history in years
+        end: Last hour (local time, UTC+06:00)
+        seed: Random seed, the same seed gives the same data
+
+    Returns:
+        DataFrame indexed by date_time with the columns of master_data_with_forecasted.csv
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(
+        end=pd.Timestamp(end).tz_localize(UTC_OFFSET),
+        periods=int(round(years * 365.25 * 24)),
+        freq="h",
+        name="date_time",
+    )
+    n = len(index)
+    hour = index.hour.to_numpy()
+    season = 2 * np.pi * (index.dayofyear.to_numpy() - 110) / 365.25
+    day = 2 * np.pi * hour / 24
+
+    # Weekly pattern with Friday as the main weekend day
+    weekend = index.dayofweek.to_numpy() == 4
+
+    # Holiday flags are the same for all 24 hours of a day
+    unique_days, day_of_row = np.unique(index.normalize().asi8, return_inverse=True)
+    holiday = rng.random(len(unique_days)) < 0.08
+    holiday_type = np.where(holiday, rng.choice(_HOLIDAY_TYPES, len(unique_days), p=_HOLIDAY_TYPE_WEIGHTS), 0)
+
+    temp = 27 + 4.5 * np.sin(season) + 3 * np.sin(day - np.pi * 0.6) + rng.normal(0, 0.8, n)
+    rhum = np.clip(72 + 12 * np.sin(season - 0.6) - 2 * (temp - 27) + rng.normal(0, 6, n), 15, 100)
+    dwpt = temp - (100 - rhum) / 5
+    monsoon = np.sin(season - 0.8) > 0.3
+    prcp = np.where(rng.random(n) < np.where(monsoon, 0.15, 0.02), rng.exponential(1.5, n), 0.0)
+
+    growth = 1 + 0.03 * np.arange(n) / (365.25 * 24)
+    load = growth * (
+        1250
+        + 180 * np.sin(season)
+        + 150 * np.sin(day - np.pi * 0.7)
+        + 90 * np.exp(-((hour - 20) ** 2) / 6)
+        + 12 * (temp - 27)
+        - 80 * weekend
+        - 120 * holiday[day_of_row]
+    ) + rng.normal(0, 25, n)
+
+    frame = pd.DataFrame(
+        {
+            "load": load.round(0),
+            "is_holiday": holiday[day_of_row].astype(float),
+            "holiday_type": holiday_type[day_of_row].astype(float),
+            "national_event_type": np.zeros(n),
+            "temp": temp.round(1),
+            "dwpt": dwpt.round(1),
+            "rhum": rhum.round(0),
+            "prcp": prcp.round(1),
+            "wdir": rng.integers(0, 37, n) * 10.0,
+            "wspd": rng.gamma(2.0, 4.5, n).round(1),
+            "pres": (1008 - 6 * np.sin(season) + rng.normal(0, 1.5, n)).round(0),
+            "coco": rng.choice(_CONDITION_CODES, n, p=_CONDITION_WEIGHTS).astype(float),
+            "forecasted_load": (load * 1.08 + rng.normal(0, 60, n)).round(0),
+        },
+        index=index,
+    )
+    return frame
+
+
+def write_master_data_csv(frame: pd.DataFrame, path: str) -> None:
+    """Write generated data in the CSV layout read by the master data store"""
+    frame.to_csv(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic master data")
+    parser.add_argument("--years", type=float, default=1.0, help="Length of the history in years (1-20)")
+    parser.add_argument("--end", default=DEFAULT_END, help="Last hour, local time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="CSV file to write")
+    args = parser.parse_args()
+
+    frame = generate_master_data(args.years, end=args.end, seed=args.seed)
+    write_master_data_csv(frame, args.output)
+    print(f"Wrote {len(frame)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
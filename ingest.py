@@ -0,0 +1,43 @@
+"""Command line tool to convert the master data CSV into the columnar dataset and back"""
+import argparse
+import logging
+
+from services.columnar_store import append_rows, export_csv, ingest_csv
+from services.master_data import MASTER_DATA_DATASET_PATH, MASTER_DATA_VERSION_PATH, TRAINING_DATA_PATH, read_master_data_csv
+from utils.logger import setup_logging
+from utils.shared_counter import SharedCounter
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the columnar master data dataset")
+    parser.add_argument("--dataset", default=MASTER_DATA_DATASET_PATH, help="Dataset directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Convert a CSV into the dataset, replacing it")
+    ingest_parser.add_argument("--csv", default=TRAINING_DATA_PATH, help="Source CSV file")
+
+    append_parser = subparsers.add_parser("append", help="Append new hours from a CSV as a new part")
+    append_parser.add_argument("--csv", required=True, help="CSV with the same columns as the master data")
+
+    export_parser = subparsers.add_parser("export", help="Export the dataset as CSV")
+    export_parser.add_argument("--csv", required=True, help="Destination CSV file")
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        rows = ingest_csv(args.csv, args.dataset)
+    elif args.command == "append":
+        rows = append_rows(read_master_data_csv(args.csv), args.dataset)
+    else:
+        rows = export_csv(args.csv, args.dataset)
+    if args.command != "export":
+        # Running servers reload right away instead of at their next periodic check
+        SharedCounter(MASTER_DATA_VERSION_PATH).increment()
+    logger.info(f"{args.command} finished: {rows} rows")
+
+
+if __name__ == "__main__":
+    setup_logging(log_level="INFO")
+    main()
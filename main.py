@@ -1,10 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 import logging
+import time
 
 # Import routers
-from routes import train_model, forecast, forecast_multiple, data_input, dashboard
+from routes import train_model, forecast, forecast_multiple, data_input, dashboard, metrics, health, backtest
+from services.hyperparameter_sweep import sweep_runner
+from services.master_data import edit_log_compactor
+from services.model_usage import model_usage
+from services.retraining_scheduler import retraining_scheduler
+from services.training_queue import training_queue
+from services.warmup import warmup
+from services.worker_pool import shutdown_executors
 from utils.logger import setup_logging
+from utils.metrics import begin_request, observe_request, route_template, server_timing_header
 
 # Setup logging once at startup
 setup_logging(log_level="INFO", log_file="logs/app.log")
@@ -14,12 +23,52 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="DPDC OpenSTEF")
 
 
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    """Record the request duration and report the timed stages in a Server-Timing header"""
+    endpoint = route_template(request)
+    timings = begin_request(endpoint)
+    start = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - start
+    observe_request(endpoint, request.method, response.status_code, total)
+    response.headers["Server-Timing"] = server_timing_header(timings, total)
+    return response
+
+
 # @app.on_event("startup")
 # async def startup_event():
 #     """Log application startup"""
 #     logger.info("DPDC OpenSTEF application started successfully")
 
 
+@app.on_event("startup")
+async def start_warmup():
+    """Load the master data, the forecast pipeline and the most used models, see STARTUP_WARMUP"""
+    await warmup.start()
+
+
+@app.on_event("startup")
+async def start_training_queue():
+    """Resume queued training jobs and sweeps, start accepting new ones, compacting data edits and checking for drift"""
+    await training_queue.start()
+    await sweep_runner.start()
+    await edit_log_compactor.start()
+    await retraining_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_worker_pools():
+    """Stop the warm-up, the training queue, the sweep runner, the edit compaction, the drift checks and the process pools used for parallel work"""
+    await warmup.stop()
+    await retraining_scheduler.stop()
+    await training_queue.stop()
+    await sweep_runner.stop()
+    await edit_log_compactor.stop()
+    shutdown_executors()
+    model_usage.flush()
+
+
 # @app.on_event("shutdown")
 # async def shutdown_event():
 #     """Log application shutdown"""
@@ -35,6 +84,9 @@ app.include_router(forecast.router, tags=["Forecast"])
 app.include_router(forecast_multiple.router, tags=["Forecast Multiple"])
 app.include_router(data_input.router, tags=["Data Input"])
 app.include_router(dashboard.router, tags=["Dashboard"])
+app.include_router(metrics.router, tags=["Metrics"])
+app.include_router(health.router, tags=["Health"])
+app.include_router(backtest.router, tags=["Backtest"])
 
 
 if __name__ == "__main__":
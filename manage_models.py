@@ -0,0 +1,46 @@
+"""Command line tool to export trained models natively and remove their old versions"""
+import argparse
+import logging
+import os
+import pickle
+
+from services.model_artifacts import MODEL_KEEP_VERSIONS, model_versions, refresh_artifacts
+from services.model_cache import model_lock_path
+from services.model_service import PARENT_DIR
+from utils.file_lock import file_lock
+from utils.logger import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the artifacts of the trained models")
+    parser.add_argument("models", nargs="*", help="Model names, all trained models if omitted")
+    parser.add_argument("--keep", type=int, default=MODEL_KEEP_VERSIONS, help="MLflow runs to keep per model")
+    parser.add_argument("--list", action="store_true", help="Only list the stored versions")
+    args = parser.parse_args()
+
+    names = args.models or sorted(
+        name for name in os.listdir(PARENT_DIR) if os.path.isfile(os.path.join(PARENT_DIR, name, "pj.pkl"))
+    )
+    for name in names:
+        model_dir = os.path.join(PARENT_DIR, name)
+        if args.list:
+            for version in model_versions(model_dir):
+                logger.info(f"{name}: run {version['run_id']} status {version['status']} {version['lifecycle_stage']}")
+            continue
+        with open(os.path.join(model_dir, "pj.pkl"), "rb") as file:
+            pj = pickle.load(file)
+        # Same lock as a training run, so a model is never pruned while it is trained
+        with file_lock(model_lock_path(PARENT_DIR, name)):
+            try:
+                result = refresh_artifacts(model_dir, str(pj["id"]), args.keep)
+            except LookupError as e:
+                logger.error(f"{name}: {e}")
+                continue
+        logger.info(f"{name}: {result}")
+
+
+if __name__ == "__main__":
+    setup_logging(log_level="INFO")
+    main()
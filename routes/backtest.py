@@ -0,0 +1,54 @@
+"""Backtest routes"""
+from fastapi import APIRouter, Form, HTTPException
+import asyncio
+import logging
+from typing import Optional
+from services.backtest import BACKTEST_CHUNK_DAYS, list_backtests, load_backtest, run_backtest
+from utils.json_response import json_response
+from utils.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.post("/api/backtest")
+async def backtest(
+    model_names: str = Form(...),  # Comma-separated list of model names
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+    chunk_days: Optional[int] = Form(None)  # Days per pool task, BACKTEST_CHUNK_DAYS if not given
+):
+    """API endpoint for a rolling-origin backtest of trained models over a date range"""
+    model_names_list = [name.strip() for name in model_names.split(',') if name.strip()]
+
+    logger.info(f"Backtest request - Models: {model_names_list}, From: {start_date}, To: {end_date}")
+
+    try:
+        result = await run_backtest(model_names_list, start_date, end_date, chunk_days=chunk_days or BACKTEST_CHUNK_DAYS)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid date range: dates are outside the master data")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid backtest: {e}")
+
+    with stage_timer("render"):
+        response = json_response(result)
+    return response
+
+
+@router.get("/api/backtests")
+async def backtests():
+    """API endpoint listing the saved backtests, newest first"""
+    return json_response(await asyncio.to_thread(list_backtests))
+
+
+@router.get("/api/backtests/{backtest_id}")
+async def get_backtest(backtest_id: str, series: bool = False):
+    """API endpoint re-reading a saved backtest and its metrics, with the hourly series if requested"""
+    result = await asyncio.to_thread(load_backtest, backtest_id, series)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Backtest not found: {backtest_id}")
+
+    with stage_timer("render"):
+        response = json_response(result)
+    return response
@@ -1,8 +1,13 @@
 """Dashboard routes"""
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
+from typing import Optional
 import logging
+from services.dashboard_metrics import dashboard_metrics
+from services.data_quality import data_quality
+from utils.json_response import json_response
+from utils.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
@@ -17,34 +22,27 @@ async def dashboard_page(request: Request):
 
 
 @router.get("/api/dashboard-data")
-async def get_dashboard_data():
-    """API endpoint for fetching dashboard data"""
+async def get_dashboard_data(days: Optional[int] = None):
+    """API endpoint for fetching dashboard data, optionally only the last `days` days of the daily chart"""
     logger.info("Fetching dashboard data")
     
-    # Mock dashboard data
-    dates = ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05", 
-             "2024-01-06", "2024-01-07"]
-    
-    dashboard_data = {
-        "daily_forecast": {
-            "dates": dates,
-            "actual": [1200, 1250, 1180, 1300, 1280, 1220, 1260],
-            "predicted": [1210, 1240, 1190, 1290, 1275, 1230, 1255]
-        },
-        "model_performance": {
-            "models": ["XGBoost", "LightGBM", "Ensemble"],
-            "mae": [45.2, 48.5, 42.1],
-            "rmse": [58.3, 61.2, 55.7],
-            "r2": [0.92, 0.91, 0.94]
-        },
-        "hourly_pattern": {
-            "hours": list(range(24)),
-            "avg_load": [900, 850, 820, 800, 810, 850, 950, 1100, 1250, 1350, 1400, 1420,
-                        1400, 1380, 1350, 1320, 1300, 1350, 1400, 1380, 1300, 1200, 1100, 1000]
-        }
-    }
+    # Served from the precomputed aggregates, only days changed since the last call are recomputed
+    with stage_timer("dashboard_aggregates"):
+        dashboard_data = dashboard_metrics.dashboard_data(days)
     
     logger.debug("Dashboard data retrieved successfully")
     
-    return JSONResponse(dashboard_data)
+    return json_response(dashboard_data)
+
 
+@router.get("/api/data-quality")
+async def get_data_quality(request: Request, days: Optional[int] = None):
+    """API endpoint for the data quality indicators, optionally only the last `days` days of the per-day table"""
+    # The ETag follows the master data version, so polling an unchanged state costs no payload
+    with stage_timer("data_quality"):
+        etag = f'"{data_quality.version}-{days}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        indicators = data_quality.indicators(days)
+    
+    return json_response(indicators, headers={"ETag": etag, "Cache-Control": "no-cache"})
@@ -1,9 +1,16 @@
 """Data Input routes"""
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, HTTPException, Query, Request, Form
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
+import asyncio
 import json
 import logging
+import math
+from typing import Any, Dict, List
+from services.day_index import nullable_lists
+from services.master_data import master_data_store
+from utils.json_response import json_response
+from utils.dateutils import create_utc_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -18,22 +25,34 @@ async def data_input_page(request: Request):
 
 
 @router.get("/api/data-input")
-async def get_data_input(date: str):
-    """API endpoint for fetching predicted and actual data for a specific date"""
-    logger.info(f"Fetching data input for date: {date}")
+async def get_data_input(date: List[str] = Query(default=[])):
+    """API endpoint for fetching predicted and actual data for one or more dates (repeat the date parameter)"""
+    logger.info(f"Fetching data input for dates: {date}")
     
-    # Mock data - 24 hours of predicted and actual values
-    hourly_data = []
-    for hour in range(24):
-        hourly_data.append({
-            "hour": hour,
-            "predicted": 1200 + hour * 10 if hour % 2 == 0 else 0,
-            "actual": 1195 + hour * 10 if hour % 3 == 0 else 0
-        })
+    if not date:
+        raise HTTPException(status_code=400, detail="At least one date is required")
+    try:
+        values = master_data_store.day_index().values(date, ["forecasted_load", "load"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {e}")
     
-    logger.debug(f"Retrieved {len(hourly_data)} hourly records for date: {date}")
+    # 24 hours of predicted and actual values per date, None where the master data has no value
+    days = [
+        {
+            "date": day,
+            "data": [
+                {"hour": hour, "predicted": predicted, "actual": actual}
+                for hour, (predicted, actual) in enumerate(zip(predicted_values, actual_values))
+            ]
+        }
+        for day, predicted_values, actual_values in zip(
+            date, nullable_lists(values["forecasted_load"]), nullable_lists(values["load"])
+        )
+    ]
     
-    return JSONResponse({"date": date, "data": hourly_data})
+    logger.debug(f"Retrieved hourly records for {len(days)} dates")
+    
+    return json_response(days[0] if len(days) == 1 else {"days": days})
 
 
 @router.post("/api/data-input")
@@ -47,11 +66,66 @@ async def update_data_input(
     logger.info(f"Updating data for date: {date} with {len(data_list)} records")
     logger.debug(f"Hourly data: {data_list}")
     
+    try:
+        rows = _edited_rows(date, data_list)
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid hourly data: {e}")
+    
+    if rows:
+        # Appending fsyncs the edit log, keep that off the event loop
+        result = await asyncio.to_thread(master_data_store.write_edits, rows)
+    else:
+        result = {"edit_id": None, "version": master_data_store.version}
+    
     logger.info(f"Data updated successfully for {date}")
     
     return JSONResponse({
         "status": "success",
         "message": f"Data updated successfully for {date}",
-        "records_updated": len(data_list)
+        "records_updated": len(rows),
+        "edit_id": result["edit_id"],
+        "data_version": result["version"]
     })
 
+
+
+@router.get("/api/master-data/stats")
+async def get_master_data_stats():
+    """API endpoint reporting load time and memory use of the shared master data"""
+    return JSONResponse(master_data_store.stats())
+
+
+def _edited_rows(date: str, data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Convert the hourly records of the data input page into edit log rows
+
+    Args:
+        date: Date string in format 'YYYY-MM-DD'
+        data_list: Records with 'hour' (0-23) and optional 'actual' and 'predicted' values
+
+    Returns:
+        Rows with the UTC timestamp and the 'load' and 'forecasted_load' values of each hour that has a value
+
+    Raises:
+        ValueError: If a record is invalid or has values for an hour the master data does not have
+    """
+    # Only existing hours can be edited, so an edit never extends the master data
+    known_rows = master_data_store.day_index().rows([date])[0]
+    rows = []
+    for item in data_list:
+        hour = int(item["hour"])
+        if not 0 <= hour <= 23:
+            raise ValueError(f"hour must be between 0 and 23, got {hour}")
+        row = {"timestamp": create_utc_datetime(date, hour)}
+        for field, column in (("actual", "load"), ("predicted", "forecasted_load")):
+            if item.get(field) is not None:
+                value = float(item[field])
+                if not math.isfinite(value):
+                    raise ValueError(f"{field} of hour {hour} is not a number")
+                row[column] = value
+        # Hours without any value keep their stored values
+        if len(row) > 1:
+            if known_rows[hour] < 0:
+                raise ValueError(f"hour {hour} of {date} is not in the master data")
+            rows.append(row)
+    return rows
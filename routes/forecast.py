@@ -1,16 +1,24 @@
 """Forecast routes"""
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, HTTPException, Query, Request, Form
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 import json
 import logging
+from typing import List, Optional
+from services.day_index import nullable_lists
+from services.master_data import master_data_store
 from services.model_service import ModelService
+from utils.json_response import json_response
+from utils.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
+# Weather parameters shown on the forecast page, parameters missing from the master data are None
+WEATHER_COLUMNS = ["temp", "rhum", "prcp", "wdir", "wspd", "pres", "cldc", "coco"]
+
 
 @router.get("/forecast", response_class=HTMLResponse)
 async def forecast_page(request: Request):
@@ -47,42 +55,84 @@ async def forecast(
     
     logger.info(f"Forecast completed successfully for model: {model_name}")
     
-    return JSONResponse(forecast_result)
+    with stage_timer("render"):
+        response = json_response(forecast_result)
+    return response
+
+
+@router.get("/api/model-cache/stats")
+async def get_model_cache_stats():
+    """API endpoint reporting hit/miss counters of the loaded model cache"""
+    return JSONResponse(ModelService.get_model_cache_stats())
+
+@router.get("/api/forecast-cache/stats")
+async def get_forecast_cache_stats():
+    """API endpoint reporting hit/miss counters of the day forecast cache"""
+    return JSONResponse(ModelService.get_forecast_cache_stats())
+
+@router.get("/api/feature-cache/stats")
+async def get_feature_cache_stats():
+    """API endpoint reporting reuse of shared feature matrices"""
+    return JSONResponse(ModelService.get_feature_cache_stats())
+
+@router.get("/api/ensemble-weights/stats")
+async def get_ensemble_weight_cache_stats():
+    """API endpoint reporting hit/miss counters of the cached model errors behind the ensemble weights"""
+    return JSONResponse(ModelService.get_ensemble_weight_cache_stats())
+
+@router.get("/api/single-flight/stats")
+async def get_single_flight_stats():
+    """API endpoint reporting the forecasts and training runs shared by concurrent identical requests"""
+    return JSONResponse(ModelService.get_single_flight_stats())
 
 
 @router.get("/api/weather")
-async def get_weather(date: str, hour: int):
-    """API endpoint for fetching weather data"""
-    # Mock weather data
-    weather_data = {
-        "temp": 25.5,
-        "rhum": 65.0,
-        "prcp": 0.0,
-        "wdir": 180.0,
-        "wspd": 5.5,
-        "pres": 1013.25,
-        "cldc": 50.0,
-        "coco": 2.0
-    }
+async def get_weather(date: List[str] = Query(default=[]), hour: Optional[int] = None):
+    """
+    API endpoint for fetching weather data from the master data
     
-    return JSONResponse(weather_data)
+    With a single date and an hour the weather of that hour is returned. Otherwise every
+    date (repeat the date parameter) gets an entry in 'days' with one list per parameter,
+    covering the given hour or all 24 hours.
+    """
+    if hour is not None and not 0 <= hour <= 23:
+        raise HTTPException(status_code=400, detail=f"hour must be between 0 and 23, got {hour}")
+    hours = list(range(24)) if hour is None else [hour]
+    
+    if not date:
+        raise HTTPException(status_code=400, detail="At least one date is required")
+    try:
+        values = master_data_store.day_index().values(date, WEATHER_COLUMNS, hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {e}")
+    
+    weather_lists = {column: nullable_lists(values[column]) for column in WEATHER_COLUMNS}
+    if len(date) == 1 and hour is not None:
+        return json_response({column: weather_lists[column][0][0] for column in WEATHER_COLUMNS})
+    
+    days = [
+        {"date": day, "hours": hours, **{column: weather_lists[column][position] for column in WEATHER_COLUMNS}}
+        for position, day in enumerate(date)
+    ]
+    return json_response({"days": days})
 
 
 @router.get("/api/forecast-chart")
-async def get_forecast_chart(date: str, hour: int):
-    """API endpoint for fetching forecast chart data"""
-    # Mock chart data - 24 hours of forecasted values
-    hours = list(range(24))
-    xgb_values = [1200 + i * 10 + (i % 3) * 5 for i in hours]
-    lgb_values = [1205 + i * 10 + (i % 4) * 3 for i in hours]
-    ensemble_values = [(xgb + lgb) / 2 for xgb, lgb in zip(xgb_values, lgb_values)]
+async def get_forecast_chart(date: List[str] = Query(default=[])):
+    """API endpoint for fetching the actual and forecasted load of the 24 hours of one or more dates for the forecast chart"""
+    if not date:
+        raise HTTPException(status_code=400, detail="At least one date is required")
+    try:
+        values = master_data_store.day_index().values(date, ["load", "forecasted_load"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {e}")
     
-    chart_data = {
-        "hours": hours,
-        "xgboost": xgb_values,
-        "lightgbm": lgb_values,
-        "ensemble": ensemble_values
-    }
+    hours = list(range(24))
+    days = [
+        {"date": day, "hours": hours, "actual": actual, "forecasted": forecasted}
+        for day, actual, forecasted in zip(
+            date, nullable_lists(values["load"]), nullable_lists(values["forecasted_load"])
+        )
+    ]
     
-    return JSONResponse(chart_data)
-
+    return json_response(days[0] if len(days) == 1 else {"days": days})
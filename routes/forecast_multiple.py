@@ -1,16 +1,21 @@
 """Forecast Multiple Models routes"""
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Request, Form
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from typing import List
+from typing import Any, AsyncIterator, Dict, List
 import logging
 from services.model_service import ModelService
+from utils.json_response import dumps, json_response
+from utils.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
+# Streaming formats of /api/forecast-multiple
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
 
 @router.get("/forecast-multiple", response_class=HTMLResponse)
 async def forecast_multiple_page(request: Request):
@@ -31,18 +36,102 @@ async def forecast_multiple(
     model_names: str = Form(...),  # Comma-separated list of model names
     holiday: int = Form(...),
     holiday_type: int = Form(...),
-    nation_event: int = Form(...)
+    nation_event: int = Form(...),
+    parallel: bool = Form(False),  # Run the models in the forecast process pool
+    stream: str = Form(""),  # 'ndjson' or 'sse' to send each model's result as soon as it is done
+    columnar: bool = Form(False)  # Timestamps once and one list of values per model instead of per-hour records
 ):
     """API endpoint for forecasting from multiple models"""
     # Parse the comma-separated model names
     model_names_list = [name.strip() for name in model_names.split(',') if name.strip()]
     
-    logger.info(f"Forecast Multiple request - Models: {model_names_list}, Date: {date}")
+    logger.info(f"Forecast Multiple request - Models: {model_names_list}, Date: {date}, Parallel: {parallel}, Stream: {stream or 'no'}")
     logger.debug(f"Holiday: {holiday}, Holiday Type: {holiday_type}, Nation Event: {nation_event}")
 
+    if stream:
+        if stream not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unknown stream format: {stream}, use one of {list(STREAM_MEDIA_TYPES)}")
+        events = ModelService.stream_forecasts_from_multiple_models(model_names_list, date, parallel=parallel, columnar=columnar)
+        # Take the first event before responding, so a bad date fails the request instead of the stream
+        first_event = await events.__anext__()
+        return StreamingResponse(
+            _encode_events(first_event, events, stream),
+            media_type=STREAM_MEDIA_TYPES[stream],
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     # Get forecast results from multiple models
-    forecast_result = await ModelService.forecast_from_mulitple_models(model_names_list, date)
+    forecast_result = await ModelService.forecast_from_mulitple_models(model_names_list, date, parallel=parallel, columnar=columnar)
     
     logger.info(f"Forecast completed successfully for {len(model_names_list)} models")
     
-    return JSONResponse(forecast_result)
+    with stage_timer("render"):
+        response = json_response(forecast_result)
+    return response
+
+
+@router.post("/api/forecast-ensemble")
+async def forecast_ensemble(
+    date: str = Form(...),
+    model_names: str = Form(...),  # Comma-separated list of model names
+    weighting: str = Form("error"),  # 'equal', or 'error' to weight the models by their recent error
+    parallel: bool = Form(False)  # Run the models in the forecast process pool
+):
+    """API endpoint for the quantile forecasts of multiple models and their weighted ensemble"""
+    model_names_list = [name.strip() for name in model_names.split(',') if name.strip()]
+    if not model_names_list:
+        raise HTTPException(status_code=400, detail="At least one model name is required")
+    
+    logger.info(f"Forecast Ensemble request - Models: {model_names_list}, Date: {date}, Weighting: {weighting}")
+    
+    try:
+        forecast_result = await ModelService.forecast_ensemble(model_names_list, date, weighting=weighting, parallel=parallel)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {date} is outside the master data")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    with stage_timer("render"):
+        response = json_response(forecast_result)
+    return response
+
+
+@router.post("/api/forecast-range")
+async def forecast_range(
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+    model_names: str = Form(...)  # Comma-separated list of model names
+):
+    """API endpoint for forecasting every day of a date range from multiple models"""
+    model_names_list = [name.strip() for name in model_names.split(',') if name.strip()]
+    
+    logger.info(f"Forecast Range request - Models: {model_names_list}, From: {start_date}, To: {end_date}")
+    
+    try:
+        forecast_result = await ModelService.forecast_date_range(model_names_list, start_date, end_date)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid date range: dates are outside the master data")
+    except ValueError as e:
+        # Malformed dates, or a reversed or too long range
+        raise HTTPException(status_code=400, detail=f"Invalid date range: {e}")
+    
+    logger.info(f"Range forecast completed for {len(model_names_list)} models")
+    
+    with stage_timer("render"):
+        response = json_response(forecast_result)
+    return response
+
+
+async def _encode_events(first_event: Dict[str, Any], events: AsyncIterator[Dict[str, Any]], stream: str) -> AsyncIterator[str]:
+    """Serialize forecast events as NDJSON lines or Server-Sent Events"""
+    yield _encode_event(first_event, stream)
+    async for event in events:
+        yield _encode_event(event, stream)
+
+
+def _encode_event(event: Dict[str, Any], stream: str) -> str:
+    """One event as an NDJSON line, or an SSE message named after the event type"""
+    data = dumps(event)
+    if stream == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
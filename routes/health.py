@@ -0,0 +1,21 @@
+"""Health routes"""
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import logging
+from services.warmup import warmup
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/api/health")
+async def health():
+    """Liveness check, answers as soon as the server accepts requests"""
+    return JSONResponse({"status": "ok"})
+
+
+@router.get("/api/ready")
+async def ready():
+    """Readiness check: 200 once the startup warm-up is done, 503 with its progress before that"""
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
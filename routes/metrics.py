@@ -0,0 +1,17 @@
+"""Metrics routes"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+import logging
+from utils.metrics import metrics_payload
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint with per-stage and per-request duration histograms"""
+    payload, content_type = metrics_payload()
+    # content_type already includes the charset, which media_type would append a second time
+    return Response(payload, headers={"Content-Type": content_type})
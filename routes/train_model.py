@@ -1,10 +1,15 @@
 """Train Model routes"""
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
+import asyncio
 import json
 import logging
-from services.model_service import ModelService
+from typing import Optional
+from services.hyperparameter_sweep import sweep_runner
+from services.retraining_scheduler import retraining_scheduler
+from services.training_queue import training_queue
+from utils.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
@@ -24,25 +29,123 @@ async def train_model(
     custom_name: str = Form(...),
     training_data_start_date: str = Form(...),
     training_data_end_date: str = Form(...),
-    hyperparams: str = Form(...)
+    hyperparams: str = Form(...),
+    mode: str = Form("full")  # 'incremental' continues the boosting of the existing model
 ):
-    """API endpoint for training model"""
+    """API endpoint for submitting a training job to the background queue"""
     hyperparams_dict = json.loads(hyperparams)
     logger.debug(f"Training request received - Model: {model}, Custom Name: {custom_name}")
     logger.debug(f"Training data period: {training_data_start_date} to {training_data_end_date}")
     logger.debug(f"Hyperparameters: {hyperparams_dict}")
 
-    await ModelService.train_model(model, custom_name, training_data_start_date, training_data_end_date, hyperparams_dict)
+    try:
+        with stage_timer("submit", custom_name):
+            job = training_queue.submit(model, custom_name, training_data_start_date, training_data_end_date, hyperparams_dict, mode=mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    logger.info(f"Training initiated successfully for {model} model with name '{custom_name}' using data from {training_data_start_date} to {training_data_end_date}")
+    if job["coalesced"]:
+        # A double submit: answer with the identical job that is already queued or running
+        message = f"Identical training of '{custom_name}' is already {job['status']}"
+    else:
+        message = f"Training queued for {model} model"
+        logger.info(f"Training job {job['job_id']} queued for {model} model with name '{custom_name}' using data from {training_data_start_date} to {training_data_end_date}")
     
     return JSONResponse({
         "status": "success",
-        "message": f"Training initiated for {model} model",
+        "message": message,
+        "job_id": job["job_id"],
+        "queue_position": job["queue_position"],
+        "coalesced": job["coalesced"],
         "model": model,
         "custom_name": custom_name,
         "training_data_start_date": training_data_start_date,
         "training_data_end_date": training_data_end_date,
-        "hyperparameters": hyperparams_dict
+        "hyperparameters": hyperparams_dict,
+        "mode": mode
     })
 
+
+
+@router.get("/api/train/jobs")
+async def list_training_jobs(limit: int = 50):
+    """API endpoint listing recent training jobs, newest first"""
+    return JSONResponse({"jobs": training_queue.list_jobs(limit)})
+
+
+@router.get("/api/train/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    """API endpoint reporting queue position, progress, duration and metrics of a training job"""
+    job = training_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job not found: {job_id}")
+    return JSONResponse(job)
+
+
+@router.post("/api/train/sweep")
+async def submit_sweep(
+    model: str = Form(...),
+    name_prefix: str = Form(...),  # Trials are saved as <name_prefix>_<trial>
+    training_data_start_date: str = Form(...),
+    training_data_end_date: str = Form(...),
+    search: str = Form("grid"),  # 'grid' or 'random'
+    space: str = Form(...),  # JSON: hyperparameter -> list of values, or {"min", "max", "log"} for random search
+    n_trials: Optional[int] = Form(None),
+    seed: Optional[int] = Form(None),
+    metric: str = Form("rmse")
+):
+    """API endpoint for queueing a grid or random hyperparameter sweep"""
+    try:
+        with stage_timer("submit"):
+            sweep = sweep_runner.submit(
+                model, name_prefix, training_data_start_date, training_data_end_date,
+                search, json.loads(space), n_trials=n_trials, seed=seed, metric=metric,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    logger.info(f"Sweep {sweep['sweep_id']} queued with {len(sweep['trials'])} {model} trials")
+    
+    return JSONResponse(sweep)
+
+
+@router.get("/api/train/sweeps")
+async def list_sweeps(limit: int = 20):
+    """API endpoint listing recent sweeps, newest first"""
+    return JSONResponse({"sweeps": sweep_runner.list_sweeps(limit)})
+
+
+@router.get("/api/train/sweeps/{sweep_id}")
+async def get_sweep(sweep_id: str):
+    """API endpoint reporting the trials of a sweep and its leaderboard ranked by validation error"""
+    sweep = sweep_runner.get_sweep(sweep_id)
+    if sweep is None:
+        raise HTTPException(status_code=404, detail=f"Sweep not found: {sweep_id}")
+    return JSONResponse(sweep)
+
+
+@router.get("/api/retraining")
+async def get_retraining_status(limit: int = 10):
+    """API endpoint reporting the drift check settings and the decisions of the recent checks"""
+    return JSONResponse(retraining_scheduler.status(limit))
+
+
+@router.post("/api/retraining/check")
+async def run_retraining_check():
+    """API endpoint running a drift check now, queueing retrains for the drifting models"""
+    return JSONResponse(await retraining_scheduler.check())
+
+
+@router.post("/api/models/{custom_name}/rollback")
+async def rollback_model(custom_name: str):
+    """API endpoint restoring the previous trained version of a model"""
+    # The model service pulls in openstef, only needed once a model is rolled back
+    from services.model_service import rollback_model as rollback
+
+    try:
+        result = await asyncio.to_thread(rollback, custom_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Model not found: {custom_name}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({"status": "success", **result})
@@ -1,5 +1,11 @@
 """Services package"""
-from .model_service import ModelService
 
 __all__ = ["ModelService"]
 
+
+def __getattr__(name):
+    # Importing a service module should not pull in the model service and everything it imports
+    if name == "ModelService":
+        from .model_service import ModelService
+        return ModelService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
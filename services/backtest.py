@@ -0,0 +1,278 @@
+"""Rolling-origin backtests of trained models, run in a process pool and saved as columnar files"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from services.day_index import nullable_lists
+from services.master_data import master_data_store
+from services.worker_pool import discard_executor, get_executor
+from utils.dateutils import create_utc_datetime
+from utils.shared_frame import SharedFrame, publish_frame, read_shared_frame
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+BACKTEST_DIR = os.getenv("BACKTEST_DIR", "./backtests")
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+# Days forecast by one pool task, the unit work is spread in
+BACKTEST_CHUNK_DAYS = int(os.getenv("BACKTEST_CHUNK_DAYS", "30"))
+BACKTEST_MAX_DAYS = int(os.getenv("BACKTEST_MAX_DAYS", "1096"))
+
+# Source name of the forecasted_load column in the metrics
+BASELINE_NAME = "forecasted_load"
+# Columns of a result file before the one forecast column per model
+_DATA_COLUMNS = ["load", "forecasted_load", "is_holiday"]
+_FORECAST_PREFIX = "forecast:"
+_METADATA_KEY = b"backtest"
+_DAY_TYPES = {0: "working_day", 1: "holiday"}
+
+
+async def run_backtest(custom_names: List[str], start_date: str, end_date: str, chunk_days: int = BACKTEST_CHUNK_DAYS, workers: int = BACKTEST_WORKERS) -> Dict[str, Any]:
+    """
+    Forecast every day of a date range with every model, as the forecast endpoints would, and save the result
+
+    Each day is forecast with its own load unknown (a rolling origin at the start of
+    the day). The range is cut into chunks of chunk_days; every (model, chunk) pair is
+    one task of the backtest process pool, which reads the master data from one
+    read-only shared memory copy.
+
+    Args:
+        custom_names: List of trained model names
+        start_date: First date in format 'YYYY-MM-DD'
+        end_date: Last date (inclusive) in format 'YYYY-MM-DD'
+        chunk_days: Days per pool task
+        workers: Processes of the pool when it is created
+
+    Returns:
+        Metadata and metrics of the saved backtest, see load_backtest()
+    """
+    days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    if days < 1:
+        raise ValueError("end_date must not be before start_date")
+    if days > BACKTEST_MAX_DAYS:
+        raise ValueError(f"At most {BACKTEST_MAX_DAYS} days can be backtested at once")
+    if not custom_names:
+        raise ValueError("At least one model is required")
+    if chunk_days < 1:
+        raise ValueError("chunk_days must be at least 1")
+
+    start = time.perf_counter()
+    data_version, input_data = master_data_store.snapshot()
+    # The hour before the first day must be known, like for the forecast endpoints
+    first_forecast_index = input_data.index.get_loc(create_utc_datetime(start_date, 0) - timedelta(hours=1)) + 1
+    forecast_end_index = input_data.index.get_loc(create_utc_datetime(end_date, 23)) + 1
+    chunks = _chunks(first_forecast_index, forecast_end_index, chunk_days)
+    logger.info(f"Backtest of {custom_names} from {start_date} to {end_date}: {len(custom_names) * len(chunks)} tasks")
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor("backtest", workers)
+    with publish_frame(input_data) as shared:
+        tasks = [(custom_name, chunk) for custom_name in custom_names for chunk in chunks]
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, _backtest_chunk, custom_name, shared, *chunk) for custom_name, chunk in tasks),
+            return_exceptions=True,
+        )
+
+    forecast_index = input_data.index[first_forecast_index:forecast_end_index]
+    forecasts = {custom_name: np.full(len(forecast_index), np.nan) for custom_name in custom_names}
+    errors: Dict[str, str] = {}
+    model_versions: Dict[str, Any] = {}
+    for (custom_name, (chunk_start, chunk_end)), result in zip(tasks, results):
+        if isinstance(result, Exception):
+            if isinstance(result, BrokenProcessPool):
+                discard_executor("backtest")
+            logger.error(f"Backtest of {custom_name} failed for rows {chunk_start}-{chunk_end}: {result!r}")
+            errors.setdefault(custom_name, str(result) or type(result).__name__)
+            continue
+        values, model_version = result
+        forecasts[custom_name][chunk_start - first_forecast_index:chunk_end - first_forecast_index] = values
+        model_versions[custom_name] = model_version
+
+    metadata = {
+        "backtest_id": uuid.uuid4().hex,
+        "models": [custom_name for custom_name in custom_names if custom_name not in errors],
+        "start_date": start_date,
+        "end_date": end_date,
+        "chunk_days": chunk_days,
+        "data_version": data_version,
+        "model_versions": model_versions,
+        "errors": errors,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "seconds": time.perf_counter() - start,
+    }
+    frame = input_data[_DATA_COLUMNS].iloc[first_forecast_index:forecast_end_index].copy()
+    for custom_name in metadata["models"]:
+        frame[f"{_FORECAST_PREFIX}{custom_name}"] = forecasts[custom_name]
+    path = save_backtest(frame, metadata)
+    logger.info(f"Backtest {metadata['backtest_id']} finished in {metadata['seconds']:.2f}s, saved to {path}")
+    # Scored from the file, so the metrics are the same as when it is read again
+    return load_backtest(metadata["backtest_id"], directory=os.path.dirname(path))
+
+
+def save_backtest(frame: pd.DataFrame, metadata: Dict[str, Any], directory: str = BACKTEST_DIR) -> str:
+    """
+    Write a backtest as a compressed Arrow file with its metadata in the schema
+
+    Args:
+        frame: Actual load, baseline, holiday flag and one forecast column per model, indexed by timestamp
+        metadata: JSON-serializable description stored with the data
+        directory: Directory of the backtest files
+
+    Returns:
+        Path of the file
+    """
+    os.makedirs(directory, exist_ok=True)
+    utc_index = frame.index.tz_convert("UTC")
+    columns = {"timestamp": pa.array(utc_index, type=pa.timestamp("s", tz="UTC"))}
+    for column in frame.columns:
+        values = frame[column].to_numpy(dtype=float)
+        if column == "is_holiday":
+            columns[column] = pa.array(np.nan_to_num(values).astype(np.int8), mask=np.isnan(values))
+        else:
+            columns[column] = pa.array(values.astype(np.float32))
+    table = pa.table(columns).replace_schema_metadata({_METADATA_KEY: json.dumps(metadata).encode()})
+
+    path = os.path.join(directory, f"{metadata['backtest_id']}.arrow")
+    tmp_path = f"{path}.tmp"
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_backtest(backtest_id: str, series: bool = False, directory: str = BACKTEST_DIR) -> Optional[Dict[str, Any]]:
+    """
+    Read a saved backtest and compute its metrics, without forecasting again
+
+    Args:
+        backtest_id: ID returned by run_backtest
+        series: Also return the hourly columns
+        directory: Directory of the backtest files
+
+    Returns:
+        Metadata with 'metrics' (by model, by hour of day and by day type) and, if series,
+        'timestamps', 'actual', 'baseline' and 'forecasts'; None if there is no such backtest
+    """
+    path = os.path.join(directory, f"{os.path.basename(backtest_id)}.arrow")
+    if not os.path.exists(path):
+        return None
+    metadata, frame = _read_backtest(path)
+    result = {**metadata, "path": path, "metrics": backtest_metrics(frame)}
+    if series:
+        result.update(
+            timestamps=frame.index.strftime('%Y-%m-%dT%H:%M:%S+06:00').tolist(),
+            actual=nullable_lists(frame["load"]),
+            baseline=nullable_lists(frame["forecasted_load"]),
+            forecasts={
+                column[len(_FORECAST_PREFIX):]: nullable_lists(frame[column])
+                for column in frame.columns if column.startswith(_FORECAST_PREFIX)
+            },
+        )
+    return result
+
+
+def list_backtests(directory: str = BACKTEST_DIR) -> List[Dict[str, Any]]:
+    """Metadata of the saved backtests, newest first, read from the file schemas only"""
+    backtests = []
+    for path in glob.glob(os.path.join(directory, "*.arrow")):
+        with pa.memory_map(path, "r") as source:
+            schema = pa.ipc.open_file(source).schema
+        backtests.append({**json.loads(schema.metadata[_METADATA_KEY]), "path": path, "bytes": os.path.getsize(path)})
+    return sorted(backtests, key=lambda backtest: backtest["created_at"], reverse=True)
+
+
+def backtest_metrics(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    MAE, RMSE and MAPE of every model and of the forecasted_load baseline
+
+    Every source is scored on the hours where both it and the actual load are known;
+    MAPE leaves out hours with zero load. Groups are summed with np.bincount over
+    all hours at once.
+
+    Args:
+        frame: Backtest frame, see save_backtest()
+
+    Returns:
+        Dict with 'by_model' (source -> metrics), 'by_hour' (source -> list of 24 metrics,
+        UTC hours like the forecast timestamps) and 'by_day_type' (source -> working_day/holiday -> metrics)
+    """
+    actual = frame["load"].to_numpy(dtype=float)
+    hours = frame.index.tz_convert("UTC").hour.to_numpy()
+    day_types = np.nan_to_num(frame["is_holiday"].to_numpy(dtype=float)).astype(int).clip(0, 1)
+    sources = {BASELINE_NAME: frame["forecasted_load"]}
+    sources.update({
+        column[len(_FORECAST_PREFIX):]: frame[column]
+        for column in frame.columns if column.startswith(_FORECAST_PREFIX)
+    })
+
+    metrics: Dict[str, Any] = {"by_model": {}, "by_hour": {}, "by_day_type": {}}
+    for name, forecast in sources.items():
+        sums = _error_sums(actual, forecast.to_numpy(dtype=float))
+        metrics["by_model"][name] = _metrics(*(np.atleast_1d(total.sum()) for total in sums))[0]
+        metrics["by_hour"][name] = _metrics(*(np.bincount(hours, weights=total, minlength=24) for total in sums))
+        by_type = _metrics(*(np.bincount(day_types, weights=total, minlength=2) for total in sums))
+        metrics["by_day_type"][name] = {_DAY_TYPES[code]: by_type[code] for code in _DAY_TYPES}
+    return metrics
+
+
+def _backtest_chunk(custom_name: str, shared: SharedFrame, first_forecast_index: int, forecast_end_index: int) -> Tuple[np.ndarray, Any]:
+    """Process pool entry point: forecast the days of one chunk with one model"""
+    # Imported here so the backtest module stays light for the web process
+    from services.model_service import _forecast_date_range, _load_model
+
+    input_data = read_shared_frame(shared)
+    forecast = _forecast_date_range(custom_name, input_data, first_forecast_index, forecast_end_index)
+    values = forecast["forecast"].reindex(input_data.index[first_forecast_index:forecast_end_index]).to_numpy(dtype=float)
+    return values, _load_model(custom_name).version
+
+
+def _chunks(first_forecast_index: int, forecast_end_index: int, chunk_days: int) -> List[Tuple[int, int]]:
+    """Row ranges of chunk_days whole days each"""
+    size = 24 * chunk_days
+    return [(start, min(start + size, forecast_end_index)) for start in range(first_forecast_index, forecast_end_index, size)]
+
+
+def _read_backtest(path: str) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """Metadata and frame of a backtest file"""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = json.loads(table.schema.metadata[_METADATA_KEY])
+    frame = table.drop(["timestamp"]).to_pandas()
+    frame.index = pd.DatetimeIndex(table.column("timestamp").to_pandas())
+    return metadata, frame
+
+
+def _error_sums(actual: np.ndarray, forecast: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Per-hour count, absolute and squared error, and the same for the percentage error, zero where not scored"""
+    valid = ~np.isnan(actual) & ~np.isnan(forecast)
+    error = np.where(valid, forecast - actual, 0.0)
+    percent_valid = valid & (actual != 0)
+    percent_error = np.divide(np.abs(error), np.abs(actual), out=np.zeros_like(error), where=percent_valid)
+    return valid.astype(float), np.abs(error), error ** 2, percent_valid.astype(float), percent_error
+
+
+def _metrics(n: np.ndarray, abs_err: np.ndarray, sq_err: np.ndarray, n_percent: np.ndarray, percent_err: np.ndarray) -> List[Dict[str, Any]]:
+    """Metrics of every group from its summed errors, None for groups without hours"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mae, rmse, mape = abs_err / n, np.sqrt(sq_err / n), 100 * percent_err / n_percent
+    return [
+        {
+            "hours": int(n[group]),
+            "mae": float(mae[group]) if n[group] else None,
+            "rmse": float(rmse[group]) if n[group] else None,
+            "mape": float(mape[group]) if n_percent[group] else None,
+        }
+        for group in range(len(n))
+    ]
@@ -0,0 +1,60 @@
+"""Forecast many consecutive days of one model in a single feature-engineering and prediction pass"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from services.feature_cache import build_features
+from services.model_cache import LoadedModel, feature_lag
+from utils.metrics import stage_timer
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+
+def supports_batch(loaded: LoadedModel) -> bool:
+    """
+    Whether a model's day-by-day forecasts can be reproduced from one feature pass
+
+    Lag features can be masked per day after the fact. Rolling load features and
+    custom data preparation cannot, those models are forecast one day at a time.
+    """
+    if loaded.pj.data_prep_class:
+        return False
+    return not any(name.startswith("rolling_") for name in loaded.model.feature_names)
+
+
+def forecast_days(loaded: LoadedModel, window: pd.DataFrame, forecast_index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Forecast several whole days at once, as if each day had been forecast on its own
+
+    Features are computed once over the unmasked window. Afterwards, every lag feature
+    that points into the same (UTC) day as its row is cleared, which is exactly what
+    clearing that day's load before running the pipeline would have produced.
+
+    Args:
+        loaded: Model to forecast with, see supports_batch()
+        window: Master data covering the model's lookback before the first day up to the last forecast hour
+        forecast_index: Hours to forecast, whole UTC days
+
+    Returns:
+        DataFrame with a 'forecast' column indexed by forecast_index
+    """
+    with stage_timer("features"):
+        data_with_features = build_features(loaded, window)
+    forecast_input = data_with_features.loc[forecast_index].drop(columns="load")
+
+    # Time since the start of the row's day; a lag up to this long refers to a load unknown on that day
+    utc_index = forecast_index.tz_convert("UTC")
+    offset = (utc_index - utc_index.floor("D")).to_numpy()
+    for column in forecast_input.columns:
+        lag = feature_lag(column)
+        if lag is not None:
+            unknown = offset >= np.timedelta64(lag)
+            if unknown.any():
+                forecast_input.loc[unknown, column] = np.nan
+
+    with stage_timer("predict"):
+        forecast = pd.DataFrame(index=forecast_input.index, data={"forecast": loaded.model.predict(forecast_input)})
+    logger.debug(f"Batch forecast of {len(forecast)} hours from a window of {len(window)} rows")
+    return forecast
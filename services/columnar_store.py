@@ -0,0 +1,270 @@
+"""Typed columnar (Arrow IPC) storage for the master data"""
+import glob
+import logging
+import os
+from datetime import timedelta, timezone
+from typing import List
+
+import pandas as pd
+import pyarrow as pa
+
+from services.master_data import MASTER_DATA_DATASET_PATH, read_master_data_csv
+from utils.file_lock import fsync_directory
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+INDEX_COLUMN = "date_time"
+PART_PATTERN = "part-*.arrow"
+UTC_OFFSET_METADATA_KEY = b"utc_offset_minutes"
+
+# Listing and reading the parts is retried when a concurrent replace_dataset() removes one
+READ_ATTEMPTS = 3
+
+# Declared dtypes for the known master data columns, anything else is stored as float64
+COLUMN_TYPES = {
+    "load": pa.float64(),
+    # Small integer codes, float so that missing days stay NaN like in the CSV
+    "is_holiday": pa.float32(),
+    "holiday_type": pa.float32(),
+    "national_event_type": pa.float32(),
+    "temp": pa.float64(),
+    "dwpt": pa.float64(),
+    "rhum": pa.float64(),
+    "prcp": pa.float64(),
+    "wdir": pa.float64(),
+    "wspd": pa.float64(),
+    "pres": pa.float64(),
+    "coco": pa.float64(),
+    "forecasted_load": pa.float64(),
+}
+
+
+def frame_to_table(frame: pd.DataFrame) -> pa.Table:
+    """
+    Convert a master data frame into an Arrow table with the declared schema
+
+    Args:
+        frame: DataFrame indexed by tz-aware timestamps
+
+    Returns:
+        Arrow table with a UTC int64 (ns) timestamp column followed by the typed data columns
+    """
+    if not isinstance(frame.index, pd.DatetimeIndex) or frame.index.tz is None:
+        raise ValueError("Master data must be indexed by tz-aware timestamps")
+
+    offset = frame.index[0].utcoffset() if len(frame) else timedelta(0)
+    utc_ns = frame.index.tz_convert("UTC").as_unit("ns").asi8
+
+    arrays = [pa.array(utc_ns, type=pa.int64())]
+    fields = [pa.field(INDEX_COLUMN, pa.int64(), nullable=False)]
+    for column in frame.columns:
+        column_type = COLUMN_TYPES.get(column, pa.float64())
+        values = frame[column].to_numpy()
+        # NaN stays NaN instead of becoming a null, so reads can stay zero-copy
+        arrays.append(pa.array(values.astype(column_type.to_pandas_dtype()), type=column_type))
+        fields.append(pa.field(column, column_type))
+
+    metadata = {UTC_OFFSET_METADATA_KEY: str(int(offset.total_seconds() // 60)).encode()}
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Convert an Arrow table written by frame_to_table back into a master data frame
+
+    Args:
+        table: Arrow table with the int64 timestamp column
+
+    Returns:
+        DataFrame indexed by timestamps in the original UTC offset
+    """
+    offset_minutes = int((table.schema.metadata or {}).get(UTC_OFFSET_METADATA_KEY, b"0"))
+    utc_ns = table.column(INDEX_COLUMN).to_numpy()
+    index = pd.DatetimeIndex(utc_ns.view("datetime64[ns]")).tz_localize("UTC")
+    index = index.tz_convert(timezone(timedelta(minutes=offset_minutes)))
+    index.name = INDEX_COLUMN
+
+    # split_blocks avoids consolidating columns, so single-chunk numeric columns stay zero-copy
+    frame = table.drop_columns([INDEX_COLUMN]).to_pandas(split_blocks=True)
+    frame.index = index
+    return frame
+
+
+def list_parts(dataset_path: str = MASTER_DATA_DATASET_PATH) -> List[str]:
+    """List the part files of a dataset in append order"""
+    return sorted(glob.glob(os.path.join(dataset_path, PART_PATTERN)))
+
+
+def read_dataset(dataset_path: str = MASTER_DATA_DATASET_PATH) -> pd.DataFrame:
+    """
+    Memory-map every part of the dataset and return it as one frame
+
+    Args:
+        dataset_path: Directory holding the part files
+
+    Returns:
+        DataFrame indexed by timestamp
+    """
+    for attempt in range(READ_ATTEMPTS):
+        parts = list_parts(dataset_path)
+        if not parts:
+            raise FileNotFoundError(f"No part files found in {dataset_path}")
+        try:
+            tables = []
+            for part in parts:
+                with pa.memory_map(part, "r") as source:
+                    tables.append(pa.ipc.open_file(source).read_all())
+            break
+        except FileNotFoundError:
+            # replace_dataset() removed a superseded part after it was listed, list again
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+    table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+    return table_to_frame(table)
+
+
+def read_file(path: str) -> pd.DataFrame:
+    """
+    Memory-map a single Arrow file written by write_file
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        DataFrame indexed by timestamp, numeric columns backed by the mapping
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table_to_frame(table)
+
+
+def write_file(frame: pd.DataFrame, path: str) -> None:
+    """
+    Atomically write a master data frame as a single memory-mappable Arrow file
+
+    Args:
+        frame: DataFrame indexed by tz-aware timestamps
+        path: Path of the file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _write_part(frame_to_table(frame), path)
+
+
+def ingest_csv(csv_path: str, dataset_path: str = MASTER_DATA_DATASET_PATH) -> int:
+    """
+    Convert the master data CSV into a columnar dataset, replacing any existing parts
+
+    Args:
+        csv_path: Path of the source CSV
+        dataset_path: Directory to write the dataset to
+
+    Returns:
+        Number of rows written
+    """
+    frame = read_master_data_csv(csv_path)
+    os.makedirs(dataset_path, exist_ok=True)
+    old_parts = list_parts(dataset_path)
+
+    _write_part(frame_to_table(frame), os.path.join(dataset_path, "part-00000.arrow"))
+    for part in old_parts:
+        if os.path.basename(part) != "part-00000.arrow":
+            os.remove(part)
+
+    logger.info(f"Ingested {len(frame)} rows from {csv_path} into {dataset_path}")
+    return len(frame)
+
+
+def append_rows(frame: pd.DataFrame, dataset_path: str = MASTER_DATA_DATASET_PATH) -> int:
+    """
+    Append hours newer than the dataset's last timestamp as a new part file
+
+    Existing parts are never rewritten; rows at or before the current end are ignored.
+
+    Args:
+        frame: DataFrame indexed by tz-aware timestamps with the master data columns
+        dataset_path: Directory holding the part files
+
+    Returns:
+        Number of rows appended
+    """
+    parts = list_parts(dataset_path)
+    if not parts:
+        raise FileNotFoundError(f"No part files found in {dataset_path}, run the ingest first")
+
+    with pa.memory_map(parts[-1], "r") as source:
+        last_table = pa.ipc.open_file(source).read_all()
+        schema = last_table.schema
+        last_ns = int(last_table.column(INDEX_COLUMN).to_numpy().max())
+
+    frame = frame[~frame.index.duplicated(keep='first')].sort_index()
+    new_rows = frame[frame.index.tz_convert("UTC").as_unit("ns").asi8 > last_ns]
+    if new_rows.empty:
+        logger.info(f"No new hours to append to {dataset_path}")
+        return 0
+
+    missing = [name for name in schema.names if name != INDEX_COLUMN and name not in new_rows.columns]
+    if missing:
+        raise ValueError(f"Rows to append are missing columns: {missing}")
+    table = frame_to_table(new_rows[[name for name in schema.names if name != INDEX_COLUMN]])
+
+    next_number = int(os.path.basename(parts[-1])[len("part-"):-len(".arrow")]) + 1
+    _write_part(table.cast(schema), os.path.join(dataset_path, f"part-{next_number:05d}.arrow"))
+
+    logger.info(f"Appended {len(new_rows)} rows to {dataset_path}")
+    return len(new_rows)
+
+
+def replace_dataset(frame: pd.DataFrame, dataset_path: str = MASTER_DATA_DATASET_PATH) -> int:
+    """
+    Replace the dataset with the rows of frame, e.g. after compacting edits into it
+
+    The rows are written as a part numbered after all existing ones before the
+    old parts are removed. Readers keep the last part's row for a timestamp, so
+    they see either the old or the new data at any point in between.
+
+    Args:
+        frame: Complete master data indexed by tz-aware timestamps
+        dataset_path: Directory holding the part files
+
+    Returns:
+        Number of rows written
+    """
+    os.makedirs(dataset_path, exist_ok=True)
+    old_parts = list_parts(dataset_path)
+    next_number = int(os.path.basename(old_parts[-1])[len("part-"):-len(".arrow")]) + 1 if old_parts else 0
+    _write_part(frame_to_table(frame), os.path.join(dataset_path, f"part-{next_number:05d}.arrow"))
+    for part in old_parts:
+        os.remove(part)
+
+    logger.info(f"Replaced {dataset_path} with {len(frame)} rows")
+    return len(frame)
+
+
+def export_csv(csv_path: str, dataset_path: str = MASTER_DATA_DATASET_PATH) -> int:
+    """
+    Export the dataset back to the CSV layout of master_data_with_forecasted.csv
+
+    Args:
+        csv_path: Path of the CSV to write
+        dataset_path: Directory holding the part files
+
+    Returns:
+        Number of rows written
+    """
+    frame = read_dataset(dataset_path)
+    frame.to_csv(csv_path)
+    logger.info(f"Exported {len(frame)} rows from {dataset_path} to {csv_path}")
+    return len(frame)
+
+
+def _write_part(table: pa.Table, path: str) -> None:
+    """Write an uncompressed Arrow IPC file atomically and durably, so it can be memory-mapped"""
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    with open(tmp_path, "rb") as file:
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(path))
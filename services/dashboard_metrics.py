@@ -0,0 +1,375 @@
+"""Materialized dashboard aggregates, updated per day as master data and forecasts change"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.forecast_store import RecordedForecastStore, combine_parts, recorded_forecasts
+from services.day_index import nullable_lists, replace_days
+from services.master_data import master_data_store
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# Name under which the forecasted_load column of the master data is reported
+BASELINE_NAME = "forecasted_load"
+
+# Columns of the per-day error aggregates, summed to get the metrics over any set of days
+_ERROR_COLUMNS = ["n", "abs_err", "sq_err", "actual", "actual_sq"]
+
+# Reading the parts of a model is retried when another process folds or drops them meanwhile
+_READ_ATTEMPTS = 3
+
+
+class DashboardMetrics:
+    """
+    Per-day aggregates of the master data and of the forecasts made by the models
+
+    Every source (the forecasted_load baseline and each model) keeps one row per
+    day with the count, absolute and squared error sums and the actual load sums,
+    so MAE, RMSE and R² over the full history are a sum over days. The daily
+    actual/baseline means and the hourly load profile are kept per day as well.
+
+    When the master data version changes, a per-day fingerprint of the data finds
+    the days that changed and only those are recomputed. A recorded forecast only
+    recomputes the days it covers. The dashboard payload is rebuilt from the
+    aggregates after a change and served from memory otherwise.
+
+    Recorded forecasts are kept in a RecordedForecastStore, so they survive a
+    restart and every uvicorn worker sees the forecasts the others recorded:
+    the parts of a model this process has not read yet are read on the next
+    refresh or recording, and only the days they cover are recomputed.
+
+    Days and hours are UTC, like the dates of the forecast endpoints.
+    """
+
+    def __init__(self, store: RecordedForecastStore = recorded_forecasts):
+        self._store = store
+        self._lock = threading.Lock()
+        self._data_version: Optional[str] = None
+        self._actual: Optional[pd.Series] = None
+        self._fingerprints = pd.Series(dtype="uint64")
+        # Per day: actual and baseline sums and counts, peak load
+        self._days = pd.DataFrame()
+        # Per day and UTC hour: load sum and count
+        self._hourly_sum = pd.DataFrame()
+        self._hourly_count = pd.DataFrame()
+        # Per source and day: error aggregates, see _error_aggregates()
+        self._errors: Dict[str, pd.DataFrame] = {}
+        # Latest forecast of every model per hour, its model version and the stored parts it was read from
+        self._forecasts: Dict[str, pd.Series] = {}
+        self._versions: Dict[str, str] = {}
+        self._parts: Dict[str, List[str]] = {}
+        self._payload: Optional[Dict[str, Any]] = None
+        self.days_recomputed = 0
+
+    def dashboard_data(self, days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get the dashboard payload, refreshing the aggregates if the master data changed
+
+        Args:
+            days: Only return the last `days` days of the daily chart, all days if None
+
+        Returns:
+            Dict with 'daily_forecast', 'model_performance', 'hourly_pattern' and 'meta'
+        """
+        self.refresh()
+        with self._lock:
+            if self._payload is None:
+                self._payload = self._build_payload()
+            payload = self._payload
+        if days is None:
+            return payload
+        daily = payload["daily_forecast"]
+        return {
+            **payload,
+            "daily_forecast": {key: values[-days:] if days > 0 else [] for key, values in daily.items()},
+        }
+
+    def refresh(self) -> bool:
+        """
+        Update the aggregates of the days whose master data changed and of the models whose stored forecasts changed
+
+        Returns:
+            True if the master data version changed since the last refresh
+        """
+        changed = self._refresh_data()
+        self._sync_forecasts()
+        return changed
+
+    def _refresh_data(self) -> bool:
+        """Update the aggregates of the days whose master data changed"""
+        data_version, frame = master_data_store.snapshot()
+        if data_version == self._data_version:
+            return False
+
+        with self._lock:
+            if data_version == self._data_version:
+                return False
+            start = time.perf_counter()
+            utc_days = _utc_days(frame.index)
+            fingerprints = pd.Series(
+                pd.util.hash_pandas_object(frame, index=True).to_numpy(), index=utc_days
+            ).groupby(level=0).sum()
+
+            # Days that are new or whose rows changed, and days that are gone
+            common = fingerprints.index.intersection(self._fingerprints.index)
+            unchanged = common[self._fingerprints[common].to_numpy() == fingerprints[common].to_numpy()]
+            changed = fingerprints.index.difference(unchanged)
+            removed = self._fingerprints.index.difference(fingerprints.index)
+
+            self._actual = frame["load"]
+            self._fingerprints = fingerprints
+            self._update_days(frame[utc_days.isin(changed)], changed.union(removed))
+            self._errors[BASELINE_NAME] = replace_days(
+                self._errors.get(BASELINE_NAME),
+                changed.union(removed),
+                _error_aggregates(frame["load"][utc_days.isin(changed)], frame["forecasted_load"]),
+            )
+            for custom_name, forecast in self._forecasts.items():
+                self._update_model_days(custom_name, forecast, changed.union(removed))
+            self._data_version = data_version
+            self._payload = None
+            self.days_recomputed += len(changed)
+
+        logger.info(
+            f"Dashboard aggregates updated for {len(changed)} changed and {len(removed)} removed days "
+            f"in {time.perf_counter() - start:.3f}s"
+        )
+        return True
+
+    def record_forecast(self, custom_name: str, forecast: pd.DataFrame, model_version: Hashable) -> None:
+        """
+        Store the forecast of a model and update its error aggregates for the days it covers
+
+        Writes a file, so callers on the event loop run it in a thread.
+
+        Args:
+            custom_name: Name of the trained model
+            forecast: DataFrame with a 'forecast' column indexed by timestamp
+            model_version: Version of the model that made it (LoadedModel.version); stored
+                forecasts of another version are discarded
+        """
+        values = forecast["forecast"].astype(float)
+        values.index = values.index.tz_convert("UTC")
+        self._refresh_data()
+        self._store.append(custom_name, model_version, values)
+        with self._lock:
+            # Reads this part back along with the ones other processes appended meanwhile
+            self._sync_model(custom_name, self._store.parts(custom_name))
+
+    def model_error(self, custom_name: str, days: pd.DatetimeIndex) -> Dict[str, Any]:
+        """
+        Error of the recorded forecasts of a model over some days
+
+        Args:
+            custom_name: Name of the trained model
+            days: UTC days (midnight timestamps) to sum the error aggregates of
+
+        Returns:
+            Dict with mae, rmse and r2, the number of hours, and the days without any forecast hour with an actual load
+        """
+        self.refresh()
+        with self._lock:
+            errors = self._errors.get(custom_name)
+            covered = errors[errors.index.isin(days)] if errors is not None else pd.DataFrame(columns=_ERROR_COLUMNS)
+        totals = covered.sum().reindex(_ERROR_COLUMNS, fill_value=0.0)
+        return {
+            **_metrics(totals),
+            "hours": int(totals["n"]),
+            "missing_days": days.difference(covered.index),
+        }
+
+    def drop_model(self, custom_name: str) -> None:
+        """Forget the forecasts of a model, also the stored ones, e.g. after it has been retrained"""
+        with self._lock:
+            self._store.delete(custom_name)
+            if self._forget_model(custom_name):
+                logger.info(f"Dropped dashboard forecasts of model: {custom_name}")
+
+    def _sync_forecasts(self) -> None:
+        """Read the stored forecast parts changed or dropped by another process or before a restart"""
+        all_parts = self._store.all_parts()
+        with self._lock:
+            if self._actual is None or all_parts == self._parts:
+                return
+            for custom_name in set(self._parts) - set(all_parts):
+                self._forget_model(custom_name)
+            for custom_name, parts in all_parts.items():
+                self._sync_model(custom_name, parts)
+
+    def _sync_model(self, custom_name: str, parts: List[str]) -> None:
+        """
+        Bring the forecasts of a model up to its stored parts, to be called holding the lock
+
+        Parts are only ever appended, so if every part read before is still there only the
+        new ones are read and only their days are recomputed. Otherwise (another version,
+        folded or dropped parts) the model is read again.
+        """
+        known = self._parts.get(custom_name, [])
+        if parts == known or self._actual is None:
+            return
+        new_parts = parts[len(known):] if parts[:len(known)] == known else None
+        for attempt in range(_READ_ATTEMPTS):
+            try:
+                read = self._store.read_parts(custom_name, new_parts if new_parts is not None else parts)
+                break
+            except FileNotFoundError:
+                # Folded or dropped after listing: read whatever is there now
+                if attempt == _READ_ATTEMPTS - 1:
+                    raise
+                parts = self._store.parts(custom_name)
+                new_parts = None
+        if not read:
+            self._forget_model(custom_name)
+            return
+        version, forecast = combine_parts(read)
+        if new_parts is not None and version == self._versions.get(custom_name):
+            days = _utc_days(forecast.index).unique()
+            forecast = pd.concat([self._forecasts[custom_name], forecast])
+            forecast = forecast[~forecast.index.duplicated(keep="last")].sort_index()
+        else:
+            self._errors.pop(custom_name, None)
+            days = _utc_days(forecast.index).unique()
+        self._forecasts[custom_name] = forecast
+        self._versions[custom_name] = version
+        self._parts[custom_name] = parts
+        self._update_model_days(custom_name, forecast, days)
+        self._payload = None
+
+    def _forget_model(self, custom_name: str) -> bool:
+        """Drop everything kept for a model, returns True if it had forecasts"""
+        self._versions.pop(custom_name, None)
+        self._parts.pop(custom_name, None)
+        self._errors.pop(custom_name, None)
+        dropped = self._forecasts.pop(custom_name, None) is not None
+        if dropped:
+            self._payload = None
+        return dropped
+
+    def _update_days(self, changed_rows: pd.DataFrame, days: pd.Index) -> None:
+        """Recompute the daily and hourly aggregates of `days` from their rows"""
+        utc_index = changed_rows.index.tz_convert("UTC")
+        grouped = changed_rows.groupby(utc_index.normalize())
+        new_days = pd.DataFrame({
+            "actual_sum": grouped["load"].sum(),
+            "actual_count": grouped["load"].count(),
+            "actual_max": grouped["load"].max(),
+            "baseline_sum": grouped["forecasted_load"].sum(),
+            "baseline_count": grouped["forecasted_load"].count(),
+        })
+        self._days = replace_days(self._days, days, new_days)
+
+        load = changed_rows["load"].groupby([utc_index.normalize(), utc_index.hour])
+        self._hourly_sum = replace_days(self._hourly_sum, days, load.sum().unstack().reindex(columns=range(24)))
+        self._hourly_count = replace_days(self._hourly_count, days, load.count().unstack().reindex(columns=range(24)))
+
+    def _update_model_days(self, custom_name: str, forecast: pd.Series, days: Iterable) -> None:
+        """Recompute the error aggregates of a model for `days`"""
+        days = pd.Index(days)
+        actual = self._actual
+        if actual is None:
+            return
+        forecast_days = forecast[_utc_days(forecast.index).isin(days)]
+        new_rows = _error_aggregates(actual, forecast_days)
+        self._errors[custom_name] = replace_days(self._errors.get(custom_name), days, new_rows)
+
+    def _build_payload(self) -> Dict[str, Any]:
+        """Turn the aggregates into the dashboard JSON structure"""
+        start = time.perf_counter()
+        days = self._days
+        actual_mean = days["actual_sum"] / days["actual_count"].replace(0, np.nan)
+        baseline_mean = days["baseline_sum"] / days["baseline_count"].replace(0, np.nan)
+
+        models, mae, rmse, r2, hours = [], [], [], [], []
+        for source in [BASELINE_NAME] + sorted(name for name in self._errors if name != BASELINE_NAME):
+            totals = self._errors[source].sum() if source in self._errors else pd.Series(0.0, index=_ERROR_COLUMNS)
+            metrics = _metrics(totals)
+            models.append(source)
+            mae.append(metrics["mae"])
+            rmse.append(metrics["rmse"])
+            r2.append(metrics["r2"])
+            hours.append(int(totals["n"]))
+
+        hourly_count = self._hourly_count.sum()
+        avg_load = (self._hourly_sum.sum() / hourly_count.replace(0, np.nan)).reindex(range(24))
+
+        payload = {
+            "daily_forecast": {
+                "dates": days.index.strftime("%Y-%m-%d").tolist(),
+                "actual": nullable_lists(actual_mean),
+                "predicted": nullable_lists(baseline_mean),
+                "peak": nullable_lists(days["actual_max"]),
+            },
+            "model_performance": {
+                "models": models,
+                "mae": mae,
+                "rmse": rmse,
+                "r2": r2,
+                "hours": hours,
+            },
+            "hourly_pattern": {
+                "hours": list(range(24)),
+                "avg_load": nullable_lists(avg_load),
+            },
+            "meta": {
+                "data_version": self._data_version,
+                "days": len(days),
+                "days_recomputed": self.days_recomputed,
+            },
+        }
+        logger.debug(f"Dashboard payload built in {time.perf_counter() - start:.3f}s")
+        return payload
+
+
+def _utc_days(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    """UTC day of every timestamp"""
+    return index.tz_convert("UTC").normalize()
+
+
+def _error_aggregates(actual: pd.Series, predicted: pd.Series) -> pd.DataFrame:
+    """
+    Per-day sums needed for MAE, RMSE and R² of the hours where both series have a value
+
+    Args:
+        actual: Actual load indexed by timestamp
+        predicted: Forecast indexed by timestamp, aligned to actual by timestamp
+
+    Returns:
+        DataFrame indexed by UTC day with the _ERROR_COLUMNS sums
+    """
+    actual = actual.copy()
+    actual.index = actual.index.tz_convert("UTC")
+    predicted = predicted.copy()
+    predicted.index = predicted.index.tz_convert("UTC")
+    actual, predicted = actual.align(predicted, join="inner")
+    valid = actual.notna() & predicted.notna()
+    actual, predicted = actual[valid], predicted[valid]
+    error = predicted - actual
+    return pd.DataFrame({
+        "n": np.ones(len(actual)),
+        "abs_err": error.abs(),
+        "sq_err": error ** 2,
+        "actual": actual,
+        "actual_sq": actual ** 2,
+    }, index=actual.index).groupby(actual.index.normalize()).sum()
+
+
+def _metrics(totals: pd.Series) -> Dict[str, Optional[float]]:
+    """MAE, RMSE and R² from summed error aggregates, None without data"""
+    n = totals["n"]
+    if n == 0:
+        return {"mae": None, "rmse": None, "r2": None}
+    total_sum_of_squares = totals["actual_sq"] - totals["actual"] ** 2 / n
+    return {
+        "mae": float(totals["abs_err"] / n),
+        "rmse": float(np.sqrt(totals["sq_err"] / n)),
+        "r2": float(1 - totals["sq_err"] / total_sum_of_squares) if total_sum_of_squares > 0 else None,
+    }
+
+
+# Shared instance used by the services and routes
+dashboard_metrics = DashboardMetrics()
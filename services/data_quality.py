@@ -0,0 +1,311 @@
+"""Data quality indicators of the master data, kept per day and updated as the data changes"""
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.day_index import replace_days
+from services.master_data import master_data_store
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# Consecutive hours with the same load that count as a flat line (e.g. a stuck meter)
+DQI_FLATLINE_HOURS = int(os.getenv("DQI_FLATLINE_HOURS", "4"))
+# Centered window of the rolling median and IQR a load value is compared with
+DQI_OUTLIER_WINDOW_HOURS = int(os.getenv("DQI_OUTLIER_WINDOW_HOURS", "25"))
+# A load further than this many IQRs from the rolling median is an outlier
+DQI_OUTLIER_IQR_FACTOR = float(os.getenv("DQI_OUTLIER_IQR_FACTOR", "3"))
+
+# Lower bound on the outlier scale relative to the median, so flat stretches do not flag every change
+_OUTLIER_MIN_RELATIVE_SCALE = 0.05
+
+# Per-day indicators next to the NaN count of every column
+_DAY_COLUMNS = [
+    "hours_expected", "hours_missing", "flatline_hours", "flatline_runs",
+    "outlier_hours", "outlier_runs", "load_without_forecast", "forecast_without_load",
+]
+
+
+class DataQualityIndicators:
+    """
+    Data quality indicators (DQI) of the master data, bucketed by UTC day
+
+    Per day: hours missing from the hourly grid, NaN values per column, hours
+    and runs of flat-lined load (DQI_FLATLINE_HOURS or more equal values in a
+    row) and of outlying load (more than DQI_OUTLIER_IQR_FACTOR rolling IQRs from
+    the rolling median), and hours where only one of load and forecasted_load
+    is present. Each set of days is computed in one vectorized pass over its
+    hourly grid. Duplicate and NaT timestamps, which the master data store drops
+    when it loads the source, are counted from the source itself.
+
+    Like DashboardMetrics, a per-day fingerprint finds the days whose rows
+    changed and only those are recomputed, with a day of margin on both sides
+    for the rolling windows (more while the edge day is a flat line). The
+    payload is rebuilt after a change and served from memory otherwise; its
+    version changes with the master data, so polling clients can send it back
+    as an ETag.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data_version: Optional[str] = None
+        self._fingerprints = pd.Series(dtype="uint64")
+        self._days = pd.DataFrame()
+        self._source_state: Optional[Tuple[str, Tuple[float, ...]]] = None
+        self._duplicates = pd.Series(dtype="int64")
+        self._nat_rows = 0
+        self._payload: Optional[Dict[str, Any]] = None
+        self.days_recomputed = 0
+
+    @property
+    def version(self) -> Optional[str]:
+        """Master data version the indicators were computed from, after refreshing them"""
+        self.refresh()
+        return self._data_version
+
+    def indicators(self, days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get the indicators, refreshing them if the master data changed
+
+        Args:
+            days: Only return the last `days` days of the per-day table, all days if None
+
+        Returns:
+            Dict with the 'totals' over all days, the per-day table as 'daily' column lists,
+            the 'thresholds' used and 'meta'
+        """
+        self.refresh()
+        with self._lock:
+            if self._payload is None:
+                self._payload = self._build_payload()
+            payload = self._payload
+        if days is None:
+            return payload
+        return {**payload, "daily": _last_days(payload["daily"], days)}
+
+    def refresh(self) -> bool:
+        """
+        Recompute the indicators of the days whose master data changed
+
+        Returns:
+            True if the master data version changed since the last refresh
+        """
+        data_version, frame = master_data_store.snapshot()
+        if data_version == self._data_version:
+            return False
+
+        with self._lock:
+            if data_version == self._data_version:
+                return False
+            start = time.perf_counter()
+            utc_days = frame.index.tz_convert("UTC").normalize()
+            fingerprints = pd.Series(
+                pd.util.hash_pandas_object(frame, index=True).to_numpy(), index=utc_days
+            ).groupby(level=0).sum()
+
+            common = fingerprints.index.intersection(self._fingerprints.index)
+            unchanged = common[self._fingerprints[common].to_numpy() == fingerprints[common].to_numpy()]
+            changed = fingerprints.index.difference(unchanged)
+            removed = self._fingerprints.index.difference(fingerprints.index)
+
+            recomputed = pd.DatetimeIndex([])
+            if len(changed):
+                new_days, recomputed = self._compute_changed(frame, fingerprints.index, changed)
+                # Counts stay integers, a column new to the data has no NaN count on the days computed before it
+                self._days = replace_days(self._days, recomputed.union(removed), new_days).fillna(0).astype(int)
+            elif len(removed):
+                self._days = self._days[~self._days.index.isin(removed)]
+            self._fingerprints = fingerprints
+            self._refresh_source()
+            self._data_version = data_version
+            self._payload = None
+            self.days_recomputed += len(recomputed)
+
+        logger.info(
+            f"Data quality indicators updated for {len(recomputed)} days ({len(changed)} changed, "
+            f"{len(removed)} removed) in {time.perf_counter() - start:.3f}s"
+        )
+        return True
+
+    def _compute_changed(self, frame: pd.DataFrame, all_days: pd.DatetimeIndex, changed: pd.DatetimeIndex) -> Tuple[pd.DataFrame, pd.DatetimeIndex]:
+        """
+        Compute the indicators of the changed days and the days their windows reach
+
+        Returns:
+            The per-day indicators and the days they cover
+        """
+        one_day = timedelta(days=1)
+        first, last = all_days[0], all_days[-1]
+        # The rolling windows reach half a day into the neighbouring days
+        lo, hi = max(changed[0] - one_day, first), min(changed[-1] + one_day, last)
+        while True:
+            new_days = _day_indicators(frame, lo, hi)
+            # A flat line covering a whole edge day can continue into the next day
+            grow_lo = lo > first and (_fully_flat(new_days, lo) or _fully_flat(self._days, lo))
+            grow_hi = hi < last and (_fully_flat(new_days, hi) or _fully_flat(self._days, hi))
+            if not (grow_lo or grow_hi):
+                return new_days, new_days.index
+            lo, hi = lo - one_day * grow_lo, hi + one_day * grow_hi
+
+    def _refresh_source(self) -> None:
+        """Count the duplicate and NaT timestamps of the source whenever the source file changes"""
+        state = master_data_store.source_state()
+        path = state[0]
+        if state == self._source_state:
+            return
+        if os.path.isdir(path):
+            # Only needed once the dataset has been ingested
+            from services.columnar_store import read_dataset
+            index = read_dataset(path).index
+        else:
+            index = pd.read_csv(path, usecols=[0], index_col=0, parse_dates=True).index
+        index = pd.DatetimeIndex(index)
+        valid = index[index.notna()]
+        duplicated = valid[valid.duplicated(keep="first")]
+        self._duplicates = pd.Series(1, index=duplicated.tz_convert("UTC").normalize()).groupby(level=0).sum()
+        self._nat_rows = int(index.isna().sum())
+        self._source_state = state
+        if len(duplicated) or self._nat_rows:
+            logger.warning(f"Master data source {path} has {len(duplicated)} duplicate and {self._nat_rows} NaT timestamps")
+
+    def _build_payload(self) -> Dict[str, Any]:
+        """Turn the per-day indicators into the JSON structure of /api/data-quality"""
+        days = self._days
+        duplicates = self._duplicates.reindex(days.index, fill_value=0).astype(int)
+        nan_columns = [column for column in days.columns if column.startswith("nan_")]
+        totals = days.sum()
+        problem_days = (days["hours_missing"] + days["flatline_hours"] + days["outlier_hours"]
+                        + days["load_without_forecast"] + days["forecast_without_load"] + duplicates) > 0
+
+        daily = {"dates": days.index.strftime("%Y-%m-%d").tolist()}
+        for column in _DAY_COLUMNS:
+            daily[column] = days[column].astype(int).tolist()
+        daily["duplicate_rows"] = duplicates.tolist()
+        daily["nan"] = {column[4:]: days[column].astype(int).tolist() for column in nan_columns}
+
+        return {
+            "totals": {
+                **{column: int(totals[column]) for column in _DAY_COLUMNS},
+                "duplicate_rows": int(self._duplicates.sum()),
+                "nat_rows": self._nat_rows,
+                "nan": {column[4:]: int(totals[column]) for column in nan_columns},
+                "days": len(days),
+                "days_with_issues": int(problem_days.sum()),
+            },
+            "daily": daily,
+            "thresholds": {
+                "flatline_hours": DQI_FLATLINE_HOURS,
+                "outlier_window_hours": DQI_OUTLIER_WINDOW_HOURS,
+                "outlier_iqr_factor": DQI_OUTLIER_IQR_FACTOR,
+            },
+            "meta": {
+                "data_version": self._data_version,
+                "days_recomputed": self.days_recomputed,
+            },
+        }
+
+
+def _day_indicators(frame: pd.DataFrame, first_day: pd.Timestamp, last_day: pd.Timestamp) -> pd.DataFrame:
+    """
+    Indicators of the UTC days first_day to last_day, in one pass over their hourly grid
+
+    Args:
+        frame: Master data, sorted and without duplicate or NaT timestamps
+        first_day: First UTC day (midnight)
+        last_day: Last UTC day (midnight)
+
+    Returns:
+        DataFrame indexed by UTC day with the _DAY_COLUMNS and a nan_<column> count per column
+    """
+    one_day = timedelta(days=1)
+    utc_index = frame.index.tz_convert("UTC")
+    # A day of context on both sides for the rolling windows and the runs crossing midnight
+    start = utc_index.searchsorted(first_day - one_day)
+    end = utc_index.searchsorted(last_day + 2 * one_day)
+    rows = frame.iloc[start:end]
+    rows_index = utc_index[start:end]
+
+    # Hours between the first and the last timestamp of the data are expected
+    grid = pd.date_range(
+        max(first_day - one_day, utc_index[0].floor("h")),
+        min(last_day + 2 * one_day - timedelta(hours=1), utc_index[-1].floor("h")),
+        freq="h",
+    )
+    positions = grid.get_indexer(rows_index)
+    on_grid = positions >= 0
+    present = np.zeros(len(grid), dtype=bool)
+    present[positions[on_grid]] = True
+
+    # Row-level flags on the grid: NaN where an hour has no row
+    values = np.full((len(grid), rows.shape[1]), np.nan)
+    values[positions[on_grid]] = rows.to_numpy(dtype=float, na_value=np.nan)[on_grid]
+    columns = list(rows.columns)
+    load = values[:, columns.index("load")]
+    forecasted = values[:, columns.index("forecasted_load")]
+    has_load, has_forecast = ~np.isnan(load), ~np.isnan(forecasted)
+
+    flatline = _run_flags(load, DQI_FLATLINE_HOURS)
+    series = pd.Series(load)
+    rolling = series.rolling(DQI_OUTLIER_WINDOW_HOURS, center=True, min_periods=DQI_OUTLIER_WINDOW_HOURS // 2 + 1)
+    median = rolling.median().to_numpy()
+    iqr = (rolling.quantile(0.75) - rolling.quantile(0.25)).to_numpy()
+    scale = np.fmax(iqr, _OUTLIER_MIN_RELATIVE_SCALE * np.abs(median))
+    with np.errstate(invalid="ignore"):
+        outlier = np.abs(load - median) > DQI_OUTLIER_IQR_FACTOR * scale
+
+    flags = pd.DataFrame({
+        "hours_expected": np.ones(len(grid), dtype=int),
+        "hours_missing": ~present,
+        "flatline_hours": flatline,
+        "flatline_runs": _run_starts(flatline),
+        "outlier_hours": outlier,
+        "outlier_runs": _run_starts(outlier),
+        "load_without_forecast": has_load & ~has_forecast,
+        "forecast_without_load": has_forecast & ~has_load,
+        # Only hours that have a row count as NaN, missing hours are counted on their own
+        **{f"nan_{column}": np.isnan(values[:, position]) & present for position, column in enumerate(columns)},
+    }, index=grid)
+    grid_days = grid.normalize()
+    in_range = (grid_days >= first_day) & (grid_days <= last_day)
+    return flags[in_range].groupby(grid_days[in_range]).sum().astype(int)
+
+
+def _run_flags(values: np.ndarray, min_length: int) -> np.ndarray:
+    """Flag the values in runs of at least min_length equal consecutive values, NaN breaks a run"""
+    if not len(values):
+        return np.zeros(0, dtype=bool)
+    boundaries = np.concatenate(([True], values[1:] != values[:-1]))
+    run_ids = np.cumsum(boundaries) - 1
+    run_lengths = np.bincount(run_ids)
+    return (run_lengths[run_ids] >= min_length) & ~np.isnan(values)
+
+
+def _run_starts(flags: np.ndarray) -> np.ndarray:
+    """Flag the first value of every run of set flags"""
+    return flags & ~np.concatenate(([False], flags[:-1]))
+
+
+def _fully_flat(days: pd.DataFrame, day: pd.Timestamp) -> bool:
+    """Whether every expected hour of a day is part of a flat line"""
+    if day not in days.index:
+        return False
+    row = days.loc[day]
+    return row["flatline_hours"] > 0 and row["flatline_hours"] == row["hours_expected"]
+
+
+def _last_days(daily: Dict[str, Any], days: int) -> Dict[str, Any]:
+    """The last `days` entries of every list of the per-day table, including the per-column NaN lists"""
+    return {
+        key: _last_days(values, days) if isinstance(values, dict) else values[-days:] if days > 0 else []
+        for key, values in daily.items()
+    }
+
+
+# Shared instance used by the routes
+data_quality = DataQualityIndicators()
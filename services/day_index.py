@@ -0,0 +1,144 @@
+"""Day index over the master data for constant-time lookups of the 24 hours of any date"""
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+HOURS_PER_DAY = 24
+
+# Label of the hours in responses, the dates are looked up as UTC days like create_utc_datetime
+_TIMESTAMP_SUFFIX = "+06:00"
+
+
+class DayIndex:
+    """
+    Row positions of every hour of every day of a master data frame
+
+    Dates mean what they mean for the forecast endpoints: hour h of a date is
+    create_utc_datetime(date, h). The index is a (days, 24) table of row positions
+    (-1 where an hour is missing) starting at the first day of the data, so the
+    rows of any set of dates are found with one array lookup. A day's values are
+    gathered straight from the float arrays of the columns, which for float
+    columns are the frame's own (possibly memory-mapped) buffers rather than
+    copies, so every worker sharing a mapped frame shares the values too.
+
+    An index is built once per master data version and is read-only afterwards.
+    """
+
+    def __init__(self, frame: pd.DataFrame, version: Optional[str] = None):
+        start = time.perf_counter()
+        self.version = version
+        utc_index = frame.index.tz_convert("UTC")
+        day_numbers = utc_index.normalize().tz_localize(None).to_numpy().astype("datetime64[D]").astype(np.int64)
+        self.first_day = int(day_numbers[0]) if len(day_numbers) else 0
+        days = int(day_numbers[-1]) - self.first_day + 1 if len(day_numbers) else 0
+
+        self.positions = np.full((days, HOURS_PER_DAY), -1, dtype=np.int64)
+        self.positions[day_numbers - self.first_day, utc_index.hour.to_numpy()] = np.arange(len(frame))
+        self.positions.flags.writeable = False
+
+        self._columns: Dict[str, np.ndarray] = {}
+        for column in frame.columns:
+            # A view for float columns, only other types are converted into a copy
+            self._columns[column] = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=float)
+        self.build_seconds = time.perf_counter() - start
+
+    @property
+    def columns(self) -> List[str]:
+        """Names of the value columns"""
+        return list(self._columns)
+
+    def day_numbers(self, dates: Sequence[str]) -> np.ndarray:
+        """
+        Convert date strings to day numbers (days since 1970-01-01)
+
+        Args:
+            dates: Date strings in format 'YYYY-MM-DD'
+
+        Returns:
+            Integer array of the day numbers
+
+        Raises:
+            ValueError: If a date is not a valid 'YYYY-MM-DD' date
+        """
+        days = np.array(dates, dtype="datetime64[D]")
+        # datetime64 also accepts partial dates such as '2025-06', require the exact format
+        invalid = np.datetime_as_string(days, unit="D") != np.asarray(dates)
+        if invalid.any():
+            raise ValueError(f"Dates must be in format YYYY-MM-DD: {list(np.asarray(dates)[invalid])}")
+        return days.astype(np.int64)
+
+    def rows(self, dates: Sequence[str], hours: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Row positions of the hours of some dates
+
+        Args:
+            dates: Date strings in format 'YYYY-MM-DD'
+            hours: Hours (0-23) to look up, all 24 if None
+
+        Returns:
+            (len(dates), len(hours)) array of row positions, -1 where the data has no such hour
+        """
+        offsets = self.day_numbers(dates) - self.first_day
+        inside = (offsets >= 0) & (offsets < len(self.positions))
+        rows = np.full((len(offsets), HOURS_PER_DAY), -1, dtype=np.int64)
+        rows[inside] = self.positions[offsets[inside]]
+        if hours is not None:
+            rows = rows[:, np.asarray(hours, dtype=np.int64)]
+        return rows
+
+    def values(self, dates: Sequence[str], columns: Sequence[str], hours: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+        """
+        Values of some columns for the hours of some dates
+
+        Args:
+            dates: Date strings in format 'YYYY-MM-DD'
+            columns: Columns to read, columns missing from the data read as NaN
+            hours: Hours (0-23) to read, all 24 if None
+
+        Returns:
+            Dict of column name to a (len(dates), len(hours)) float array, NaN where there is no value
+        """
+        rows = self.rows(dates, hours)
+        result = {}
+        for column in columns:
+            values = self._columns.get(column)
+            if values is None or not len(values):
+                result[column] = np.full(rows.shape, np.nan)
+            else:
+                result[column] = np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan)
+        return result
+
+
+def hour_timestamps(date: str, hours: Sequence[int] = range(HOURS_PER_DAY)) -> List[str]:
+    """ISO timestamps with which the hours of a date are labelled in responses"""
+    return [f"{date}T{hour:02d}:00:00{_TIMESTAMP_SUFFIX}" for hour in hours]
+
+
+def replace_days(table: Optional[pd.DataFrame], days: pd.Index, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop `days` from a per-day table and add their recomputed rows
+
+    Args:
+        table: Table indexed by day, None or empty before the first computation
+        days: Days to replace, also days that are gone and have no new row
+        new_rows: Recomputed rows indexed by day
+
+    Returns:
+        The updated table sorted by day
+    """
+    if table is None or table.empty:
+        return new_rows.sort_index()
+    kept = table[~table.index.isin(days)]
+    if new_rows.empty:
+        return kept
+    return pd.concat([kept, new_rows]).sort_index()
+
+
+def nullable_lists(values) -> list:
+    """Convert a float array or Series to JSON-ready (nested) lists with None for NaN"""
+    values = np.asarray(values, dtype=float)
+    result = values.astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
@@ -0,0 +1,256 @@
+"""Durable append-only log of master data edits, overlaid on the master data until compacted"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.file_lock import file_lock, fsync_directory
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+EDIT_LOG_PATH = os.getenv("EDIT_LOG_PATH", "./static/master_data_edits.log")
+EDIT_LOG_COMPACT_INTERVAL_SECONDS = float(os.getenv("EDIT_LOG_COMPACT_INTERVAL_SECONDS", "300"))
+
+# Master data columns that can be edited
+EDITABLE_COLUMNS = ("load", "forecasted_load")
+
+
+class EditLog:
+    """
+    Append-only log of edited master data values, one JSON record per line
+
+    Writers append a whole record with a single write and fsync it while holding
+    an exclusive lock on '<path>.lock', so appends from several threads, processes
+    or uvicorn workers never interleave. Readers tail the file without the lock
+    and only consume complete lines, so a record that is still being written (or
+    was torn by a crash) is not applied. Compaction replaces the file with an empty
+    one, which readers notice as a new inode and start over.
+
+    Every reader keeps the merged edits (last write wins per hour and column) and a
+    running digest of the records read, used to version the overlaid data.
+    """
+
+    def __init__(self, path: str = EDIT_LOG_PATH):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._digest = hashlib.sha256()
+        self._edits: Dict[int, Dict[str, float]] = {}
+        self._records = 0
+
+    def append(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Durably append one edit record
+
+        Args:
+            rows: Edited hours, each with a tz-aware 'timestamp' and values for some of EDITABLE_COLUMNS
+
+        Returns:
+            The record as written
+        """
+        record = {
+            "id": uuid.uuid4().hex,
+            "written_at": datetime.now(timezone.utc).isoformat(),
+            "rows": [
+                {"timestamp": row["timestamp"].isoformat(), **{column: float(row[column]) for column in EDITABLE_COLUMNS if column in row}}
+                for row in rows
+            ],
+        }
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+        with file_lock(self.lock_path):
+            created = not os.path.exists(self.path)
+            fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                # A record torn by a crash gets its own line instead of swallowing this one
+                if os.fstat(fd).st_size:
+                    os.lseek(fd, -1, os.SEEK_END)
+                    if os.read(fd, 1) != b"\n":
+                        line = b"\n" + line
+                written = os.write(fd, line)
+                if written != len(line):
+                    # Never leave half a record behind: cut the file back to where this record started
+                    os.ftruncate(fd, os.fstat(fd).st_size - written)
+                    raise OSError(f"Short write to edit log {self.path}")
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            if created:
+                fsync_directory(os.path.dirname(self.path))
+
+        logger.info(f"Appended edit {record['id']} with {len(rows)} hours to {self.path}")
+        return record
+
+    def state(self) -> Optional[Tuple[int, int]]:
+        """Inode and size of the log file, a cheap check whether refresh() has anything to read"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def refresh(self) -> bool:
+        """
+        Read the records appended since the last call
+
+        Returns:
+            True if the merged edits changed
+        """
+        with self._lock:
+            try:
+                file = open(self.path, "rb")
+            except FileNotFoundError:
+                return self._reset(None)
+
+            with file:
+                stat = os.fstat(file.fileno())
+                # A new file (compacted) or a shorter one: start over
+                changed = False
+                if stat.st_ino != self._inode or stat.st_size < self._offset:
+                    changed = self._reset(stat.st_ino)
+                if stat.st_size == self._offset:
+                    return changed
+                file.seek(self._offset)
+                data = file.read(stat.st_size - self._offset)
+
+            # Only complete records, a partial last line is read again next time
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                self._apply_record(line)
+            self._digest.update(data[:end])
+            self._offset += end
+            return changed or end > 0
+
+    @property
+    def records(self) -> int:
+        """Number of records read so far"""
+        return self._records
+
+    @property
+    def digest(self) -> Optional[str]:
+        """Digest of the records read so far, None while there are none"""
+        return self._digest.hexdigest() if self._records else None
+
+    def edit_count(self) -> int:
+        """Number of distinct edited hours"""
+        return len(self._edits)
+
+    def apply(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Overlay the edits on the master data
+
+        Args:
+            frame: Master data indexed by tz-aware timestamps
+
+        Returns:
+            Writeable copy of frame with the edited values; edited hours missing from frame are skipped
+        """
+        with self._lock:
+            edits = pd.DataFrame.from_dict(self._edits, orient="index", columns=list(EDITABLE_COLUMNS))
+        result = frame.copy(deep=True)
+        if edits.empty:
+            return result
+
+        index = pd.DatetimeIndex(edits.index.to_numpy().astype("datetime64[ns]")).tz_localize("UTC")
+        edits.index = index.tz_convert(frame.index.tz)
+        # The data input endpoint only accepts existing hours; never let an older record extend the data
+        missing = edits.index.difference(result.index)
+        if len(missing):
+            logger.warning(f"Skipping edits of {len(missing)} hours that are not in the master data, e.g. {missing[0]}")
+            edits = edits.drop(missing)
+        for column in EDITABLE_COLUMNS:
+            values = edits[column].dropna()
+            if column in result.columns and len(values):
+                result.loc[values.index, column] = values.to_numpy()
+        return result
+
+    def truncate(self) -> None:
+        """
+        Atomically replace the log with an empty file, to be called while holding the lock
+
+        Writers open the log only after taking the lock, so no append can go to the old file.
+        """
+        directory = os.path.dirname(self.path)
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, self.path)
+        fsync_directory(directory)
+
+    def _reset(self, inode: Optional[int]) -> bool:
+        """Forget everything read so far, returns True if there were edits"""
+        had_edits = bool(self._records)
+        self._inode = inode
+        self._offset = 0
+        self._digest = hashlib.sha256()
+        self._edits = {}
+        self._records = 0
+        return had_edits
+
+    def _apply_record(self, line: bytes) -> None:
+        try:
+            record = json.loads(line)
+            rows = [
+                (pd.Timestamp(row["timestamp"]).value, {column: float(row[column]) for column in EDITABLE_COLUMNS if column in row})
+                for row in record["rows"]
+            ]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Skipping unreadable record in edit log {self.path}")
+            return
+        for timestamp, values in rows:
+            self._edits.setdefault(timestamp, {}).update(values)
+        self._records += 1
+
+
+class EditLogCompactor:
+    """
+    Background task folding the edit log of a master data store into its columnar dataset
+
+    Compaction in every uvicorn worker is safe: it runs under the log's lock, and a
+    worker that finds the log already compacted does nothing.
+    """
+
+    def __init__(self, store: Any, interval_seconds: float = EDIT_LOG_COMPACT_INTERVAL_SECONDS):
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start compacting periodically"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Edit log compaction every {self.interval_seconds:g}s")
+
+    async def stop(self) -> None:
+        """Stop the periodic compaction, a compaction in progress finishes in its thread"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            state = self.store.edit_log.state()
+            if state is None or state[1] == 0:
+                continue
+            try:
+                await asyncio.to_thread(self.store.compact_edits)
+            except Exception:
+                logger.exception("Edit log compaction failed, the log is kept and retried later")
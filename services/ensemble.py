@@ -0,0 +1,149 @@
+"""Ensembles of the day forecasts of several models, computed on the stacked forecast matrix"""
+import logging
+import os
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import LRUCache
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# Days before the forecast date whose error weights the models of an error-weighted ensemble
+ENSEMBLE_WEIGHT_DAYS = int(os.getenv("ENSEMBLE_WEIGHT_DAYS", "14"))
+ENSEMBLE_WEIGHT_CACHE_MAX_ENTRIES = int(os.getenv("ENSEMBLE_WEIGHT_CACHE_MAX_ENTRIES", "1024"))
+
+# Ways to weight the models of an ensemble
+WEIGHTINGS = ("equal", "error")
+
+
+class BacktestErrorCache:
+    """
+    LRU cache of the error of a model over the days that weight it in an ensemble
+
+    Entries are keyed by (custom_name, model version, master data version, first
+    day, last day), so a retrained model or changed master data is measured again.
+    """
+
+    def __init__(self, max_entries: int = ENSEMBLE_WEIGHT_CACHE_MAX_ENTRIES):
+        self._cache = LRUCache(max_entries=max_entries)
+
+    def get(self, custom_name: str, model_version: Hashable, data_version: str, days: pd.DatetimeIndex) -> Optional[Dict[str, Any]]:
+        """
+        Get the cached error of a model
+
+        Args:
+            custom_name: Name of the trained model
+            model_version: Version of the loaded model (LoadedModel.version)
+            data_version: Version of the master data the error was measured on
+            days: UTC days the error was measured over
+
+        Returns:
+            Error dict as returned by model_service.model_error, or None on a miss
+        """
+        return self._cache.get(self._key(custom_name, model_version, data_version, days))
+
+    def put(self, custom_name: str, model_version: Hashable, data_version: str, days: pd.DatetimeIndex, error: Dict[str, Any]) -> None:
+        """Store the error of a model, see get() for the arguments"""
+        self._cache.put(self._key(custom_name, model_version, data_version, days), error)
+
+    def invalidate_model(self, custom_name: str) -> None:
+        """Drop the cached errors of a model, e.g. after it has been retrained"""
+        self._cache.invalidate_where(lambda key: key[0] == custom_name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and occupancy of the cache"""
+        return self._cache.stats()
+
+    @staticmethod
+    def _key(custom_name: str, model_version: Hashable, data_version: str, days: pd.DatetimeIndex) -> Hashable:
+        return custom_name, model_version, data_version, days[0], days[-1], len(days)
+
+
+def stack_forecasts(forecast_dfs: Sequence[pd.DataFrame], hours: pd.DatetimeIndex, columns: Sequence[str]) -> np.ndarray:
+    """
+    Stack the day forecasts of several models into one array
+
+    Args:
+        forecast_dfs: Day forecast of every model
+        hours: The forecast hours, rows a forecast does not cover are NaN
+        columns: Forecast columns to take, e.g. 'forecast', 'stdev' and the quantile columns
+
+    Returns:
+        Array of shape (models, hours, columns)
+    """
+    stacked = np.full((len(forecast_dfs), len(hours), len(columns)), np.nan)
+    for position, forecast_df in enumerate(forecast_dfs):
+        if len(forecast_df) == len(hours) and np.array_equal(forecast_df.index.asi8, hours.asi8):
+            stacked[position] = forecast_df[list(columns)].to_numpy(dtype=float)
+        else:
+            stacked[position] = forecast_df[list(columns)].reindex(hours).to_numpy(dtype=float)
+    return stacked
+
+
+def quantile_columns(forecast_dfs: Sequence[pd.DataFrame]) -> List[str]:
+    """The quantile columns every forecast has, lowest quantile first"""
+    common = set.intersection(*(set(forecast_df.columns) for forecast_df in forecast_dfs))
+    return sorted(column for column in common if column.startswith("quantile_P"))
+
+
+def error_weights(mse: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Inverse-MSE weights of the models, summing to 1
+
+    Args:
+        mse: Mean squared error of every model, NaN where it is unknown
+
+    Returns:
+        The weights, or None if a model has no known positive error
+    """
+    if not np.all(np.isfinite(mse) & (mse > 0)):
+        return None
+    inverse = 1.0 / mse
+    return inverse / inverse.sum()
+
+
+def combine(stacked: np.ndarray, columns: Sequence[str], weights: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Weighted ensemble of stacked model forecasts
+
+    In every hour the weights are renormalized over the models with a forecast
+    for it. The ensemble quantiles are the weighted averages of the model
+    quantiles; the ensemble stdev adds the spread between the models to their
+    own weighted variance.
+
+    Args:
+        stacked: Forecasts of shape (models, hours, columns), see stack_forecasts()
+        columns: Names of the columns, with 'forecast' and 'stdev' among them
+        weights: Weight of every model
+
+    Returns:
+        Per hour: every column combined, the between-model 'spread' (weighted standard
+        deviation of the forecasts) and the lowest and highest model forecast
+    """
+    forecast = stacked[:, :, columns.index("forecast")]
+    available = ~np.isnan(forecast)
+    # Weights of shape (models, hours), zero where a model has no forecast
+    hour_weights = np.where(available, weights[:, None], 0.0)
+    totals = hour_weights.sum(axis=0)
+    hour_weights = np.divide(hour_weights, totals, out=np.zeros_like(hour_weights), where=totals > 0)
+    covered = totals > 0
+
+    filled = np.where(np.isnan(stacked), 0.0, stacked)
+    combined = np.einsum("mh,mhc->hc", hour_weights, filled)
+    combined[~covered] = np.nan
+
+    mean = combined[:, columns.index("forecast")]
+    between = np.einsum("mh,mh->h", hour_weights, np.where(available, forecast - mean, 0.0) ** 2)
+    stdev = filled[:, :, columns.index("stdev")]
+    within = np.einsum("mh,mh->h", hour_weights, stdev ** 2)
+
+    result = {column: combined[:, position] for position, column in enumerate(columns)}
+    result["stdev"] = np.where(covered, np.sqrt(within + between), np.nan)
+    result["spread"] = np.where(covered, np.sqrt(between), np.nan)
+    masked = np.ma.masked_invalid(forecast)
+    result["min"] = masked.min(axis=0).filled(np.nan)
+    result["max"] = masked.max(axis=0).filled(np.nan)
+    return result
@@ -0,0 +1,173 @@
+"""Feature matrices shared by the models of a request that use the same feature configuration"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, Tuple
+
+import pandas as pd
+
+from services.model_cache import LoadedModel
+from utils.cache import LRUCache
+from utils.metrics import stage_timer
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+FEATURE_CACHE_MAX_ENTRIES = int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "32"))
+FEATURE_CACHE_TTL_SECONDS = float(os.getenv("FEATURE_CACHE_TTL_SECONDS", "600"))
+
+# PredictionJob settings read by input validation and feature engineering
+FEATURE_PJ_SETTINGS = (
+    "resolution_minutes",
+    "flatliner_threshold_minutes",
+    "detect_non_zero_flatliner",
+    "electricity_bidding_zone",
+    "rolling_aggregate_features",
+    "lat",
+    "lon",
+)
+
+
+class FeatureCache:
+    """
+    LRU cache of validated input data with features, as built inside create_forecast_pipeline_core
+
+    Entries are keyed by the caller's input key (data version and forecast window)
+    and by feature_key() of the model, so every model with the same feature
+    configuration only runs the predict step on a hit.
+    """
+
+    def __init__(self, max_entries: int = FEATURE_CACHE_MAX_ENTRIES, ttl_seconds: float = FEATURE_CACHE_TTL_SECONDS):
+        self._cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self.reuses = 0
+        self.seconds_saved = 0.0
+
+    def get_features(self, loaded: LoadedModel, input_data: pd.DataFrame, input_key: Hashable) -> pd.DataFrame:
+        """
+        Get the features of a model's forecast input, building them on a miss
+
+        Args:
+            loaded: Model the features are for
+            input_data: Forecast input with NaN load for the hours to predict
+            input_key: Identifies input_data, e.g. data version and forecast window
+
+        Returns:
+            Validated input data with feature columns, shared between callers and not to be modified
+        """
+        key = (input_key, feature_key(loaded))
+        entry = self._cache.get(key)
+        if entry is not None:
+            data_with_features, build_seconds = entry
+            with self._lock:
+                self.reuses += 1
+                self.seconds_saved += build_seconds
+                reuses, seconds_saved = self.reuses, self.seconds_saved
+            logger.info(
+                f"Reused feature matrix, saved {build_seconds:.3f}s "
+                f"({reuses} reuses, {seconds_saved:.2f}s saved in total)"
+            )
+            return data_with_features
+
+        start = time.perf_counter()
+        with stage_timer("features"):
+            data_with_features = build_features(loaded, input_data)
+        build_seconds = time.perf_counter() - start
+        size = int(data_with_features.memory_usage(index=True).sum())
+        self._cache.put(key, (data_with_features, build_seconds), size=size)
+        logger.debug(f"Built feature matrix in {build_seconds:.3f}s")
+        return data_with_features
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, reuse count and time saved"""
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update(reuses=self.reuses, seconds_saved=self.seconds_saved)
+        return stats
+
+
+def feature_key(loaded: LoadedModel) -> Tuple:
+    """Everything besides the input data that determines a model's feature matrix"""
+    settings = tuple(repr(loaded.pj.get(name)) for name in FEATURE_PJ_SETTINGS)
+    feature_modules = tuple(loaded.model_specs.feature_modules or ())
+    return settings, tuple(loaded.model.feature_names), feature_modules
+
+
+def build_features(loaded: LoadedModel, input_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validate the input and add the model's features, the first half of create_forecast_pipeline_core
+
+    Args:
+        loaded: Model the features are for
+        input_data: Forecast input
+
+    Returns:
+        Validated input data with feature columns
+    """
+    # The pipeline modules are imported on first use, see services.warmup
+    from openstef.feature_engineering.feature_applicator import OperationalPredictFeatureApplicator
+    from openstef.validation import validation
+
+    pj = loaded.pj
+    validated_data = validation.validate(
+        pj["id"],
+        input_data,
+        pj["flatliner_threshold_minutes"],
+        pj["resolution_minutes"],
+        detect_non_zero_flatliner=pj["detect_non_zero_flatliner"],
+    )
+    return OperationalPredictFeatureApplicator(
+        horizons=[pj["resolution_minutes"] / 60.0],
+        feature_names=loaded.model.feature_names,
+        feature_modules=loaded.model_specs.feature_modules,
+    ).add_features(validated_data, pj=pj)
+
+
+def predict_from_features(loaded: LoadedModel, data_with_features: pd.DataFrame, input_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Forecast from already built features, the second half of create_forecast_pipeline_core
+
+    Args:
+        loaded: Model to forecast with
+        data_with_features: Result of build_features() for input_data
+        input_data: Forecast input, used for the fallback forecast
+
+    Returns:
+        Forecast with confidence interval and prediction job properties
+    """
+    from openstef.model.confidence_interval_applicator import ConfidenceIntervalApplicator
+    from openstef.model.fallback import generate_fallback
+    from openstef.pipeline.utils import generate_forecast_datetime_range
+    from openstef.postprocessing.postprocessing import add_prediction_job_properties_to_forecast, sort_quantiles
+    from openstef.validation import validation
+
+    pj, model = loaded.pj, loaded.model
+    forecast_start, forecast_end = generate_forecast_datetime_range(data_with_features)
+    forecast_input_data = data_with_features[forecast_start:forecast_end].drop(columns="load")
+
+    if not validation.is_data_sufficient(data_with_features, pj["completeness_threshold"], pj["minimal_table_length"], model):
+        logger.warning(f"Using fallback forecast for prediction job {pj['id']}")
+        forecast = generate_fallback(data_with_features, input_data[["load"]])
+    else:
+        forecast = pd.DataFrame(index=forecast_input_data.index, data={"forecast": model.predict(forecast_input_data)})
+
+    forecast = ConfidenceIntervalApplicator(model, forecast_input_data).add_confidence_interval(forecast, pj)
+    forecast = sort_quantiles(forecast)
+    return add_prediction_job_properties_to_forecast(pj, forecast, algorithm_type=str(model.path))
+
+
+def forecast_with_shared_features(cache: FeatureCache, loaded: LoadedModel, input_data: pd.DataFrame, input_key: Hashable, model_name: str = "") -> pd.DataFrame:
+    """
+    Same result as create_forecast_pipeline_core, reusing features built for another model when possible
+
+    Models with a custom data_prep_class build their features their own way and
+    always run the complete pipeline. model_name only labels the stage timings.
+    """
+    if loaded.pj.data_prep_class:
+        from openstef.pipeline.create_forecast import create_forecast_pipeline_core
+        with stage_timer("forecast_pipeline", model_name):
+            return create_forecast_pipeline_core(loaded.pj, input_data, loaded.model, loaded.model_specs)
+    data_with_features = cache.get_features(loaded, input_data, input_key)
+    with stage_timer("predict", model_name):
+        return predict_from_features(loaded, data_with_features, input_data)
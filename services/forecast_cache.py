@@ -0,0 +1,75 @@
+"""In-process cache of day-level forecast results"""
+import logging
+import os
+from typing import Any, Dict, Hashable, Optional
+
+import pandas as pd
+
+from services.master_data import master_data_store
+from utils.cache import LRUCache
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "1024"))
+FORECAST_CACHE_MAX_BYTES = int(os.getenv("FORECAST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+FORECAST_CACHE_TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", "3600"))
+
+
+class ForecastCache:
+    """
+    LRU cache of the 24-hour forecast of one model for one target date
+
+    Entries are keyed by (custom_name, model version, date, master data version),
+    so a retrained model or changed master data never serves an old forecast.
+    Entries of older data versions are dropped as soon as the current version of
+    the master data store is seen, entries of a retrained model when the model
+    is invalidated.
+    """
+
+    def __init__(self, max_entries: int = FORECAST_CACHE_MAX_ENTRIES, max_bytes: int = FORECAST_CACHE_MAX_BYTES, ttl_seconds: float = FORECAST_CACHE_TTL_SECONDS):
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self._data_version: Optional[str] = None
+
+    def get(self, custom_name: str, model_version: Hashable, date: str, data_version: str) -> Optional[pd.DataFrame]:
+        """
+        Get the cached day forecast of a model
+
+        Args:
+            custom_name: Name of the trained model
+            model_version: Version of the loaded model (LoadedModel.version)
+            date: Target date in format 'YYYY-MM-DD'
+            data_version: Version of the master data the forecast was made from
+
+        Returns:
+            Read-only forecast DataFrame for the 24 hours of the date, or None on a miss
+        """
+        self._drop_stale_data(data_version)
+        return self._cache.get((custom_name, model_version, date, data_version))
+
+    def put(self, custom_name: str, model_version: Hashable, date: str, data_version: str, forecast: pd.DataFrame) -> None:
+        """Store the day forecast of a model, see get() for the arguments"""
+        self._drop_stale_data(data_version)
+        size = int(forecast.memory_usage(index=True, deep=True).sum())
+        self._cache.put((custom_name, model_version, date, data_version), forecast, size=size)
+
+    def invalidate_model(self, custom_name: str) -> None:
+        """Drop all cached forecasts of a model, e.g. after it has been retrained"""
+        dropped = self._cache.invalidate_where(lambda key: key[0] == custom_name)
+        if dropped:
+            logger.info(f"Invalidated {dropped} cached forecasts of model: {custom_name}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and occupancy of the cache"""
+        return self._cache.stats()
+
+    def _drop_stale_data(self, data_version: str) -> None:
+        if data_version == self._data_version:
+            return
+        # A request still holding the snapshot from before an edit must not flush the newer entries
+        if data_version != master_data_store.version:
+            return
+        if self._data_version is not None:
+            dropped = self._cache.invalidate_where(lambda key: key[3] != data_version)
+            logger.info(f"Master data changed, invalidated {dropped} cached forecasts")
+        self._data_version = data_version
@@ -0,0 +1,165 @@
+"""Recorded model forecasts on disk, shared by the processes serving the dashboard and the drift checks"""
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.file_lock import file_lock
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+RECORDED_FORECASTS_DIR = os.getenv("RECORDED_FORECASTS_DIR", "./static/recorded_forecasts")
+# Parts of a model after which they are folded into one, which bounds the files read on a reload
+RECORDED_FORECASTS_MAX_PARTS = int(os.getenv("RECORDED_FORECASTS_MAX_PARTS", "64"))
+
+PART_PATTERN = "part-*.arrow"
+
+_METADATA_KEY = b"model_version"
+
+
+class RecordedForecastStore:
+    """
+    Latest forecast of every model per hour, as an append-only directory of Arrow parts per model
+
+    Recording a forecast writes a new part with only its hours, newer parts win
+    over older ones for the same hour. Every part holds the model version: a
+    forecast of another version (the model was retrained) removes the parts of
+    the old one. Once a model has more than RECORDED_FORECASTS_MAX_PARTS parts
+    they are folded into one. Parts are written atomically under a lock per
+    model and named after a number that only grows, so the other uvicorn workers
+    read just the parts they have not seen; a part they had read that is gone
+    (replaced, folded or dropped) means reading the model again.
+    """
+
+    def __init__(self, directory: str = RECORDED_FORECASTS_DIR, max_parts: int = RECORDED_FORECASTS_MAX_PARTS):
+        self.directory = directory
+        self.max_parts = max_parts
+
+    def append(self, custom_name: str, model_version: Hashable, forecast: pd.Series) -> bool:
+        """
+        Add the forecasts of a model as a new part
+
+        Args:
+            custom_name: Name of the trained model
+            model_version: Version of the model that made the forecast (LoadedModel.version)
+            forecast: Forecast values indexed by UTC timestamp
+
+        Returns:
+            True if stored forecasts of an older model version were discarded
+        """
+        model_dir = self._model_dir(custom_name)
+        version = json.dumps(model_version)
+        with file_lock(model_dir + ".lock"):
+            parts = self.parts(custom_name)
+            # All parts are of the version of the last one, see combine_parts() for the exception
+            discarded = bool(parts) and _part_version(os.path.join(model_dir, parts[-1])) != version
+            path = _write_part(model_dir, parts, version, forecast)
+            if discarded:
+                for part in parts:
+                    os.remove(os.path.join(model_dir, part))
+                parts = []
+            parts.append(os.path.basename(path))
+            if len(parts) > self.max_parts:
+                self._fold(model_dir, parts, version)
+        return discarded
+
+    def parts(self, custom_name: str) -> List[str]:
+        """Part file names of a model in append order"""
+        return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self._model_dir(custom_name), PART_PATTERN)))
+
+    def all_parts(self) -> Dict[str, List[str]]:
+        """Part file names in append order of every model with stored forecasts, listed at once"""
+        parts: Dict[str, List[str]] = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*", PART_PATTERN))):
+            parts.setdefault(os.path.basename(os.path.dirname(path)), []).append(os.path.basename(path))
+        return parts
+
+    def read_parts(self, custom_name: str, parts: List[str]) -> List[Tuple[str, pd.Series]]:
+        """
+        Model version and forecasts of some parts of a model
+
+        Raises:
+            FileNotFoundError: If a part was removed since it was listed
+        """
+        model_dir = self._model_dir(custom_name)
+        return [_read_part(os.path.join(model_dir, part)) for part in parts]
+
+    def load(self, custom_name: str) -> Optional[pd.Series]:
+        """Stored forecasts of a model, None if it has none"""
+        with file_lock(self._model_dir(custom_name) + ".lock"):
+            read = self.read_parts(custom_name, self.parts(custom_name))
+        return combine_parts(read)[1] if read else None
+
+    def delete(self, custom_name: str) -> None:
+        """Remove the stored forecasts of a model"""
+        model_dir = self._model_dir(custom_name)
+        with file_lock(model_dir + ".lock"):
+            shutil.rmtree(model_dir, ignore_errors=True)
+
+    def _fold(self, model_dir: str, parts: List[str], version: str) -> None:
+        """Replace the parts with one holding their combined forecasts"""
+        _, combined = combine_parts([_read_part(os.path.join(model_dir, part)) for part in parts])
+        _write_part(model_dir, parts, version, combined)
+        for part in parts:
+            os.remove(os.path.join(model_dir, part))
+        logger.info(f"Folded {len(parts)} recorded forecast parts of {os.path.basename(model_dir)}")
+
+    def _model_dir(self, custom_name: str) -> str:
+        return os.path.join(self.directory, os.path.basename(custom_name))
+
+
+def combine_parts(read: List[Tuple[str, pd.Series]]) -> Tuple[str, pd.Series]:
+    """
+    Combine parts in append order, later parts win for the same hour
+
+    Only the parts of the version of the last part count, so a process that died
+    while replacing an older version does not mix versions.
+
+    Returns:
+        Model version and combined forecasts
+    """
+    version = read[-1][0]
+    forecasts = pd.concat([forecast for part_version, forecast in read if part_version == version])
+    return version, forecasts[~forecasts.index.duplicated(keep="last")].sort_index()
+
+
+def _part_version(path: str) -> str:
+    with pa.OSFile(path, "rb") as source:
+        return pa.ipc.open_file(source).schema.metadata[_METADATA_KEY].decode()
+
+
+def _read_part(path: str) -> Tuple[str, pd.Series]:
+    # Read into memory rather than mapped, so the part can be removed on every platform
+    with pa.OSFile(path, "rb") as source:
+        table = pa.ipc.open_file(source).read_all()
+    index = pd.DatetimeIndex(table.column("timestamp").to_pandas()).tz_convert("UTC")
+    forecast = pd.Series(table.column("forecast").to_numpy(), index=index, name="forecast")
+    return table.schema.metadata[_METADATA_KEY].decode(), forecast
+
+
+def _write_part(model_dir: str, parts: List[str], version: str, forecast: pd.Series) -> str:
+    """Atomically write a part named after a number above every existing part's"""
+    os.makedirs(model_dir, exist_ok=True)
+    # Nanoseconds since the epoch, so a model recorded again after being dropped never reuses a name
+    number = max(time.time_ns(), (int(parts[-1][len("part-"):-len(".arrow")]) + 1) if parts else 0)
+    path = os.path.join(model_dir, f"part-{number:020d}.arrow")
+    table = pa.table({
+        "timestamp": pa.array(forecast.index.tz_convert("UTC"), type=pa.timestamp("s", tz="UTC")),
+        "forecast": pa.array(forecast.to_numpy(dtype=float)),
+    }).replace_schema_metadata({_METADATA_KEY: version.encode()})
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+# Shared instance used by the dashboard aggregates
+recorded_forecasts = RecordedForecastStore()
@@ -0,0 +1,454 @@
+"""Hyperparameter sweeps: many training trials over one shared training window"""
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from services.training_queue import TRAINING_JOBS_DB_PATH, _abandoned, _add_columns, _connect, _invalidate_model, _now, _owner, renew_leases
+from services.worker_pool import discard_executor, get_executor
+from utils.shared_frame import SharedFrame, publish_frame, read_shared_frame
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+SWEEP_WORKERS = int(os.getenv("SWEEP_WORKERS", str(os.cpu_count() or 1)))
+SWEEP_MAX_TRIALS = int(os.getenv("SWEEP_MAX_TRIALS", "64"))
+
+SEARCH_TYPES = ("grid", "random")
+RANK_METRICS = ("rmse", "mae")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS sweeps (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        model TEXT NOT NULL,
+        name_prefix TEXT NOT NULL,
+        params TEXT NOT NULL,
+        submitted_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        error TEXT,
+        owner TEXT,
+        heartbeat_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sweep_trials (
+        sweep_id TEXT NOT NULL,
+        trial INTEGER NOT NULL,
+        custom_name TEXT NOT NULL,
+        hyperparams TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        metrics TEXT,
+        error TEXT,
+        PRIMARY KEY (sweep_id, trial)
+    )
+    """,
+)
+
+# Training window of the sweep a worker process is currently serving, keyed by shared memory name
+_worker_frame: Dict[str, pd.DataFrame] = {}
+
+
+class SweepRunner:
+    """
+    Persistent queue of hyperparameter sweeps
+
+    Sweeps run one after another. The training window of a sweep is selected
+    once and published in shared memory, then its trials are trained in
+    parallel in the 'sweep' process pool. Every trial is saved as its own
+    trained model named '<name_prefix>_<trial>'. Sweeps and trial results are
+    stored next to the training jobs. A running sweep is leased to the process
+    that claimed it, like a training job.
+    """
+
+    def __init__(self, db_path: str = TRAINING_JOBS_DB_PATH, workers: int = SWEEP_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Create the tables, recover sweeps from a previous run and start the dispatcher"""
+        _init_db(self.db_path)
+        self._queue = asyncio.Queue()
+
+        with closing(_connect(self.db_path)) as conn, conn:
+            now = _now()
+            # Only sweeps whose process stopped; sweeps of the other uvicorn workers are left alone
+            abandoned = _abandoned(conn, "sweeps")
+            conn.executemany(
+                "UPDATE sweep_trials SET status = 'interrupted', finished_at = ? "
+                "WHERE status IN ('queued', 'running') AND sweep_id = ?",
+                [(now, sweep_id) for sweep_id in abandoned],
+            )
+            conn.executemany(
+                "UPDATE sweeps SET status = 'interrupted', finished_at = ?, "
+                "error = 'Server stopped while the sweep was running' WHERE id = ? AND status = 'running'",
+                [(now, sweep_id) for sweep_id in abandoned],
+            )
+            interrupted = len(abandoned)
+            queued = [row["id"] for row in conn.execute(
+                "SELECT id FROM sweeps WHERE status = 'queued' ORDER BY submitted_at, rowid"
+            )]
+        for sweep_id in queued:
+            self._queue.put_nowait(sweep_id)
+        if interrupted or queued:
+            logger.info(f"Recovered sweeps: {len(queued)} queued, {interrupted} interrupted")
+
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._heartbeat = asyncio.create_task(renew_leases(self.db_path, "sweeps"))
+
+    async def stop(self) -> None:
+        """Stop dispatching; queued sweeps stay queued and are picked up after the next start"""
+        tasks = [task for task in (self._dispatcher, self._heartbeat) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+        self._heartbeat = None
+
+    def submit(self, model: str, name_prefix: str, training_data_start_date: str, training_data_end_date: str,
+               search: str, space: Dict[str, Any], n_trials: Optional[int] = None, seed: Optional[int] = None,
+               metric: str = "rmse") -> Dict[str, Any]:
+        """
+        Queue a sweep
+
+        Args:
+            model: Model type ('xgb' or 'lgb')
+            name_prefix: Trials are saved as '<name_prefix>_<trial>'
+            training_data_start_date: Start date of the training window shared by all trials
+            training_data_end_date: End date of the training window
+            search: 'grid' for every combination, 'random' for n_trials samples
+            space: Hyperparameter name to a list of values, or for random search
+                a {"min", "max", "log"} range
+            n_trials: Number of samples of a random search
+            seed: Random seed of a random search
+            metric: Validation metric the leaderboard is ranked by, 'rmse' or 'mae'
+
+        Returns:
+            The queued sweep, see get_sweep()
+        """
+        if self._queue is None:
+            raise RuntimeError("Sweep runner is not started")
+        if metric not in RANK_METRICS:
+            raise ValueError(f"metric must be one of {RANK_METRICS}")
+
+        trials = build_trials(model, search, space, n_trials, seed)
+        sweep_id = uuid.uuid4().hex
+        params = {
+            "training_data_start_date": training_data_start_date,
+            "training_data_end_date": training_data_end_date,
+            "search": search,
+            "space": space,
+            "n_trials": n_trials,
+            "seed": seed,
+            "metric": metric,
+        }
+        with closing(_connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "INSERT INTO sweeps (id, status, model, name_prefix, params, submitted_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (sweep_id, model, name_prefix, json.dumps(params), _now()),
+            )
+            conn.executemany(
+                "INSERT INTO sweep_trials (sweep_id, trial, custom_name, hyperparams, status) VALUES (?, ?, ?, ?, 'queued')",
+                [
+                    (sweep_id, trial, _trial_name(name_prefix, trial, len(trials)), json.dumps(hyperparams))
+                    for trial, hyperparams in enumerate(trials)
+                ],
+            )
+        self._queue.put_nowait(sweep_id)
+        logger.info(f"Queued {search} sweep {sweep_id} of {len(trials)} {model} trials as '{name_prefix}_*'")
+        return self.get_sweep(sweep_id)
+
+    def get_sweep(self, sweep_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a sweep with all its trials and the leaderboard of the finished ones
+
+        Args:
+            sweep_id: ID returned by submit()
+
+        Returns:
+            Sweep dict, or None if the ID is unknown
+        """
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute("SELECT * FROM sweeps WHERE id = ?", (sweep_id,)).fetchone()
+            if row is None:
+                return None
+            trial_rows = conn.execute(
+                "SELECT * FROM sweep_trials WHERE sweep_id = ? ORDER BY trial", (sweep_id,)
+            ).fetchall()
+
+        params = json.loads(row["params"])
+        trials = [_trial_from_row(trial_row) for trial_row in trial_rows]
+        counts: Dict[str, int] = {}
+        for trial in trials:
+            counts[trial["status"]] = counts.get(trial["status"], 0) + 1
+        return {
+            "sweep_id": row["id"],
+            "status": row["status"],
+            "model": row["model"],
+            "name_prefix": row["name_prefix"],
+            "params": params,
+            "submitted_at": row["submitted_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "error": row["error"],
+            "trial_counts": counts,
+            "leaderboard": leaderboard(trials, params["metric"]),
+            "trials": trials,
+        }
+
+    def list_sweeps(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """List the most recently submitted sweeps, newest first, without their trials"""
+        with closing(_connect(self.db_path)) as conn:
+            ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM sweeps ORDER BY submitted_at DESC, rowid DESC LIMIT ?", (limit,)
+            )]
+        sweeps = [self.get_sweep(sweep_id) for sweep_id in ids]
+        for sweep in sweeps:
+            del sweep["trials"]
+        return sweeps
+
+    async def _dispatch(self) -> None:
+        """Take sweeps off the queue and run them one at a time"""
+        while True:
+            sweep_id = await self._queue.get()
+            try:
+                await self._run_sweep(sweep_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Sweep {sweep_id} failed")
+                _update_sweep(self.db_path, sweep_id, status="failed", finished_at=_now(), error=str(e) or type(e).__name__)
+            finally:
+                self._queue.task_done()
+
+    async def _run_sweep(self, sweep_id: str) -> None:
+        """Publish the training window once and train every queued trial of a sweep in the pool"""
+        # Imported here so the runner module stays light for the web process
+        from services.model_service import training_data_frame
+
+        # Claim the sweep atomically, with several uvicorn workers every worker recovers the queued sweeps
+        with closing(_connect(self.db_path)) as conn, conn:
+            now = _now()
+            claimed = conn.execute(
+                "UPDATE sweeps SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, _owner(), now, sweep_id),
+            ).rowcount
+            row = conn.execute("SELECT * FROM sweeps WHERE id = ?", (sweep_id,)).fetchone()
+            trial_rows = conn.execute(
+                "SELECT * FROM sweep_trials WHERE sweep_id = ? AND status = 'queued' ORDER BY trial", (sweep_id,)
+            ).fetchall()
+        if not claimed:
+            return
+
+        params = json.loads(row["params"])
+        train_data = training_data_frame(params["training_data_start_date"], params["training_data_end_date"])
+        logger.info(f"Sweep {sweep_id}: {len(trial_rows)} trials on {len(train_data)} training rows")
+
+        loop = asyncio.get_running_loop()
+        executor = get_executor("sweep", self.workers)
+        with publish_frame(train_data) as shared:
+            futures = [
+                loop.run_in_executor(
+                    executor, _run_sweep_trial, self.db_path, sweep_id, trial_row["trial"], row["model"],
+                    trial_row["custom_name"], json.loads(trial_row["hyperparams"]), params, shared,
+                )
+                for trial_row in trial_rows
+            ]
+            results = await asyncio.gather(*futures, return_exceptions=True)
+
+        for trial_row, result in zip(trial_rows, results):
+            if isinstance(result, Exception):
+                if isinstance(result, BrokenProcessPool):
+                    discard_executor("sweep")
+                logger.error(f"Sweep {sweep_id} trial {trial_row['trial']} failed: {result!r}")
+                _update_trial(
+                    self.db_path, sweep_id, trial_row["trial"], status="failed",
+                    finished_at=_now(), error=str(result) or type(result).__name__,
+                )
+            else:
+                _invalidate_model(trial_row["custom_name"])
+
+        failed = sum(isinstance(result, Exception) for result in results)
+        _update_sweep(
+            self.db_path, sweep_id, status="succeeded" if failed < len(results) else "failed",
+            finished_at=_now(), error=f"{failed} of {len(results)} trials failed" if failed else None,
+        )
+        logger.info(f"Sweep {sweep_id} finished, {len(results) - failed} of {len(results)} trials succeeded")
+
+
+def build_trials(model: str, search: str, space: Dict[str, Any], n_trials: Optional[int] = None, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Expand a search space into the hyperparameters of every trial
+
+    Args:
+        model: Model type, only hyperparameters it accepts may be searched
+        search: 'grid' or 'random'
+        space: Hyperparameter name to a list of values, or a {"min", "max", "log"} range (random search only)
+        n_trials: Number of samples of a random search
+        seed: Random seed of a random search
+
+    Returns:
+        One hyperparameter dict per trial
+    """
+    from services.model_service import MODEL_HYPERPARAMETERS
+
+    if model not in MODEL_HYPERPARAMETERS:
+        raise ValueError(f"Unsupported model type: {model}")
+    if search not in SEARCH_TYPES:
+        raise ValueError(f"search must be one of {SEARCH_TYPES}")
+    if not space:
+        raise ValueError("The search space is empty")
+    unknown = sorted(set(space) - set(MODEL_HYPERPARAMETERS[model]))
+    if unknown:
+        raise ValueError(f"Hyperparameters not supported by {model}: {unknown}")
+
+    names = sorted(space)
+    if search == "grid":
+        for name in names:
+            if not isinstance(space[name], list) or not space[name]:
+                raise ValueError(f"Grid search needs a non-empty list of values for {name}")
+        trials = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    else:
+        if not n_trials or n_trials < 1:
+            raise ValueError("Random search needs n_trials")
+        rng = random.Random(seed)
+        trials = [{name: _sample(rng, name, space[name]) for name in names} for _ in range(n_trials)]
+
+    if len(trials) > SWEEP_MAX_TRIALS:
+        raise ValueError(f"The sweep has {len(trials)} trials, at most {SWEEP_MAX_TRIALS} are allowed")
+    return trials
+
+
+def leaderboard(trials: List[Dict[str, Any]], metric: str = "rmse") -> List[Dict[str, Any]]:
+    """
+    Rank the succeeded trials by their validation error, best first
+
+    Args:
+        trials: Trial dicts as returned in get_sweep()
+        metric: 'rmse' or 'mae'
+
+    Returns:
+        Rank, model name, hyperparameters and validation/test errors per trial
+    """
+    ranked = []
+    for trial in trials:
+        validation = (trial["metrics"] or {}).get("validation") or {}
+        if trial["status"] == "succeeded" and validation.get(metric) is not None:
+            ranked.append(trial)
+    ranked.sort(key=lambda trial: trial["metrics"]["validation"][metric])
+    return [
+        {
+            "rank": rank,
+            "custom_name": trial["custom_name"],
+            "hyperparams": trial["hyperparams"],
+            "validation": trial["metrics"]["validation"],
+            "test": trial["metrics"].get("test"),
+        }
+        for rank, trial in enumerate(ranked, start=1)
+    ]
+
+
+def _sample(rng: random.Random, name: str, values: Any) -> Any:
+    """Draw one value from a list of choices or a {"min", "max", "log"} range"""
+    if isinstance(values, list):
+        if not values:
+            raise ValueError(f"No values given for {name}")
+        return rng.choice(values)
+    if not isinstance(values, dict) or "min" not in values or "max" not in values:
+        raise ValueError(f"{name} needs a list of values or a min/max range")
+    low, high = values["min"], values["max"]
+    if values.get("log"):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    if isinstance(low, int) and isinstance(high, int):
+        return int(round(value))
+    return value
+
+
+def _trial_name(name_prefix: str, trial: int, n_trials: int) -> str:
+    return f"{name_prefix}_{trial:0{len(str(n_trials - 1))}d}"
+
+
+def _run_sweep_trial(db_path: str, sweep_id: str, trial: int, model: str, custom_name: str,
+                     hyperparams: Dict[str, Any], params: Dict[str, Any], shared: SharedFrame) -> Dict[str, Any]:
+    """Process pool entry point: train one trial on the sweep's shared training window"""
+    # Imported here so the runner module stays light for the web process
+    from services.model_service import _train_model
+
+    # Decode the shared window once per worker and sweep, not once per trial
+    train_data = _worker_frame.get(shared.name)
+    if train_data is None:
+        _worker_frame.clear()
+        train_data = _worker_frame[shared.name] = read_shared_frame(shared)
+
+    _update_trial(db_path, sweep_id, trial, status="running", started_at=_now())
+    metrics = _train_model(
+        model,
+        custom_name,
+        params["training_data_start_date"],
+        params["training_data_end_date"],
+        hyperparams,
+        train_data=train_data.copy(),
+    )
+    _update_trial(db_path, sweep_id, trial, status="succeeded", finished_at=_now(), metrics=json.dumps(metrics))
+    return metrics
+
+
+def _init_db(db_path: str) -> None:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        _add_columns(conn, "sweeps", {"owner": "TEXT", "heartbeat_at": "TEXT"})
+
+
+def _update_sweep(db_path: str, sweep_id: str, **fields: Any) -> None:
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute(f"UPDATE sweeps SET {assignments} WHERE id = ?", (*fields.values(), sweep_id))
+
+
+def _update_trial(db_path: str, sweep_id: str, trial: int, **fields: Any) -> None:
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute(
+            f"UPDATE sweep_trials SET {assignments} WHERE sweep_id = ? AND trial = ?",
+            (*fields.values(), sweep_id, trial),
+        )
+
+
+def _trial_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "trial": row["trial"],
+        "custom_name": row["custom_name"],
+        "hyperparams": json.loads(row["hyperparams"]),
+        "status": row["status"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+        "metrics": json.loads(row["metrics"]) if row["metrics"] else None,
+        "error": row["error"],
+    }
+
+
+# Shared instance started by main.py
+sweep_runner = SweepRunner()
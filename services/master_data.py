@@ -0,0 +1,407 @@
+"""Process-wide in-memory store for the master time-series data"""
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from services.day_index import DayIndex
+from services.edit_log import EditLog, EditLogCompactor
+from utils.file_lock import file_lock
+from utils.shared_counter import SharedCounter
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+TRAINING_DATA_PATH = "./static/master_data_with_forecasted.csv"
+MASTER_DATA_DATASET_PATH = "./static/master_data.arrow"
+
+# Counter every process bumps after changing the master data, so the others reload right away
+MASTER_DATA_VERSION_PATH = os.getenv("MASTER_DATA_VERSION_PATH", "./static/master_data.version")
+# Unchanged counter: the sources are only checked for outside changes this often
+MASTER_DATA_CHECK_INTERVAL_SECONDS = float(os.getenv("MASTER_DATA_CHECK_INTERVAL_SECONDS", "1"))
+# Directory (ideally on tmpfs, e.g. /dev/shm/...) where data that is not memory-mapped from the
+# dataset is published once as an Arrow file for all workers; empty to build it in every process
+MASTER_DATA_SHARED_DIR = os.getenv("MASTER_DATA_SHARED_DIR", "")
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class MasterDataStore:
+    """
+    Parses, cleans and sorts the master data once and shares it across requests.
+
+    If the columnar dataset produced by ingest.py exists it is memory-mapped,
+    otherwise the CSV is parsed. The cached frame is frozen (its arrays are not
+    writeable), so callers must take a copy of the rows they want to modify. The
+    source is re-checked when the shared change counter moves, and otherwise at
+    most every MASTER_DATA_CHECK_INTERVAL_SECONDS: a changed mtime triggers a
+    content hash, and only a changed hash triggers a reload. The new frame is
+    built completely before it is swapped in, so readers never observe a
+    half-loaded state.
+
+    Edits from the data input page are appended to an edit log and overlaid on
+    the loaded source; every new edit changes the version. compact_edits() folds
+    the log into the columnar dataset.
+
+    With several uvicorn workers, set shared_dir: a frame that is not a mapping
+    of the dataset (the parsed CSV, or the data with edits applied) is then
+    written once per version as an Arrow file there and every worker maps it
+    read-only, so the data is in memory once whatever the number of workers.
+    """
+
+    def __init__(self, csv_path: str = TRAINING_DATA_PATH, dataset_path: str = MASTER_DATA_DATASET_PATH, edit_log: Optional[EditLog] = None, shared_dir: str = MASTER_DATA_SHARED_DIR, version_path: str = MASTER_DATA_VERSION_PATH):
+        self.csv_path = csv_path
+        self.dataset_path = dataset_path
+        self.edit_log = edit_log or EditLog()
+        self.shared_dir = shared_dir
+        self.check_interval_seconds = MASTER_DATA_CHECK_INTERVAL_SECONDS
+        self._changes = SharedCounter(version_path)
+        self._changes_seen: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._base: Optional[pd.DataFrame] = None
+        self._base_hash: Optional[str] = None
+        self._frame: Optional[pd.DataFrame] = None
+        self._mtime: Optional[Tuple[float, ...]] = None
+        self._log_state: Optional[Tuple[int, int]] = None
+        self._content_hash: Optional[str] = None
+        self._day_index: Optional[DayIndex] = None
+        self._load_seconds: float = 0.0
+        self._loaded_at: Optional[datetime] = None
+        self._reload_count: int = 0
+
+    def get(self) -> pd.DataFrame:
+        """
+        Get the cleaned master data, loading or reloading it if needed
+
+        Returns:
+            Read-only DataFrame indexed by timestamp, sorted and without duplicate or NaT rows
+        """
+        self.refresh()
+        return self._frame
+
+    @property
+    def path(self) -> str:
+        """The source currently backing the store: the columnar dataset if present, else the CSV"""
+        return self.dataset_path if os.path.isdir(self.dataset_path) else self.csv_path
+
+    @property
+    def version(self) -> str:
+        """Content hash of the currently loaded data including edits, usable as a cache key"""
+        self.refresh()
+        return self._content_hash
+
+    def source_state(self) -> Tuple[str, Tuple[float, ...]]:
+        """Path of the current source and the modification times of its files, which change whenever it is rewritten"""
+        path = self.path
+        return path, _path_mtime(path)
+
+    def snapshot(self) -> Tuple[str, pd.DataFrame]:
+        """Version and frame of the same state of the data, see version and get()"""
+        self.refresh()
+        with self._lock:
+            return self._content_hash, self._frame
+
+    def day_index(self) -> DayIndex:
+        """
+        Get the day index of the current data, building it on first use after every change
+
+        Returns:
+            DayIndex whose version is the data version it was built from
+        """
+        version, frame = self.snapshot()
+        day_index = self._day_index
+        if day_index is None or day_index.version != version:
+            day_index = DayIndex(frame, version)
+            self._day_index = day_index
+            logger.debug(f"Day index of master data version {version[:12]} built in {day_index.build_seconds * 1000:.1f}ms")
+        return day_index
+
+    def refresh(self) -> bool:
+        """
+        Reload the data if the file or the edit log changed since the last check
+
+        Returns:
+            True if the data was (re)loaded, False if the cached copy is still current
+        """
+        changes = self._changes.value()
+        if (self._frame is not None and changes == self._changes_seen
+                and time.monotonic() - self._checked_at < self.check_interval_seconds):
+            return False
+
+        path = self.path
+        mtime = _path_mtime(path)
+        log_state = self.edit_log.state()
+        if self._frame is not None and mtime == self._mtime and log_state == self._log_state:
+            self._mark_checked(changes)
+            return False
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            mtime = _path_mtime(path)
+            log_state = self.edit_log.state()
+            if self._frame is not None and mtime == self._mtime and log_state == self._log_state:
+                self._mark_checked(changes)
+                return False
+
+            start = time.perf_counter()
+            base_changed = False
+            if self._base is None or mtime != self._mtime:
+                content_hash = _hash_path(path)
+                if self._base is not None and content_hash == self._base_hash:
+                    logger.debug(f"Master data mtime changed but content is identical: {path}")
+                else:
+                    self._base = self._load_base(path, content_hash)
+                    self._base_hash = content_hash
+                    base_changed = True
+                self._mtime = mtime
+            edits_changed = self.edit_log.refresh()
+            self._log_state = log_state
+            self._mark_checked(changes)
+            if not (base_changed or edits_changed):
+                return False
+
+            if self.edit_log.records:
+                content_hash = hashlib.sha256(f"{self._base_hash}:{self.edit_log.digest}".encode()).hexdigest()
+                if self.shared_dir:
+                    base = self._base
+                    frame = self._shared_frame(content_hash, lambda: self.edit_log.apply(base))
+                else:
+                    frame = self.edit_log.apply(self._base)
+                    frame = _frozen(frame)
+            else:
+                frame, content_hash = self._base, self._base_hash
+            load_seconds = time.perf_counter() - start
+
+            # Swap everything in at once so readers see either the old or the new data
+            self._frame = frame
+            self._content_hash = content_hash
+            self._load_seconds = load_seconds
+            self._loaded_at = datetime.now(timezone.utc)
+            self._reload_count += 1
+
+        stats = self.stats()
+        logger.info(
+            f"Master data loaded from {path}: {stats['rows']} rows in "
+            f"{stats['load_seconds']:.3f}s, {stats['memory_bytes'] / 1024 / 1024:.1f} MiB"
+        )
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Describe the currently loaded data
+
+        Returns:
+            Dict with path, version, row count, load time and memory usage
+        """
+        frame = self._frame
+        if frame is None:
+            return {"path": self.path, "loaded": False}
+        return {
+            "path": self.path,
+            "loaded": True,
+            "version": self._content_hash,
+            "rows": len(frame),
+            "columns": list(frame.columns),
+            "start": frame.index[0].isoformat() if len(frame) else None,
+            "end": frame.index[-1].isoformat() if len(frame) else None,
+            "load_seconds": self._load_seconds,
+            "memory_bytes": int(frame.memory_usage(index=True, deep=True).sum()),
+            "loaded_at": self._loaded_at.isoformat(),
+            "reload_count": self._reload_count,
+            "edit_log_records": self.edit_log.records,
+            "edited_hours": self.edit_log.edit_count(),
+            "shared_dir": self.shared_dir or None,
+            "change_counter": self._changes_seen,
+        }
+
+    def write_edits(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Durably record edited values and make them visible in this process right away
+
+        Args:
+            rows: Edited hours, see EditLog.append()
+
+        Returns:
+            The written record and the new data version
+        """
+        record = self.edit_log.append(rows)
+        self.notify_changed()
+        self.refresh()
+        return {"edit_id": record["id"], "version": self._content_hash}
+
+    def compact_edits(self) -> int:
+        """
+        Fold the edit log into the columnar dataset and empty the log
+
+        Runs under the edit log's lock, so no edit is appended in between and only
+        one process compacts at a time. If the dataset does not exist yet it is
+        created from the CSV. A crash before the log is emptied is harmless, the
+        edits are simply applied again on top of the compacted data.
+
+        Returns:
+            Number of edit records compacted
+        """
+        # Only needed when there is something to compact
+        from services.columnar_store import replace_dataset
+
+        with file_lock(self.edit_log.lock_path):
+            pending = EditLog(self.edit_log.path)
+            pending.refresh()
+            if not pending.records:
+                return 0
+            start = time.perf_counter()
+            frame = pending.apply(_load_master_data(self.path))
+            replace_dataset(frame, self.dataset_path)
+            pending.truncate()
+        self.notify_changed()
+
+        logger.info(f"Compacted {pending.records} edit records into {self.dataset_path} in {time.perf_counter() - start:.3f}s")
+        self.refresh()
+        return pending.records
+
+
+    def notify_changed(self) -> None:
+        """Tell every process using the master data that it changed, e.g. after ingest.py wrote the dataset"""
+        self._changes.increment()
+
+    def _mark_checked(self, changes: int) -> None:
+        self._changes_seen = changes
+        self._checked_at = time.monotonic()
+
+    def _load_base(self, path: str, content_hash: str) -> pd.DataFrame:
+        """Load the source; a parsed CSV is shared through shared_dir like data with edits"""
+        if self.shared_dir and not os.path.isdir(path):
+            return self._shared_frame(content_hash, lambda: _load_master_data(path))
+        return _load_master_data(path)
+
+    def _shared_frame(self, version: str, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Map the published Arrow file of a data version, publishing it first if no worker has yet
+
+        Args:
+            version: Content hash the file is named after
+            build: Builds the frame if it has to be published
+
+        Returns:
+            Read-only frame backed by the shared mapping
+        """
+        # Only needed when the data is shared between workers
+        from services.columnar_store import read_file, write_file
+
+        path = os.path.join(self.shared_dir, f"master-{version}.arrow")
+        for attempt in range(2):
+            if not os.path.exists(path):
+                with file_lock(os.path.join(self.shared_dir, "publish.lock")):
+                    if not os.path.exists(path):
+                        start = time.perf_counter()
+                        write_file(build(), path)
+                        logger.info(f"Published master data version {version[:12]} to {path} in {time.perf_counter() - start:.3f}s")
+                        keep = {path, os.path.join(self.shared_dir, f"master-{self._base_hash}.arrow")}
+                        _remove_snapshots(self.shared_dir, keep)
+            try:
+                frame = read_file(path)
+                break
+            except FileNotFoundError:
+                # Removed by a worker that published a newer version in between, publish it again
+                if attempt == 1:
+                    raise
+        frame = _frozen(frame)
+        return frame
+
+
+def _remove_snapshots(shared_dir: str, keep: Set[str]) -> None:
+    """Remove the published files of older versions; workers that still map one keep their mapping"""
+    for file_path in glob.glob(os.path.join(shared_dir, "master-*.arrow")):
+        if file_path not in keep:
+            try:
+                os.remove(file_path)
+            except OSError:
+                # Still mapped on Windows, removed by a later publish
+                pass
+
+
+def _source_files(path: str) -> List[str]:
+    """Files making up a source: the CSV itself or every part file of a dataset"""
+    if os.path.isdir(path):
+        from services.columnar_store import list_parts
+        return list_parts(path)
+    return [path]
+
+
+def _path_mtime(path: str) -> Tuple[float, ...]:
+    """Modification times of the source, changes whenever a part is added or rewritten"""
+    return tuple(os.stat(file).st_mtime for file in _source_files(path))
+
+
+def _hash_path(path: str) -> str:
+    """Compute the SHA-256 of a source without reading it into memory at once"""
+    digest = hashlib.sha256()
+    for file_path in _source_files(path):
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_master_data(path: str) -> pd.DataFrame:
+    """Load the master data from a columnar dataset or a CSV"""
+    if os.path.isdir(path):
+        # Only needed once the dataset has been ingested
+        from services.columnar_store import read_dataset
+        frame = read_dataset(path)
+        # Appended parts may overlap or arrive out of order
+        if not frame.index.is_monotonic_increasing or frame.index.has_duplicates:
+            frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        frame = _frozen(frame)
+        return frame
+    return read_master_data_csv(path)
+
+
+def read_master_data_csv(path: str) -> pd.DataFrame:
+    """
+    Parse a master data CSV and apply the cleanup every caller needs
+
+    Args:
+        path: Path of the CSV file
+
+    Returns:
+        Read-only DataFrame sorted by timestamp without duplicate or NaT rows
+    """
+    frame = pd.read_csv(path, index_col=0, parse_dates=True)
+
+    # Remove duplicate index values and rows with NaT in the index
+    frame = frame[~frame.index.duplicated(keep='first')]
+    frame = frame[frame.index.notna()]
+    frame = frame.sort_index()
+
+    frame = _frozen(frame)
+    return frame
+
+
+def _frozen(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rebuild a frame from read-only views of its columns so shared data cannot be mutated in place
+
+    The views are marked read-only before the new frame is built on them without a
+    copy, so every array the frame holds refuses writes; copies stay writeable.
+    """
+    columns = {}
+    for column in frame.columns:
+        values = frame[column].to_numpy()
+        values.flags.writeable = False
+        columns[column] = values
+    return pd.DataFrame(columns, index=frame.index, copy=False)
+
+
+# Shared instance used by the services and routes
+master_data_store = MasterDataStore()
+
+# Folds the edits of the shared store into its dataset in the background
+edit_log_compactor = EditLogCompactor(master_data_store)
@@ -0,0 +1,324 @@
+"""Retention of trained model versions and export of the active model in the booster's native format"""
+import importlib
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    from openstef.data_classes.model_specifications import ModelSpecificationDataClass
+    from openstef.model.regressors.regressor import OpenstfRegressor
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# MLflow runs kept per model after every training run, older runs are deleted with their artifacts
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "3"))
+
+# Written next to pj.pkl, describes the exported booster file of the active run
+NATIVE_META_FILE = "native_model.json"
+
+# MLflow file store run states (mlflow.entities.RunStatus)
+_RUN_RUNNING = 1
+_RUN_FINISHED = 3
+
+# Fitted frames of an OpenstfRegressor: confidence intervals and the input completeness check use them
+_MODEL_FRAMES = ("standard_deviation", "feature_importance_dataframe")
+
+# Regressor classes are only re-created from these modules
+_REGRESSOR_MODULE_PREFIX = "openstef.model.regressors."
+
+
+def model_versions(model_dir: str) -> List[Dict[str, Any]]:
+    """
+    List the MLflow runs stored for a model, newest first
+
+    Reads the meta.yaml files of the MLflow file store directly, which is much
+    cheaper than importing mlflow and searching the runs.
+
+    Args:
+        model_dir: Directory of the trained model (trained_models/<name>)
+
+    Returns:
+        Dicts with run_id, experiment_id, path, status, lifecycle_stage and start/end time in ms
+    """
+    # mlflow depends on PyYAML, so it is installed wherever models can be trained
+    import yaml
+
+    tracking_dir = os.path.join(model_dir, "mlflow_trained_models")
+    versions = []
+    if not os.path.isdir(tracking_dir):
+        return versions
+    for experiment in os.scandir(tracking_dir):
+        if not experiment.is_dir() or experiment.name == ".trash":
+            continue
+        for run in os.scandir(experiment.path):
+            meta_path = os.path.join(run.path, "meta.yaml")
+            if not run.is_dir() or not os.path.isfile(meta_path):
+                continue
+            with open(meta_path) as file:
+                meta = yaml.safe_load(file) or {}
+            versions.append({
+                "run_id": meta.get("run_id", run.name),
+                "experiment_id": experiment.name,
+                "path": run.path,
+                "status": meta.get("status"),
+                "lifecycle_stage": meta.get("lifecycle_stage"),
+                "start_time": meta.get("start_time") or 0,
+                "end_time": meta.get("end_time"),
+            })
+    # Same order as MLflowSerializer, which loads the latest started finished run
+    versions.sort(key=lambda version: (version["start_time"], version["run_id"]), reverse=True)
+    return versions
+
+
+def active_version(versions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The run a forecast uses: the most recently started finished run that is not deleted"""
+    for version in versions:
+        if _is_usable(version):
+            return version
+    return None
+
+
+def prune_versions(model_dir: str, keep: int = MODEL_KEEP_VERSIONS) -> Dict[str, Any]:
+    """
+    Delete all but the newest `keep` finished runs of a model
+
+    Deleted runs (openstef only marks the runs beyond its own limit as deleted)
+    and failed runs are removed too, as is the MLflow trash. Running runs are
+    never touched. Must not run while the model is being trained; _train_model
+    calls it while holding the model's lock.
+
+    Args:
+        model_dir: Directory of the trained model
+        keep: Number of finished runs to keep, at least 1
+
+    Returns:
+        Dict with the number of kept and removed runs and the bytes freed
+    """
+    if keep < 1:
+        raise ValueError(f"At least one model version must be kept, got {keep}")
+    kept, removed, freed_bytes = 0, 0, 0
+    for version in model_versions(model_dir):
+        if version["status"] == _RUN_RUNNING:
+            continue
+        if _is_usable(version) and kept < keep:
+            kept += 1
+            continue
+        freed_bytes += _directory_size(version["path"])
+        shutil.rmtree(version["path"], ignore_errors=True)
+        removed += 1
+
+    trash_dir = os.path.join(model_dir, "mlflow_trained_models", ".trash")
+    for entry in os.scandir(trash_dir) if os.path.isdir(trash_dir) else ():
+        freed_bytes += _directory_size(entry.path)
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+    if removed:
+        logger.info(f"Removed {removed} old versions of {model_dir}, kept {kept}, freed {freed_bytes / 1024 / 1024:.1f} MiB")
+    return {"kept": kept, "removed": removed, "freed_bytes": freed_bytes}
+
+
+def export_native(model_dir: str, experiment_name: str, model: "OpenstfRegressor", model_specs: "ModelSpecificationDataClass") -> Optional[str]:
+    """
+    Export the active model as a booster file in its library's native format
+
+    Only XGBoost regressors are exported (as UBJSON); other models keep being
+    loaded from the MLflow store. The booster file is named after the run, and
+    the metadata file that points to it is replaced last, so a reader sees
+    either the previous or the new export.
+
+    Args:
+        model_dir: Directory of the trained model
+        experiment_name: MLflow experiment the model was loaded from, the prediction job id
+        model: Model as loaded by MLflowSerializer.load_model
+        model_specs: Model specifications as loaded by MLflowSerializer.load_model
+
+    Returns:
+        Path of the booster file, None if the model type has no native export
+    """
+    # Models are only exported after training, when xgboost is imported already
+    from xgboost import XGBModel
+
+    if not isinstance(model, XGBModel) or not type(model).__module__.startswith(_REGRESSOR_MODULE_PREFIX):
+        logger.debug(f"No native export for {type(model).__name__} in {model_dir}")
+        return None
+
+    versions = model_versions(model_dir)
+    version = active_version(versions)
+    if version is None:
+        return None
+    booster_file = f"model-{version['run_id']}.ubj"
+    booster_path = os.path.join(model_dir, booster_file)
+    # xgboost picks the format from the extension, so the temporary file keeps it
+    temp_path = os.path.join(model_dir, f"model-{version['run_id']}.tmp.ubj")
+    model.save_model(temp_path)
+    os.replace(temp_path, booster_path)
+
+    meta = {
+        "format": "xgboost-ubj",
+        "booster_file": booster_file,
+        "regressor": f"{type(model).__module__}.{type(model).__qualname__}",
+        "experiment_name": experiment_name,
+        "run_id": version["run_id"],
+        "trained_at": version["end_time"],
+        "hyper_params": model_specs.hyper_params,
+        "feature_names": model_specs.feature_names,
+        "feature_modules": model_specs.feature_modules,
+        # Fitted frames the forecast pipeline reads besides the booster
+        **{
+            attribute: _frame_to_dict(getattr(model, attribute, None))
+            for attribute in _MODEL_FRAMES
+        },
+    }
+    meta_path = os.path.join(model_dir, NATIVE_META_FILE)
+    with open(f"{meta_path}.tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    # Booster files of earlier runs are no longer referenced
+    for name in os.listdir(model_dir):
+        if name.startswith("model-") and name.endswith(".ubj") and not name.endswith(".tmp.ubj") and name != booster_file:
+            os.remove(os.path.join(model_dir, name))
+    return booster_path
+
+
+def load_native(model_dir: str, experiment_name: str) -> Optional[Tuple["OpenstfRegressor", "ModelSpecificationDataClass"]]:
+    """
+    Load the exported booster of a model without going through the MLflow store
+
+    Args:
+        model_dir: Directory of the trained model
+        experiment_name: MLflow experiment the forecast would load from
+
+    Returns:
+        (model, model_specs) like MLflowSerializer.load_model, or None if there is
+        no export or it is not the export of the active run
+    """
+    meta_path = os.path.join(model_dir, NATIVE_META_FILE)
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    version = active_version(model_versions(model_dir))
+    if version is None or meta["run_id"] != version["run_id"] or meta["experiment_name"] != experiment_name:
+        logger.info(f"Native export of {model_dir} is not the active model, loading from MLflow")
+        return None
+    module_name, _, class_name = meta["regressor"].rpartition(".")
+    if meta["format"] != "xgboost-ubj" or not module_name.startswith(_REGRESSOR_MODULE_PREFIX):
+        return None
+
+    from openstef.data_classes.model_specifications import ModelSpecificationDataClass
+
+    booster_path = os.path.join(model_dir, meta["booster_file"])
+    model = getattr(importlib.import_module(module_name), class_name)()
+    model.load_model(booster_path)
+    for attribute in _MODEL_FRAMES:
+        setattr(model, attribute, _frame_from_dict(meta.get(attribute)))
+    # Same attributes MLflowSerializer sets on a loaded model
+    trained_at = datetime.fromtimestamp(meta["trained_at"] / 1000, tz=timezone.utc) if meta["trained_at"] else None
+    model.age = (datetime.now(timezone.utc) - trained_at).days if trained_at else float("inf")
+    model.path = booster_path
+
+    model_specs = ModelSpecificationDataClass(
+        id=experiment_name,
+        hyper_params=meta["hyper_params"],
+        feature_names=meta["feature_names"],
+        feature_modules=meta["feature_modules"],
+    )
+    return model, model_specs
+
+
+def refresh_artifacts(model_dir: str, experiment_name: str, keep: int = MODEL_KEEP_VERSIONS) -> Dict[str, Any]:
+    """
+    Export the active model natively and prune old versions, e.g. after a training run
+
+    Args:
+        model_dir: Directory of the trained model
+        experiment_name: MLflow experiment of the model, the prediction job id
+        keep: Number of finished runs to keep
+
+    Returns:
+        Dict with the booster file (None if not exported), the pruning result and the duration
+    """
+    # The MLflow store stays the source of truth, the export is made from what it loads
+    from openstef.model.serializer import MLflowSerializer
+
+    start = time.perf_counter()
+    model, model_specs = MLflowSerializer(
+        mlflow_tracking_uri=os.path.join(model_dir, "mlflow_trained_models")
+    ).load_model(experiment_name=experiment_name)
+    booster_path = export_native(model_dir, experiment_name, model, model_specs)
+    pruned = prune_versions(model_dir, keep)
+    return {"booster_file": booster_path, **pruned, "seconds": time.perf_counter() - start}
+
+
+def rollback_version(model_dir: str, experiment_name: str) -> Dict[str, Any]:
+    """
+    Mark the active run as deleted so the previous finished run is used again
+
+    The deleted run is removed by the next pruning. Must be called while holding
+    the model's lock, like prune_versions().
+
+    Args:
+        model_dir: Directory of the trained model
+        experiment_name: MLflow experiment of the model, the prediction job id
+
+    Returns:
+        Dict with the rolled back run, the now active run and the new booster file
+
+    Raises:
+        ValueError: If there is no previous finished run
+    """
+    finished = [version for version in model_versions(model_dir) if _is_usable(version)]
+    if len(finished) < 2:
+        raise ValueError(f"No previous version to roll back to in {model_dir}")
+
+    from mlflow.tracking import MlflowClient
+    from openstef.model.serializer import MLflowSerializer
+
+    tracking_uri = os.path.join(model_dir, "mlflow_trained_models")
+    MlflowClient(tracking_uri=tracking_uri).delete_run(finished[0]["run_id"])
+    model, model_specs = MLflowSerializer(mlflow_tracking_uri=tracking_uri).load_model(experiment_name=experiment_name)
+    booster_path = export_native(model_dir, experiment_name, model, model_specs)
+    if booster_path is None:
+        # Without an export of the previous run, the stale one must not be loaded
+        _remove_native_export(model_dir)
+    return {"rolled_back_run": finished[0]["run_id"], "active_run": finished[1]["run_id"], "booster_file": booster_path}
+
+
+def _is_usable(version: Dict[str, Any]) -> bool:
+    return version["status"] == _RUN_FINISHED and version["lifecycle_stage"] == "active"
+
+
+def _remove_native_export(model_dir: str) -> None:
+    try:
+        os.remove(os.path.join(model_dir, NATIVE_META_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _frame_to_dict(frame: Optional[pd.DataFrame]) -> Optional[Dict[str, Any]]:
+    return frame.to_dict(orient="split") if isinstance(frame, pd.DataFrame) else None
+
+
+def _frame_from_dict(data: Optional[Dict[str, Any]]) -> Optional[pd.DataFrame]:
+    return pd.DataFrame(**data) if data is not None else None
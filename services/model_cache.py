@@ -0,0 +1,193 @@
+"""In-process cache of loaded prediction jobs and models"""
+import logging
+import os
+import pickle
+import re
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from services.model_artifacts import NATIVE_META_FILE, load_native
+from utils.cache import LRUCache
+from utils.file_lock import is_locked
+from utils.metrics import stage_timer
+
+if TYPE_CHECKING:
+    # openstef pulls in mlflow and the regressors, it is imported when the first model is loaded
+    from openstef.data_classes.model_specifications import ModelSpecificationDataClass
+    from openstef.data_classes.prediction_job import PredictionJobDataClass
+    from openstef.model.regressors.regressor import OpenstfRegressor
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "16"))
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Extra history on top of the longest lag/rolling feature, covers resampling edges
+LOOKBACK_MARGIN = timedelta(days=1)
+
+_LAG_FEATURE = re.compile(r"^T-(\d+)(min|d)$")
+_ROLLING_FEATURE = re.compile(r"^rolling_\w+_load_(P\w+)$")
+
+
+class LoadedModel(NamedTuple):
+    """A deserialized prediction job together with its latest MLflow model"""
+    pj: "PredictionJobDataClass"
+    model: "OpenstfRegressor"
+    model_specs: "ModelSpecificationDataClass"
+    version: Tuple[int, ...]
+    size_bytes: int
+    lookback: timedelta
+
+
+class ModelCache:
+    """
+    LRU cache of LoadedModel entries keyed by custom_name
+
+    Every lookup compares a cheap on-disk fingerprint (mtimes of pj.pkl and the
+    MLflow experiment directories) with the cached one, so a model retrained by
+    another process is picked up without an explicit invalidation. While a
+    training run holds the model's lock file the cached entry keeps being
+    served, so no worker loads a half-written model.
+    """
+
+    def __init__(self, parent_dir: str, max_entries: int = MODEL_CACHE_MAX_ENTRIES, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.parent_dir = parent_dir
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+
+    def get(self, custom_name: str) -> LoadedModel:
+        """
+        Get the prediction job and model for a trained model, loading them on a miss
+
+        Args:
+            custom_name: Name of the trained model
+
+        Returns:
+            LoadedModel with pj, model and model_specs
+        """
+        version = self._fingerprint(custom_name)
+        loaded: Optional[LoadedModel] = self._cache.get(custom_name)
+        if loaded is not None and loaded.version == version:
+            return loaded
+        if loaded is not None and is_locked(model_lock_path(self.parent_dir, custom_name)):
+            logger.debug(f"Model {custom_name} is being retrained, serving the cached version")
+            return loaded
+
+        loaded = self._load(custom_name, version)
+        self._cache.put(custom_name, loaded, size=loaded.size_bytes)
+        return loaded
+
+    def invalidate(self, custom_name: str) -> None:
+        """Drop the cached entry for a model, e.g. after it has been retrained"""
+        if self._cache.invalidate(custom_name):
+            logger.info(f"Invalidated cached model: {custom_name}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and occupancy of the cache"""
+        return self._cache.stats()
+
+    def _fingerprint(self, custom_name: str) -> Tuple[int, ...]:
+        """Modification times that change whenever pj.pkl is rewritten, a new MLflow run is stored or the model is exported"""
+        model_dir = os.path.join(self.parent_dir, custom_name)
+        mtimes = [os.stat(os.path.join(model_dir, "pj.pkl")).st_mtime_ns]
+        try:
+            mtimes.append(os.stat(os.path.join(model_dir, NATIVE_META_FILE)).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(0)
+        tracking_dir = os.path.join(model_dir, "mlflow_trained_models")
+        if os.path.isdir(tracking_dir):
+            with os.scandir(tracking_dir) as entries:
+                mtimes.extend(sorted(entry.stat().st_mtime_ns for entry in entries if entry.is_dir()))
+        return tuple(mtimes)
+
+    def _load(self, custom_name: str, version: Tuple[int, ...]) -> LoadedModel:
+        """Unpickle pj.pkl and load the most recent model, from its native export if it has one"""
+        dictionary_path = os.path.join(self.parent_dir, custom_name, "pj.pkl")
+        with stage_timer("unpickle_pj", custom_name), open(dictionary_path, "rb") as file:
+            pj = pickle.load(file)
+
+        # Same model resolution as create_forecast_pipeline
+        prediction_model_pid = pj["id"]
+        if pj.alternative_forecast_model_pid:
+            prediction_model_pid = pj.alternative_forecast_model_pid
+
+        # The booster exported after training loads without searching the MLflow store
+        native = None
+        try:
+            with stage_timer("native_load", custom_name):
+                native = load_native(os.path.join(self.parent_dir, custom_name), str(prediction_model_pid))
+        except Exception:
+            logger.exception(f"Could not load the native export of {custom_name}, loading from MLflow")
+
+        if native is not None:
+            model, model_specs = native
+        else:
+            # mlflow is only imported once the first model is loaded from it
+            from openstef.model.serializer import MLflowSerializer
+
+            mlflow_tracking_uri = f"{self.parent_dir}/{custom_name}/mlflow_trained_models"
+            with stage_timer("mlflow_load", custom_name):
+                model, model_specs = MLflowSerializer(
+                    mlflow_tracking_uri=mlflow_tracking_uri
+                ).load_model(experiment_name=str(prediction_model_pid))
+        if pj.alternative_forecast_model_pid:
+            model_specs.id = pj.id
+
+        size_bytes = len(pickle.dumps((pj, model, model_specs), protocol=pickle.HIGHEST_PROTOCOL))
+        lookback = required_lookback(pj, model.feature_names)
+        source = "native export" if native is not None else "MLflow"
+        logger.info(f"Loaded model {custom_name} from {source} into cache ({size_bytes / 1024:.0f} KiB, lookback {lookback})")
+        return LoadedModel(pj, model, model_specs, version, size_bytes, lookback)
+
+
+def model_lock_path(parent_dir: str, custom_name: str) -> str:
+    """Lock file held while a model's files are written by a training run"""
+    return os.path.join(parent_dir, custom_name, ".lock")
+
+
+def required_lookback(pj: "PredictionJobDataClass", feature_names: List[str]) -> timedelta:
+    """
+    History needed before the first forecast hour to build the model's features
+
+    Covers the longest lag ("T-14d", "T-1380min") or rolling window
+    ("rolling_mean_load_P1D") feature, and enough rows to pass the
+    pipeline's minimal table length check.
+
+    Args:
+        pj: Prediction job of the model
+        feature_names: Feature names the model was trained on
+
+    Returns:
+        Lookback duration including a safety margin
+    """
+    longest = timedelta(0)
+    for name in feature_names:
+        lag = feature_lag(name)
+        if lag is not None:
+            longest = max(longest, lag)
+            continue
+        rolling = _ROLLING_FEATURE.match(name)
+        if rolling:
+            longest = max(longest, pd.Timedelta(rolling.group(1)).to_pytimedelta())
+
+    minimal_table = timedelta(minutes=pj["resolution_minutes"] * pj["minimal_table_length"])
+    return max(longest, minimal_table) + LOOKBACK_MARGIN
+
+
+def feature_lag(name: str) -> Optional[timedelta]:
+    """
+    Lag of a lagged load feature such as "T-1d" or "T-1380min"
+
+    Args:
+        name: Feature name
+
+    Returns:
+        The lag, or None if the feature is not a lag feature
+    """
+    lag = _LAG_FEATURE.match(name)
+    if lag is None:
+        return None
+    amount, unit = int(lag.group(1)), lag.group(2)
+    return timedelta(minutes=amount) if unit == "min" else timedelta(days=amount)
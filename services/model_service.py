@@ -1,22 +1,72 @@
 """Service class for model training and forecasting operations"""
+import asyncio
+import copy
+import json
 import numpy as np
 import pandas as pd
 import pickle
 import os
 import logging
+import time
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, List
-from openstef.data_classes.prediction_job import PredictionJobDataClass
-from openstef.pipeline.train_model import train_model_pipeline
-from openstef.pipeline.create_forecast import create_forecast_pipeline
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+from services.batch_forecast import forecast_days, supports_batch
+from services.dashboard_metrics import dashboard_metrics
+from services.day_index import DayIndex, hour_timestamps, nullable_lists
+from services.ensemble import ENSEMBLE_WEIGHT_DAYS, WEIGHTINGS, BacktestErrorCache, combine, error_weights, quantile_columns, stack_forecasts
+from services.feature_cache import FeatureCache, forecast_with_shared_features
+from services.forecast_cache import ForecastCache
+from services.master_data import master_data_store
+from services.model_artifacts import active_version, model_versions, refresh_artifacts, rollback_version
+from services.model_cache import LoadedModel, ModelCache, model_lock_path
+from services.model_usage import model_usage
+from services.training_queue import training_queue
+from services.worker_pool import FORECAST_WORKERS, discard_executor, get_executor
 from utils.dateutils import create_utc_datetime
-from datetime import datetime, timedelta, timezone
+from utils.file_lock import file_lock
+from utils.metrics import record_stage, stage_timer
+from utils.shared_frame import SharedFrame, publish_frame, read_shared_frame
+from utils.single_flight import SingleFlight
+from datetime import datetime, timedelta
 
 # Get logger for this module (configuration is done in main.py)
 logger = logging.getLogger(__name__)
 
 PARENT_DIR = "trained_models"
-TRAINING_DATA_PATH = "./static/master_data_with_forecasted.csv"
+FORECAST_HOURS = 24
+
+# Hyperparameters accepted per model type, with the type they are passed to the regressor as
+MODEL_HYPERPARAMETERS = {
+    "xgb": {"learning_rate": float, "early_stopping_rounds": int, "n_estimators": int, "max_depth": int},
+    "lgb": {"learning_rate": float, "n_estimators": int, "num_leaves": int, "max_depth": int, "max_bin": int},
+}
+
+# Trees added at most by an incremental retrain, early stopping may add fewer
+RETRAIN_ROUNDS = int(os.getenv("RETRAIN_ROUNDS", "50"))
+
+# Upper bound on the days of one range forecast request
+FORECAST_RANGE_MAX_DAYS = int(os.getenv("FORECAST_RANGE_MAX_DAYS", "366"))
+
+# Pass only the lookback window to the pipeline instead of a copy of the full history
+FORECAST_WINDOWED_INPUT = os.getenv("FORECAST_WINDOWED_INPUT", "1") == "1"
+
+# Loaded prediction jobs and models, shared by all forecast requests of this process
+model_cache = ModelCache(PARENT_DIR)
+
+# Day forecasts per model, so every hour of an already forecast day skips the pipeline
+forecast_cache = ForecastCache()
+
+# Features of a forecast window, shared by the models that use the same feature configuration
+feature_cache = FeatureCache()
+
+# Recent error of every model, which weights it in error-weighted ensembles
+backtest_error_cache = BacktestErrorCache()
+
+# Day forecasts and training runs in progress, shared by concurrent identical requests of this process
+forecast_flights = SingleFlight()
+training_flights = SingleFlight()
 
 class ModelService:
     """Service class for handling model training and forecasting operations"""
@@ -30,9 +80,38 @@ class ModelService:
         return dirs
     
     @staticmethod
-    async def train_model(model: str, custom_name: str, training_data_start_date: str, training_data_end_date: str, hyperparams_dict: Dict[str, Any]) -> str:
+    def get_model_cache_stats() -> Dict[str, Any]:
+        """Get hit/miss counters and occupancy of the loaded model cache"""
+        return model_cache.stats()
+    
+    @staticmethod
+    def get_forecast_cache_stats() -> Dict[str, Any]:
+        """Get hit/miss counters and occupancy of the day forecast cache"""
+        return forecast_cache.stats()
+    
+    @staticmethod
+    def get_feature_cache_stats() -> Dict[str, Any]:
+        """Get reuse count and time saved by the shared feature matrix cache of this process"""
+        return feature_cache.stats()
+    
+    @staticmethod
+    def get_ensemble_weight_cache_stats() -> Dict[str, Any]:
+        """Get hit/miss counters and occupancy of the cached model errors behind the ensemble weights"""
+        return backtest_error_cache.stats()
+    
+    @staticmethod
+    def get_single_flight_stats() -> Dict[str, Any]:
+        """Get the counters of the forecasts and training runs shared by concurrent identical requests"""
+        return {
+            "forecast": forecast_flights.stats(),
+            "training": training_flights.stats(),
+            "training_queue": training_queue.coalescing_stats(),
+        }
+    
+    @staticmethod
+    async def train_model(model: str, custom_name: str, training_data_start_date: str, training_data_end_date: str, hyperparams_dict: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Train a model with given hyperparameters
+        Train a model with given hyperparameters in the current process
         
         Args:
             model: Model type (e.g., 'xgb')
@@ -42,75 +121,13 @@ class ModelService:
             hyperparams_dict: Dictionary of hyperparameters
             
         Returns:
-            Status message
+            Dict with MAE/RMSE per data split of the trained model. Identical calls made while
+            the run is in progress get the result of that run instead of training again.
         """
-        pd.options.plotting.backend = 'plotly'
-        pj = dict(
-            id=101,
-            model='xgb',
-            forecast_type="demand",
-            horizon_minutes=120,
-            resolution_minutes=60,
-            name="xgb_poc_1",
-            save_train_forecasts=True,
-            ignore_existing_models=True,
-            model_kwargs={
-                "learning_rate": float(hyperparams_dict['learning_rate']),
-                "early_stopping_rounds": int(hyperparams_dict['early_stopping_rounds']),
-                "n_estimators": int(hyperparams_dict['n_estimators'])
-            },
-            quantiles=[0.1, 0.5, 0.9]
-        )
-
-        pj = PredictionJobDataClass(**pj)
-
-        input_data = pd.read_csv(TRAINING_DATA_PATH, index_col=0, parse_dates=True)
-
-        # dropping columns as we want
-        input_data = input_data.drop(columns=["date_time_com", "forecasted_load"])
-
-        pd.options.display.max_columns = None
-        logger.debug(f"Input data head:\n{input_data.head()}")
-
-        # Filter data based on provided date range
-        start_date = create_utc_datetime(training_data_start_date, 0)
-        end_date = create_utc_datetime(training_data_end_date, 23)
-        
-        # Filter the input data to the specified date range
-        train_data = input_data[(input_data.index >= start_date) & (input_data.index <= end_date)]
-
-        logger.info(f"Training data starting hour: {train_data.head(1).index}")
-        logger.info(f"Training data ending hour: {train_data.tail(1).index}")
-        logger.info(f"Training data filtered from {training_data_start_date} to {training_data_end_date}")
-
-        train_data = train_data[~train_data.index.duplicated(keep='first')]
-
-        # Remove rows with NaT in the index
-        train_data = train_data[train_data.index.notna()]
-
-        path_to_create = f"./{PARENT_DIR}/{custom_name}/"
-
-        try:
-            os.makedirs(path_to_create, exist_ok=True)
-            logger.info(f"Directory structure '{path_to_create}' created successfully.")
-        except OSError as e:
-            logger.error(f"Error creating directory structure: {e}")
-        
-        # storing pj for using later
-        dictionary_path = f"./{PARENT_DIR}/{custom_name}/pj.pkl"
-        with open(dictionary_path, "wb") as file:
-            pickle.dump(pj, file, protocol=pickle.HIGHEST_PROTOCOL) 
-
-        mlflow_tracking_uri = f"{PARENT_DIR}/{custom_name}/mlflow_trained_models"
-
-        train_data, validation_data, test_data = train_model_pipeline(
-            pj,
-            train_data,
-            check_old_model_age=False,
-            mlflow_tracking_uri=mlflow_tracking_uri,
-            artifact_folder=f"{PARENT_DIR}/{custom_name}/mlflow_artifacts",
-        )
-        return "hello"
+        key = _training_flight_key(model, custom_name, training_data_start_date, training_data_end_date, hyperparams_dict)
+        return await training_flights.run(key, lambda: asyncio.to_thread(
+            _train_model, model, custom_name, training_data_start_date, training_data_end_date, hyperparams_dict
+        ))
     
     @staticmethod
     async def forecast_from_model(custom_name: str, date: str, hour: int) -> Dict[str, Any]:
@@ -125,48 +142,59 @@ class ModelService:
         Returns:
             Dict containing timestamp, forecast value, and custom_name
         """
-        input_data = pd.read_csv(TRAINING_DATA_PATH, index_col=0, parse_dates=True)
-
+        # Counted to pick the models loaded at startup
+        model_usage.record([custom_name])
         
-        traing_data_last_index = input_data.index.get_loc(calculate_previous_hr_of_forecast(date, hour))
-        # checking if the limit of test data matches our expectation
-        test_data = input_data.iloc[traing_data_last_index+1:traing_data_last_index+25]
-        logger.info(f"Test data starting hour: {test_data.head(1).index}")
-        logger.info(f"Test data ending hour: {test_data.tail(1).index}")
+        # Version and data of the same state, so a cached forecast is always keyed by the data it was made from
+        data_version, input_data = _master_data()
 
-        # Prepare data to make the forecast.
-        realised = input_data.loc[test_data.index, 'load'].copy(deep=True)
-        to_forecast_data = input_data.copy(deep=True)
-        to_forecast_data.loc[test_data.index, 'load'] = np.nan  # clear the load data for the part you want to forecast    
-        
-        # Remove duplicate index values from train_data
-        to_forecast_data = to_forecast_data[~to_forecast_data.index.duplicated(keep='first')]
-        # Remove rows with NaT in the index
-        to_forecast_data = to_forecast_data[to_forecast_data.index.notna()]
-        
-        # storing pj for using later
-        dictionary_path = f"./{PARENT_DIR}/{custom_name}/pj.pkl"
-        with open(dictionary_path, "rb") as file:
-            pj = pickle.load(file)
+        # Reuse the already deserialized pj and model when available
+        loaded = _load_model(custom_name)
 
-        mlflow_tracking_uri = f"{PARENT_DIR}/{custom_name}/mlflow_trained_models"
+        forecast = forecast_cache.get(custom_name, loaded.version, date, data_version)
+        if forecast is None:
+            async def run_model() -> pd.DataFrame:
+                # Forecast the whole day in one pipeline run, so the other hours of it are served from the cache
+                traing_data_last_index = input_data.index.get_loc(calculate_previous_hr_of_forecast(date, 0))
+                # checking if the limit of test data matches our expectation
+                test_data = input_data.iloc[traing_data_last_index+1:traing_data_last_index+25]
+                logger.info(f"Test data starting hour: {test_data.head(1).index}")
+                logger.info(f"Test data ending hour: {test_data.tail(1).index}")
 
-        forecast = create_forecast_pipeline(
-            pj,
-            to_forecast_data,
-            mlflow_tracking_uri,
-        )
+                # Prepare data to make the forecast, with the load cleared for the part you want to forecast
+                to_forecast_data = _prepare_forecast_input(input_data, traing_data_last_index+1, loaded.lookback)
 
-        logger.info(f"Forecast results:\n{forecast}")
+                # In a thread, so the event loop keeps accepting the requests that join this flight.
+                # Only the copied window goes there: the master data stays with the event loop.
+                forecast = await asyncio.to_thread(
+                    forecast_with_shared_features,
+                    feature_cache,
+                    loaded,
+                    to_forecast_data,
+                    _input_key(data_version, to_forecast_data),
+                    model_name=custom_name,
+                )
+                logger.info(f"Forecast results:\n{forecast}")
 
-        # Create the time index using the utility method
-        forecast_timestamp = create_utc_datetime(date, hour)
+                forecast = _day_forecast(forecast, test_data.index)
+                forecast_cache.put(custom_name, loaded.version, date, data_version, forecast)
+                await asyncio.to_thread(dashboard_metrics.record_forecast, custom_name, forecast, loaded.version)
+                return forecast
+            
+            # Shares the pipeline run of a concurrent request for the same model and day
+            key = _forecast_flight_key(custom_name, {custom_name: loaded.version}, date, data_version)
+            forecast = await forecast_flights.run(key, run_model)
+        else:
+            logger.info(f"Serving forecast of {custom_name} for {date} from cache")
+
+        # Hours of the day and their labels are shared with the other forecast responses
+        hours, timestamps = _day_hours(date)
         
-        forecast_value = forecast.loc[forecast_timestamp, 'forecast']
+        forecast_value = forecast.loc[hours[hour], 'forecast']
         
         # Return the required JSON structure
         result = {
-            "timestamp": create_utc_datetime(date, hour, timezone(timedelta(hours=6))).isoformat(),
+            "timestamp": timestamps[hour],
             "forecast": float(forecast_value),
             "custom_name": custom_name
         }
@@ -175,121 +203,1023 @@ class ModelService:
         return result
     
     @staticmethod
-    async def forecast_from_mulitple_models(custom_names: List[str], date: str) -> Dict[str, Any]:
+    async def forecast_from_mulitple_models(custom_names: List[str], date: str, parallel: bool = False, columnar: bool = False) -> Dict[str, Any]:
         """
         Create forecasts from multiple trained models for 24 hours (0-23)
         
         Args:
             custom_names: List of trained model names
             date: Date string in format 'YYYY-MM-DD'
+            parallel: Run the models in the forecast process pool instead of one after another
+            columnar: Return the compact layout instead of one record per hour
             
         Returns:
-            Dict with 'all_forecasts' key containing list of model forecasts
+            Dict with 'all_forecasts' key containing list of model forecasts, in the order of
+            custom_names. A model that failed has an 'error' and no forecasts.
+            The columnar layout has 'timestamps' and 'actual_loads' lists, 'forecasts' with one list
+            per model aligned to the timestamps and 'errors' for models that failed, like forecast_date_range.
         """
+        model_usage.record(custom_names)
+        
         # Load input data and prepare dataframe with NaN for 24 hours
-        input_data = pd.read_csv(TRAINING_DATA_PATH, index_col=0, parse_dates=True)
+        data_version, input_data = _master_data()
+        forecast_dfs = await _day_forecasts_of_models(custom_names, date, data_version, input_data, parallel)
         
-        # Calculate the start of the 24-hour forecast period (hour 0 of the given date)
-        forecast_start_datetime = create_utc_datetime(date, 0)
+        # Extract actual load data for the 24 hours (if available)
+        build_start = time.perf_counter()
+        actual_loads = _actual_loads(data_version, input_data, date, columnar)
+        all_forecasts = [
+            _model_result(custom_name, forecast_df, date, columnar)
+            for custom_name, forecast_df in zip(custom_names, forecast_dfs)
+        ]
+        if columnar:
+            result = {
+                "date": date,
+                **actual_loads,
+                "forecasts": {entry["custom_name"]: entry["forecast"] for entry in all_forecasts if "error" not in entry},
+                "errors": {entry["custom_name"]: entry["error"] for entry in all_forecasts if "error" in entry},
+            }
+        else:
+            result = {"all_forecasts": all_forecasts, **actual_loads}
+        record_stage("response_build", time.perf_counter() - build_start)
+        logger.info(f"Completed forecasts for all {len(custom_names)} models")
+        return result
+    
+    @staticmethod
+    async def stream_forecasts_from_multiple_models(custom_names: List[str], date: str, parallel: bool = False, columnar: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Create the forecasts of forecast_from_mulitple_models, yielding each model's result as soon as it is ready
         
-        # Get the index of the hour before the forecast period starts
+        Args:
+            custom_names: List of trained model names
+            date: Date string in format 'YYYY-MM-DD'
+            parallel: Run the models in the forecast process pool instead of one after another
+            columnar: Send the 'timestamps' once in the first event and only the values of each model
+            
+        Yields:
+            An 'actual_loads' event first, then a 'model_forecast' event per model in the order the
+            models finish (cached ones first) with the fields of an 'all_forecasts' entry, and a final
+            'done' event. Every event has its type in the 'event' key.
+        """
+        model_usage.record(custom_names)
+        data_version, input_data = _master_data()
         traing_data_last_index = input_data.index.get_loc(calculate_previous_hr_of_forecast(date, 0))
-        
-        # Get the 24 hours we want to forecast (from hour 0 to hour 23 of the given date)
         test_data = input_data.iloc[traing_data_last_index+1:traing_data_last_index+25]
-        logger.info(f"Test data starting hour: {test_data.head(1).index}")
-        logger.info(f"Test data ending hour: {test_data.tail(1).index}")
-        
-        # Prepare data to make the forecast - set load values to NaN for the 24 hours
-        to_forecast_data = input_data.copy(deep=True)
-        to_forecast_data.loc[test_data.index, 'load'] = np.nan
         
-        # Remove duplicate index values and NaT
-        to_forecast_data = to_forecast_data[~to_forecast_data.index.duplicated(keep='first')]
-        to_forecast_data = to_forecast_data[to_forecast_data.index.notna()]
+        yield {"event": "actual_loads", "date": date, "models": custom_names, **_actual_loads(data_version, input_data, date, columnar)}
         
-        all_forecasts = []
-        
-        # Extract actual load data for the 24 hours (if available)
-        actual_loads = []
-        for hour in range(24):
-            forecast_timestamp = create_utc_datetime(date, hour)
-            # Check if this timestamp exists in the input data
-            if forecast_timestamp in input_data.index:
-                actual_load = input_data.loc[forecast_timestamp, 'load']
-                actual_loads.append({
-                    "timestamp": create_utc_datetime(date, hour, timezone(timedelta(hours=6))).isoformat(),
-                    "load": float(actual_load) if pd.notna(actual_load) else None
-                })
+        forecast_dfs, model_versions, lookbacks = _cached_day_forecasts(custom_names, date, data_version)
+        run_names = []
+        for custom_name, forecast_df in zip(custom_names, forecast_dfs):
+            if forecast_df is None:
+                run_names.append(custom_name)
             else:
-                actual_loads.append({
-                    "timestamp": create_utc_datetime(date, hour, timezone(timedelta(hours=6))).isoformat(),
-                    "load": None
-                })
+                yield {"event": "model_forecast", **_model_result(custom_name, forecast_df, date, columnar)}
+        logger.info(f"{len(custom_names) - len(run_names)} of {len(custom_names)} forecasts served from cache")
         
-        # Loop through each model sequentially
-        for custom_name in custom_names:
-            logger.info(f"Starting forecast for model: {custom_name}")
+        if run_names:
+            lookback = max(lookbacks, default=timedelta(0))
+            to_forecast_data = _prepare_forecast_input(input_data, traing_data_last_index+1, lookback)
+            input_key = _input_key(data_version, to_forecast_data)
+            # Models another request is already forecasting for this day are awaited instead of run again
+            keys = {custom_name: _forecast_flight_key(custom_name, model_versions, date, data_version) for custom_name in run_names}
+            claims = [(custom_name, *forecast_flights.claim(keys[custom_name])) for custom_name in run_names]
+            led_names = [custom_name for custom_name, _, leader in claims if leader]
+            joined = {asyncio.shield(future): custom_name for custom_name, future, leader in claims if not leader}
+            resolved = set()
+            try:
+                async for custom_name, forecast_df in _forecast_24_hours_as_completed(led_names, to_forecast_data, input_key, parallel):
+                    forecast_df = await _store_day_forecast(custom_name, forecast_df, test_data.index, date, data_version, model_versions)
+                    forecast_flights.resolve(keys[custom_name], forecast_df)
+                    resolved.add(custom_name)
+                    yield {"event": "model_forecast", **_model_result(custom_name, forecast_df, date, columnar)}
+            finally:
+                # The client went away: release the requests waiting for the models not done yet
+                for custom_name in set(led_names) - resolved:
+                    forecast_flights.resolve(keys[custom_name], asyncio.CancelledError())
             
-            # Get 24-hour forecasts from this model
-            forecast_df = _forecast_24_hours(custom_name, to_forecast_data)
+            pending = set(joined)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    forecast_df = future.exception() or future.result()
+                    yield {"event": "model_forecast", **_model_result(joined[future], forecast_df, date, columnar)}
+        
+        logger.info(f"Streamed forecasts for all {len(custom_names)} models")
+        yield {"event": "done", "models": len(custom_names)}
+    
+    @staticmethod
+    async def forecast_date_range(custom_names: List[str], start_date: str, end_date: str) -> Dict[str, Any]:
+        """
+        Create 24-hour forecasts of every day from start_date to end_date for multiple models
+        
+        Each day is forecast as forecast_from_mulitple_models would, with that day's load
+        unknown, but the features of each model are built once for the whole range.
+        
+        Args:
+            custom_names: List of trained model names
+            start_date: First date in format 'YYYY-MM-DD'
+            end_date: Last date (inclusive) in format 'YYYY-MM-DD'
             
-            # Format the forecasts for all 24 hours
-            model_forecasts = []
-            for hour in range(24):
-                forecast_timestamp = create_utc_datetime(date, hour)
-                forecast_value = forecast_df.loc[forecast_timestamp, 'forecast']
-                
-                forecast_result = {
-                    "timestamp": create_utc_datetime(date, hour, timezone(timedelta(hours=6))).isoformat(),
-                    "forecast": float(forecast_value)
-                }
-                model_forecasts.append(forecast_result)
+        Returns:
+            Columnar dict: 'timestamps' and 'actual_loads' lists, 'forecasts' with one list per
+            model aligned to the timestamps, and 'errors' for models that failed
+        """
+        days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+        if days < 1:
+            raise ValueError("end_date must not be before start_date")
+        if days > FORECAST_RANGE_MAX_DAYS:
+            raise ValueError(f"At most {FORECAST_RANGE_MAX_DAYS} days can be forecast at once")
+        
+        model_usage.record(custom_names)
+        _, input_data = _master_data()
+        
+        first_forecast_index = input_data.index.get_loc(calculate_previous_hr_of_forecast(start_date, 0)) + 1
+        forecast_end_index = input_data.index.get_loc(create_utc_datetime(end_date, FORECAST_HOURS - 1)) + 1
+        forecast_index = input_data.index[first_forecast_index:forecast_end_index]
+        logger.info(f"Range forecast of {days} days ({len(forecast_index)} hours) for models: {custom_names}")
+        
+        forecasts = {}
+        errors = {}
+        for custom_name in custom_names:
+            try:
+                with stage_timer("range_forecast", custom_name):
+                    forecast = _forecast_date_range(custom_name, input_data, first_forecast_index, forecast_end_index)
+            except Exception as e:
+                logger.exception(f"Range forecast failed for model: {custom_name}")
+                errors[custom_name] = str(e) or type(e).__name__
+                continue
+            await asyncio.to_thread(dashboard_metrics.record_forecast, custom_name, forecast, _load_model(custom_name).version)
+            forecasts[custom_name] = nullable_lists(forecast['forecast'].reindex(forecast_index))
+        
+        with stage_timer("response_build"):
+            # Same labelling as the other forecast endpoints: the UTC hour with a +06:00 suffix
+            timestamps = forecast_index.tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S+06:00').tolist()
+            actual_loads = nullable_lists(input_data['load'].iloc[first_forecast_index:forecast_end_index])
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "timestamps": timestamps,
+            "actual_loads": actual_loads,
+            "forecasts": forecasts,
+            "errors": errors,
+        }
+
+    @staticmethod
+    async def forecast_ensemble(custom_names: List[str], date: str, weighting: str = "error", parallel: bool = False) -> Dict[str, Any]:
+        """
+        Forecast a day with several models and combine them into an ensemble
+        
+        The day forecasts of the models (with their quantiles) are stacked into one
+        models x hours x columns array and combined with NumPy, see ensemble.combine().
+        Error weighting uses the inverse MSE of every model over the ENSEMBLE_WEIGHT_DAYS
+        days with actual load before the date, falling back to equal weights when a
+        model has no error there.
+        
+        Args:
+            custom_names: List of trained model names
+            date: Date string in format 'YYYY-MM-DD'
+            weighting: 'equal' or 'error'
+            parallel: Run the models in the forecast process pool instead of one after another
             
-            # Store the model name and its 24-hour forecasts
-            model_result = {
-                "custom_name": custom_name,
-                "model_forecasts": model_forecasts
+        Returns:
+            Columnar dict: 'timestamps' and 'actual_loads' lists, 'models' with the forecast and
+            quantile lists of every model, 'ensemble' with the combined lists plus 'stdev',
+            'spread', 'min' and 'max', the 'weights' used and 'errors' for models that failed
+        """
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting}, use one of {list(WEIGHTINGS)}")
+        model_usage.record(custom_names)
+        data_version, input_data = _master_data()
+        forecast_dfs = await _day_forecasts_of_models(custom_names, date, data_version, input_data, parallel)
+        
+        errors = {}
+        names, frames = [], []
+        for custom_name, forecast_df in zip(custom_names, forecast_dfs):
+            if isinstance(forecast_df, Exception):
+                logger.error(f"Forecast failed for model {custom_name}: {forecast_df!r}")
+                errors[custom_name] = str(forecast_df) or type(forecast_df).__name__
+            else:
+                names.append(custom_name)
+                frames.append(forecast_df)
+        
+        result = {
+            "date": date,
+            "weighting": weighting,
+            **_actual_loads(data_version, input_data, date, columnar=True),
+            "models": {},
+            "ensemble": None,
+            "weights": {},
+            "errors": errors,
+        }
+        if not frames:
+            return result
+        
+        weights = None
+        if weighting == "error":
+            with stage_timer("ensemble_weights"):
+                # In a thread like the drift check: models without a cached error run the
+                # pipeline over ENSEMBLE_WEIGHT_DAYS days
+                backtest = await asyncio.to_thread(_ensemble_backtest_errors, names, date, data_version, input_data)
+            result["weight_errors"] = backtest
+            weights = error_weights(np.array([
+                backtest[custom_name]["rmse"] ** 2 if backtest[custom_name]["rmse"] is not None else np.nan
+                for custom_name in names
+            ]))
+            if weights is None:
+                logger.info(f"No recent error for every model of the ensemble, weighting {names} equally")
+                result["weighting"] = "equal"
+        if weights is None:
+            weights = np.full(len(names), 1.0 / len(names))
+        
+        with stage_timer("ensemble"):
+            columns = ["forecast", "stdev", *quantile_columns(frames)]
+            stacked = stack_forecasts(frames, _day_hours(date)[0], columns)
+            ensemble = combine(stacked, columns, weights)
+        
+        with stage_timer("response_build"):
+            result["models"] = {
+                custom_name: {column: nullable_lists(stacked[position, :, index]) for index, column in enumerate(columns)}
+                for position, custom_name in enumerate(names)
             }
-            all_forecasts.append(model_result)
-            logger.info(f"Completed forecast for model: {custom_name}")
+            result["ensemble"] = {column: nullable_lists(values) for column, values in ensemble.items()}
+            result["weights"] = dict(zip(names, weights.tolist()))
+        logger.info(f"Ensemble of {len(names)} models for {date} with {result['weighting']} weights")
+        return result
+
+def _train_model(model: str, custom_name: str, training_data_start_date: str, training_data_end_date: str, hyperparams_dict: Dict[str, Any], progress: Optional[Callable[[str, float], None]] = None, train_data: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    Train a model with given hyperparameters
+    
+    Args:
+        model: Model type ('xgb' or 'lgb')
+        custom_name: Custom name for the model
+        training_data_start_date: Start date for training data
+        training_data_end_date: End date for training data
+        hyperparams_dict: Dictionary of hyperparameters, see MODEL_HYPERPARAMETERS
+        progress: Optional callback receiving a stage name and a fraction between 0 and 1
+        train_data: Training window already selected with training_data_frame(), e.g. shared by a sweep
         
-        logger.info(f"Completed forecasts for all {len(custom_names)} models")
-        return {
-            "all_forecasts": all_forecasts,
-            "actual_loads": actual_loads
+    Returns:
+        Dict with MAE/RMSE per data split of the trained model
+    """
+    _report_progress(progress, "preparing data", 0.05)
+    pd.options.plotting.backend = 'plotly'
+    pj = dict(
+        id=101,
+        model=model,
+        forecast_type="demand",
+        horizon_minutes=120,
+        resolution_minutes=60,
+        name=f"{model}_poc_1",
+        save_train_forecasts=True,
+        ignore_existing_models=True,
+        model_kwargs=_model_kwargs(model, hyperparams_dict),
+        quantiles=[0.1, 0.5, 0.9]
+    )
+
+    # The training pipeline pulls in mlflow and the regressors, only import it when a model is trained
+    from openstef.data_classes.prediction_job import PredictionJobDataClass
+    from openstef.pipeline.train_model import train_model_pipeline
+
+    pj = PredictionJobDataClass(**pj)
+
+    if train_data is None:
+        with stage_timer("training_data"):
+            train_data = training_data_frame(training_data_start_date, training_data_end_date)
+
+    logger.info(f"Training data starting hour: {train_data.head(1).index}")
+    logger.info(f"Training data ending hour: {train_data.tail(1).index}")
+    logger.info(f"Training data filtered from {training_data_start_date} to {training_data_end_date}")
+
+    path_to_create = f"./{PARENT_DIR}/{custom_name}/"
+
+    try:
+        os.makedirs(path_to_create, exist_ok=True)
+        logger.info(f"Directory structure '{path_to_create}' created successfully.")
+    except OSError as e:
+        logger.error(f"Error creating directory structure: {e}")
+    
+    mlflow_tracking_uri = f"{PARENT_DIR}/{custom_name}/mlflow_trained_models"
+
+    # Workers of other processes keep serving their cached model until the new one is complete
+    with file_lock(model_lock_path(PARENT_DIR, custom_name)):
+        # storing pj for using later, replaced atomically so it is never read half-written
+        dictionary_path = f"./{PARENT_DIR}/{custom_name}/pj.pkl"
+        with open(f"{dictionary_path}.tmp", "wb") as file:
+            pickle.dump(pj, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{dictionary_path}.tmp", dictionary_path)
+
+        _report_progress(progress, "training", 0.2)
+        with stage_timer("train_pipeline", custom_name):
+            train_data, validation_data, test_data = train_model_pipeline(
+                pj,
+                train_data,
+                check_old_model_age=False,
+                mlflow_tracking_uri=mlflow_tracking_uri,
+                artifact_folder=f"{PARENT_DIR}/{custom_name}/mlflow_artifacts",
+            )
+
+        # A failed export or cleanup leaves a usable model, forecasts fall back to the MLflow store
+        try:
+            with stage_timer("refresh_artifacts", custom_name):
+                artifacts = refresh_artifacts(os.path.join(PARENT_DIR, custom_name), str(pj["id"]))
+            logger.info(f"Model artifacts of {custom_name}: {artifacts}")
+        except Exception:
+            logger.exception(f"Could not export or prune the artifacts of {custom_name}")
+    invalidate_model(custom_name)
+
+    metrics = _evaluation_metrics(train_data, validation_data, test_data)
+    _report_progress(progress, "finished", 1.0)
+    logger.info(f"Training finished for {custom_name}: {metrics}")
+    return metrics
+
+def _retrain_model_incremental(custom_name: str, training_data_start_date: str, training_data_end_date: str, rounds: int = RETRAIN_ROUNDS, progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    """
+    Continue training the current booster of a model on a recent window
+
+    Runs openstef's training steps (validation, features, split, confidence
+    intervals, report) like train_model_pipeline, but fits at most `rounds`
+    additional trees on top of the current booster instead of a new model. The
+    result is stored as a new MLflow run, so the previous version stays
+    available for rollback_model().
+
+    Args:
+        custom_name: Name of the trained model
+        training_data_start_date: Start date of the recent window
+        training_data_end_date: End date of the recent window (inclusive)
+        rounds: Maximum number of trees added, early stopping may add fewer
+        progress: Optional callback receiving a stage name and a fraction between 0 and 1
+
+    Returns:
+        Dict with MAE/RMSE per data split, the trees before and after and the base run
+
+    Raises:
+        ValueError: If the model type cannot be warm-started or its features changed
+    """
+    from openstef.metrics.reporter import Reporter
+    from openstef.model.model_creator import ModelCreator
+    from openstef.model.serializer import MLflowSerializer
+    from openstef.model.standard_deviation_generator import StandardDeviationGenerator
+    from openstef.pipeline.train_model import (
+        DEFAULT_EARLY_STOPPING_ROUNDS,
+        DEFAULT_TRAIN_HORIZONS_HOURS,
+        train_pipeline_step_compute_features,
+        train_pipeline_step_split_data,
+    )
+    from lightgbm import LGBMModel
+    from xgboost import XGBModel
+
+    _report_progress(progress, "preparing data", 0.05)
+    model_dir = os.path.join(PARENT_DIR, custom_name)
+    with file_lock(model_lock_path(PARENT_DIR, custom_name)):
+        current = model_cache.get(custom_name)
+        # The specs are updated for the new run, keep the cached ones intact
+        pj, old_model, model_specs = current.pj, current.model, copy.deepcopy(current.model_specs)
+        if isinstance(old_model, XGBModel):
+            init = {"xgb_model": old_model.get_booster()}
+            trees_before = old_model.get_booster().num_boosted_rounds()
+        elif isinstance(old_model, LGBMModel):
+            init = {"init_model": old_model.booster_}
+            trees_before = old_model.booster_.current_iteration()
+        else:
+            raise ValueError(f"Model {custom_name} ({type(old_model).__name__}) cannot be retrained incrementally")
+        base_run = active_version(model_versions(model_dir))
+
+        with stage_timer("training_data"):
+            train_data = training_data_frame(training_data_start_date, training_data_end_date)
+        horizons = DEFAULT_TRAIN_HORIZONS_HOURS if pj.train_horizons_minutes is None else [
+            horizon_minutes / 60 for horizon_minutes in pj.train_horizons_minutes
+        ]
+        with stage_timer("retrain_features", custom_name):
+            data_with_features = train_pipeline_step_compute_features(pj=pj, model_specs=model_specs, input_data=train_data, horizons=horizons)
+            train_data, validation_data, test_data, _ = train_pipeline_step_split_data(data_with_features=data_with_features, pj=pj, test_fraction=0.0)
+
+        # The booster continues with the columns it was trained on, in the same order
+        feature_names = list(old_model.feature_names)
+        missing = [name for name in feature_names if name not in train_data.columns]
+        if missing:
+            raise ValueError(f"Features of {custom_name} changed, train it from scratch: {missing[:5]}")
+        columns = ["load", *feature_names, "horizon"]
+        train_data, validation_data, test_data = (data[columns] for data in (train_data, validation_data, test_data))
+
+        _report_progress(progress, "training", 0.3)
+        model = ModelCreator.create_model(pj["model"], quantiles=pj["quantiles"], **(pj.model_kwargs or {}))
+        params = {"n_estimators": rounds}
+        if "early_stopping_rounds" in model.get_params():
+            params["early_stopping_rounds"] = DEFAULT_EARLY_STOPPING_ROUNDS
+        model.set_params(**params)
+        with stage_timer("retrain_fit", custom_name):
+            model.fit(
+                train_data.iloc[:, 1:-1],
+                train_data.iloc[:, 0],
+                eval_set=[(train_data.iloc[:, 1:-1], train_data.iloc[:, 0]), (validation_data.iloc[:, 1:-1], validation_data.iloc[:, 0])],
+                **init,
+            )
+        model.feature_importance_dataframe = model.get_feature_importance()
+        model = StandardDeviationGenerator(validation_data).generate_standard_deviation_data(model)
+
+        _report_progress(progress, "storing", 0.8)
+        report = Reporter(train_data, validation_data, test_data, pj.quantiles).generate_report(model)
+        # Same in-sample forecasts and feature list as train_model_pipeline with save_train_forecasts
+        train_data, validation_data, test_data = (
+            data.assign(forecast=model.predict(data.iloc[:, 1:-1]) if not data.empty else np.nan)
+            for data in (train_data, validation_data, test_data)
+        )
+        model_specs.feature_names = list(train_data.columns)
+        MLflowSerializer(mlflow_tracking_uri=f"{PARENT_DIR}/{custom_name}/mlflow_trained_models").save_model(
+            model=model, experiment_name=str(pj["id"]), model_type=pj["model"], model_specs=model_specs, report=report,
+        )
+
+        try:
+            with stage_timer("refresh_artifacts", custom_name):
+                artifacts = refresh_artifacts(model_dir, str(pj["id"]))
+            logger.info(f"Model artifacts of {custom_name}: {artifacts}")
+        except Exception:
+            logger.exception(f"Could not export or prune the artifacts of {custom_name}")
+    invalidate_model(custom_name)
+
+    trees_after = model.get_booster().num_boosted_rounds() if isinstance(model, XGBModel) else model.booster_.current_iteration()
+    metrics = {
+        **_evaluation_metrics(train_data, validation_data, test_data),
+        "mode": "incremental",
+        "base_run": base_run["run_id"] if base_run else None,
+        "trees_before": trees_before,
+        "trees_after": trees_after,
+    }
+    _report_progress(progress, "finished", 1.0)
+    logger.info(f"Incremental retraining finished for {custom_name}: {metrics}")
+    return metrics
+
+def rollback_model(custom_name: str) -> Dict[str, Any]:
+    """
+    Make the previous version of a model active again, e.g. after a retrain made it worse
+
+    The active MLflow run is marked as deleted, so the previous finished run is
+    loaded again; it is removed with the next pruning.
+
+    Args:
+        custom_name: Name of the trained model
+
+    Returns:
+        Dict with the run that was rolled back and the run that is active now
+
+    Raises:
+        ValueError: If the model has no previous version
+    """
+    model_dir = os.path.join(PARENT_DIR, custom_name)
+    with file_lock(model_lock_path(PARENT_DIR, custom_name)):
+        with open(os.path.join(model_dir, "pj.pkl"), "rb") as file:
+            pj = pickle.load(file)
+        result = rollback_version(model_dir, str(pj["id"]))
+    invalidate_model(custom_name)
+    logger.info(f"Rolled back model {custom_name}: {result}")
+    return {"custom_name": custom_name, **result}
+
+def invalidate_model(custom_name: str) -> None:
+    """Drop the cached model and its cached forecasts and dashboard metrics, e.g. after it has been retrained"""
+    model_cache.invalidate(custom_name)
+    forecast_cache.invalidate_model(custom_name)
+    backtest_error_cache.invalidate_model(custom_name)
+    dashboard_metrics.drop_model(custom_name)
+
+def training_data_frame(training_data_start_date: str, training_data_end_date: str) -> pd.DataFrame:
+    """
+    Select the master data used to train a model
+    
+    Args:
+        training_data_start_date: Start date for training data
+        training_data_end_date: End date for training data (inclusive)
+        
+    Returns:
+        Master data rows of the date range, without the columns that are not model inputs
+    """
+    input_data = master_data_store.get()
+
+    # dropping columns as we want
+    input_data = input_data.drop(columns=["date_time_com", "forecasted_load"], errors="ignore")
+
+    pd.options.display.max_columns = None
+    logger.debug(f"Input data head:\n{input_data.head()}")
+
+    # Filter data based on provided date range
+    start_date = create_utc_datetime(training_data_start_date, 0)
+    end_date = create_utc_datetime(training_data_end_date, 23)
+    
+    # Filter the input data to the specified date range
+    return input_data[(input_data.index >= start_date) & (input_data.index <= end_date)]
+
+def _model_kwargs(model: str, hyperparams_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert the hyperparameters of a model type to its regressor arguments, ignoring unknown ones"""
+    if model not in MODEL_HYPERPARAMETERS:
+        raise ValueError(f"Unsupported model type: {model}")
+    return {
+        name: cast(hyperparams_dict[name])
+        for name, cast in MODEL_HYPERPARAMETERS[model].items()
+        if hyperparams_dict.get(name) is not None
+    }
+
+def _report_progress(progress: Optional[Callable[[str, float], None]], stage: str, fraction: float) -> None:
+    """Forward a progress update to the callback, if one was given"""
+    if progress is not None:
+        progress(stage, fraction)
+
+def _evaluation_metrics(*data_sets: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Compute MAE and RMSE of the in-sample forecasts returned by train_model_pipeline
+    
+    Args:
+        data_sets: Train, validation and test data with 'load' and 'forecast' columns
+        
+    Returns:
+        Dict keyed by split name with row count, MAE and RMSE
+    """
+    metrics = {}
+    for split, data in zip(("train", "validation", "test"), data_sets):
+        if data is None or 'forecast' not in data.columns:
+            continue
+        valid = data[['load', 'forecast']].dropna()
+        error = (valid['forecast'] - valid['load']).to_numpy()
+        metrics[split] = {
+            "rows": int(len(valid)),
+            "mae": float(np.abs(error).mean()) if len(error) else None,
+            "rmse": float(np.sqrt((error ** 2).mean())) if len(error) else None,
         }
+    return metrics
 
-def _forecast_24_hours(custom_name: str, to_forecast_data: pd.DataFrame) -> pd.DataFrame:
+def _forecast_24_hours(custom_name: str, to_forecast_data: pd.DataFrame, input_key: Hashable) -> pd.DataFrame:
     """
     Generate 24-hour forecast for a given model using pre-prepared data with NaN values
     
     Args:
         custom_name: Name of the trained model
         to_forecast_data: DataFrame with NaN values for hours to be predicted
+        input_key: Identifies to_forecast_data, see _input_key()
         
     Returns:
         DataFrame containing forecast results for 24 hours
     """
-    # Load the prediction job configuration
-    dictionary_path = f"./{PARENT_DIR}/{custom_name}/pj.pkl"
-    with open(dictionary_path, "rb") as file:
-        pj = pickle.load(file)
+    # Load the prediction job configuration and model, from the cache when possible
+    loaded = _load_model(custom_name)
     
-    # Set up MLflow tracking URI
-    mlflow_tracking_uri = f"{PARENT_DIR}/{custom_name}/mlflow_trained_models"
-    
-    # Create forecast pipeline
-    forecast = create_forecast_pipeline(
-        pj,
-        to_forecast_data,
-        mlflow_tracking_uri,
-    )
+    # Create forecast pipeline, reusing the features of a previous model with the same feature set
+    forecast = forecast_with_shared_features(feature_cache, loaded, to_forecast_data, input_key, model_name=custom_name)
     
     logger.info(f"Forecast results for {custom_name}:\n{forecast}")
     
     return forecast
 
+def _master_data() -> Tuple[str, pd.DataFrame]:
+    """Version and frame of the same state of the master data, timed as one stage"""
+    with stage_timer("master_data"):
+        return master_data_store.snapshot()
+
+def _load_model(custom_name: str) -> LoadedModel:
+    """Get a model from the model cache, timed as a stage of that model"""
+    with stage_timer("model_load", custom_name):
+        return model_cache.get(custom_name)
+
+def _training_flight_key(model: str, custom_name: str, training_data_start_date: str, training_data_end_date: str, hyperparams_dict: Dict[str, Any]) -> Hashable:
+    """Single-flight key of a training run: all its parameters, with the hyperparameters in a canonical order"""
+    return model, custom_name, training_data_start_date, training_data_end_date, json.dumps(hyperparams_dict, sort_keys=True)
+
+def _day_forecast(forecast: pd.DataFrame, day_index: pd.DatetimeIndex) -> pd.DataFrame:
+    """Keep only the forecast rows of the target day, which is what the forecast cache stores"""
+    return forecast.loc[forecast.index.intersection(day_index)].copy()
+
+async def _day_forecasts_of_models(custom_names: List[str], date: str, data_version: str, input_data: pd.DataFrame, parallel: bool) -> List[Any]:
+    """
+    Day forecast of every model, from the cache or from the pipeline
+    
+    Args:
+        custom_names: List of trained model names
+        date: Date string in format 'YYYY-MM-DD'
+        data_version: Version of input_data
+        input_data: Master data
+        parallel: Run the models in the forecast process pool instead of one after another
+        
+    Returns:
+        Day forecast DataFrame or the raised exception for each model, in request order
+    """
+    # Get the index of the hour before the forecast period starts
+    traing_data_last_index = input_data.index.get_loc(calculate_previous_hr_of_forecast(date, 0))
+    
+    # Get the 24 hours we want to forecast (from hour 0 to hour 23 of the given date)
+    test_data = input_data.iloc[traing_data_last_index+1:traing_data_last_index+25]
+    logger.info(f"Test data starting hour: {test_data.head(1).index}")
+    logger.info(f"Test data ending hour: {test_data.tail(1).index}")
+    
+    # Serve models whose forecast for this day is cached, only the others go through the pipeline
+    forecast_dfs, model_versions, lookbacks = _cached_day_forecasts(custom_names, date, data_version)
+    to_run = [position for position, forecast_df in enumerate(forecast_dfs) if forecast_df is None]
+    logger.info(f"{len(custom_names) - len(to_run)} of {len(custom_names)} forecasts served from cache")
+    if not to_run:
+        return forecast_dfs
+    
+    # Prepare data to make the forecast - set load values to NaN for the 24 hours.
+    # The window covers the longest lookback among the models still to run.
+    lookback = max(lookbacks, default=timedelta(0))
+    to_forecast_data = _prepare_forecast_input(input_data, traing_data_last_index+1, lookback)
+    run_names = [custom_names[position] for position in to_run]
+    input_key = _input_key(data_version, to_forecast_data)
+    
+    async def run_models(led: List[int]) -> List[Any]:
+        led_names = [run_names[position] for position in led]
+        if parallel:
+            # Worker stages are only visible on /metrics in multiprocess mode, so time the pool as a whole
+            with stage_timer("forecast_pool"):
+                new_forecasts = await _forecast_24_hours_in_pool(led_names, to_forecast_data, input_key)
+        else:
+            # Loop through each model sequentially, in a thread so the event loop keeps
+            # accepting the requests that join these flights
+            new_forecasts = []
+            for custom_name in led_names:
+                logger.info(f"Starting forecast for model: {custom_name}")
+                try:
+                    new_forecasts.append(await asyncio.to_thread(_forecast_24_hours, custom_name, to_forecast_data, input_key))
+                except Exception as e:
+                    new_forecasts.append(e)
+        return [
+            await _store_day_forecast(custom_name, forecast_df, test_data.index, date, data_version, model_versions)
+            for custom_name, forecast_df in zip(led_names, new_forecasts)
+        ]
+    
+    # Models another request is already forecasting for this day are awaited instead of run again
+    keys = [_forecast_flight_key(custom_name, model_versions, date, data_version) for custom_name in run_names]
+    new_forecasts = await forecast_flights.run_many(keys, run_models)
+    for position, forecast_df in zip(to_run, new_forecasts):
+        forecast_dfs[position] = forecast_df
+    return forecast_dfs
+
+def _cached_day_forecasts(custom_names: List[str], date: str, data_version: str) -> Tuple[List[Any], Dict[str, Any], List[timedelta]]:
+    """
+    Look up the cached day forecast of every model
+    
+    Args:
+        custom_names: List of trained model names
+        date: Date string in format 'YYYY-MM-DD'
+        data_version: Master data version the forecasts must be based on
+        
+    Returns:
+        Cached forecast or None per model, the version of every model that could be loaded,
+        and the lookbacks of the models that still have to be forecast
+    """
+    forecast_dfs: List[Any] = [None] * len(custom_names)
+    model_versions = {}
+    lookbacks = []
+    for position, custom_name in enumerate(custom_names):
+        try:
+            loaded = _load_model(custom_name)
+        except Exception:
+            # Reported for this model when its forecast fails
+            logger.exception(f"Could not load model: {custom_name}")
+            continue
+        model_versions[custom_name] = loaded.version
+        forecast_dfs[position] = forecast_cache.get(custom_name, loaded.version, date, data_version)
+        if forecast_dfs[position] is None:
+            lookbacks.append(loaded.lookback)
+    return forecast_dfs, model_versions, lookbacks
+
+async def _store_day_forecast(custom_name: str, forecast_df: Any, day_index: pd.DatetimeIndex, date: str, data_version: str, model_versions: Dict[str, Any]) -> Any:
+    """Cut a new forecast down to its day and cache it; exceptions of failed models are passed through"""
+    if isinstance(forecast_df, Exception):
+        return forecast_df
+    forecast_df = _day_forecast(forecast_df, day_index)
+    if custom_name in model_versions:
+        forecast_cache.put(custom_name, model_versions[custom_name], date, data_version, forecast_df)
+        # Writes the recorded forecast file, keep that off the event loop
+        await asyncio.to_thread(dashboard_metrics.record_forecast, custom_name, forecast_df, model_versions[custom_name])
+    return forecast_df
+
+def _forecast_flight_key(custom_name: str, model_versions: Dict[str, Any], date: str, data_version: str) -> Hashable:
+    """
+    Single-flight key of the day forecast of a model, the inputs its forecast cache entry is keyed by
+
+    The forecast input window differs with the lookbacks of the models forecast
+    together, but always covers the lookback of the model, so it is left out.
+    """
+    return custom_name, model_versions.get(custom_name), date, data_version
+
+@lru_cache(maxsize=256)
+def _day_hours(date: str) -> Tuple[pd.DatetimeIndex, Tuple[str, ...]]:
+    """
+    The 24 forecast hours of a date and their response labels, formatted once and shared by all models
+    
+    Args:
+        date: Date string in format 'YYYY-MM-DD'
+        
+    Returns:
+        UTC timestamps of hours 0-23 (as create_utc_datetime) and their ISO labels with the +06:00 suffix
+    """
+    hours = pd.date_range(create_utc_datetime(date, 0), periods=FORECAST_HOURS, freq='h')
+    return hours, tuple(hour_timestamps(date))
+
+def _actual_load_values(data_version: str, input_data: pd.DataFrame, date: str) -> List[Optional[float]]:
+    """Actual load of each hour of a day, None where it is missing or the hour is not in the data"""
+    day_index = master_data_store.day_index()
+    if day_index.version != data_version:
+        # The data changed since input_data was taken, index the snapshot itself
+        day_index = DayIndex(input_data, data_version)
+    return nullable_lists(day_index.values([date], ["load"])["load"][0])
+
+def _actual_loads(data_version: str, input_data: pd.DataFrame, date: str, columnar: bool = False) -> Dict[str, Any]:
+    """
+    The 'actual_loads' of a forecast response
+    
+    Returns:
+        Dict with 'actual_loads' as a list of {timestamp, load} records, or with 'timestamps'
+        and the 'actual_loads' values as two lists if columnar
+    """
+    loads = _actual_load_values(data_version, input_data, date)
+    timestamps = _day_hours(date)[1]
+    if columnar:
+        return {"timestamps": list(timestamps), "actual_loads": loads}
+    return {"actual_loads": [{"timestamp": timestamp, "load": load} for timestamp, load in zip(timestamps, loads)]}
+
+def _forecast_values(forecast_df: pd.DataFrame, date: str) -> List[Optional[float]]:
+    """Forecast of hours 0-23 of a date as a list, None for hours the forecast does not cover"""
+    hours = _day_hours(date)[0]
+    forecast = forecast_df['forecast']
+    if len(forecast) == FORECAST_HOURS and np.array_equal(forecast.index.asi8, hours.asi8):
+        values = forecast.to_numpy(dtype=float)
+    else:
+        values = forecast.reindex(hours).to_numpy(dtype=float)
+    return nullable_lists(values)
+
+def _model_result(custom_name: str, forecast_df: Any, date: str, columnar: bool = False) -> Dict[str, Any]:
+    """
+    Format a model's day forecast as an entry of 'all_forecasts'
+    
+    Args:
+        custom_name: Name of the trained model
+        forecast_df: Day forecast, or the exception raised for the model
+        date: Date string in format 'YYYY-MM-DD'
+        columnar: Return the 24 values as 'forecast' instead of {timestamp, forecast} records
+        
+    Returns:
+        Dict with 'custom_name' and the 24 'model_forecasts' (or 'forecast' values), or an 'error' if the model failed
+    """
+    if isinstance(forecast_df, Exception):
+        logger.error(f"Forecast failed for model {custom_name}: {forecast_df!r}")
+        return {
+            "custom_name": custom_name,
+            "forecast" if columnar else "model_forecasts": [],
+            "error": str(forecast_df) or type(forecast_df).__name__
+        }
+    
+    values = _forecast_values(forecast_df, date)
+    logger.info(f"Completed forecast for model: {custom_name}")
+    if columnar:
+        return {"custom_name": custom_name, "forecast": values}
+    # Store the model name and its 24-hour forecasts
+    return {
+        "custom_name": custom_name,
+        "model_forecasts": [
+            {"timestamp": timestamp, "forecast": value}
+            for timestamp, value in zip(_day_hours(date)[1], values)
+        ]
+    }
+
+def _forecast_date_range(custom_name: str, input_data: pd.DataFrame, first_forecast_index: int, forecast_end_index: int) -> pd.DataFrame:
+    """
+    Forecast whole days of one model, in one pass when the model allows it
+    
+    Args:
+        custom_name: Name of the trained model
+        input_data: Master data
+        first_forecast_index: Position of hour 0 of the first day
+        forecast_end_index: Position after hour 23 of the last day
+        
+    Returns:
+        DataFrame with a 'forecast' column for the forecast hours
+    """
+    loaded = _load_model(custom_name)
+    if supports_batch(loaded):
+        window = _history_window(input_data, first_forecast_index, forecast_end_index, loaded.lookback)
+        return forecast_days(loaded, window.copy(deep=True), input_data.index[first_forecast_index:forecast_end_index])
+    
+    logger.info(f"Model {custom_name} cannot be batch forecast, forecasting one day at a time")
+    from openstef.pipeline.create_forecast import create_forecast_pipeline_core
+    day_forecasts = []
+    for day_index in range(first_forecast_index, forecast_end_index, FORECAST_HOURS):
+        to_forecast_data = _prepare_forecast_input(input_data, day_index, loaded.lookback)
+        forecast = create_forecast_pipeline_core(loaded.pj, to_forecast_data, loaded.model, loaded.model_specs)
+        day_forecasts.append(_day_forecast(forecast, input_data.index[day_index:day_index + FORECAST_HOURS]))
+    return pd.concat(day_forecasts)
+
+def model_error(custom_name: str, days: pd.DatetimeIndex, input_data: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    Error of a model over some days, forecasting the days it has no recorded forecast for
+    
+    The error comes from the per-day error aggregates of the dashboard, so only days
+    no endpoint has forecast yet go through the pipeline, in one range forecast.
+    
+    Args:
+        custom_name: Name of the trained model
+        days: UTC days (midnight timestamps)
+        input_data: Master data, the current snapshot if None
+        
+    Returns:
+        Dict as returned by DashboardMetrics.model_error
+    """
+    error = dashboard_metrics.model_error(custom_name, days)
+    missing = error["missing_days"]
+    if not len(missing):
+        return error
+    if input_data is None:
+        _, input_data = master_data_store.snapshot()
+    first, last = str(missing[0].date()), str(missing[-1].date())
+    try:
+        first_forecast_index = input_data.index.get_loc(calculate_previous_hr_of_forecast(first, 0)) + 1
+        forecast_end_index = input_data.index.get_loc(create_utc_datetime(last, FORECAST_HOURS - 1)) + 1
+    except KeyError:
+        # Not enough history before the first day or hours missing at the end
+        logger.info(f"Cannot forecast {first} to {last} for the error of {custom_name}, the master data does not cover it")
+        return error
+    forecast = _forecast_date_range(custom_name, input_data, first_forecast_index, forecast_end_index)
+    dashboard_metrics.record_forecast(custom_name, forecast, _load_model(custom_name).version)
+    return dashboard_metrics.model_error(custom_name, days)
+
+def _ensemble_backtest_errors(custom_names: List[str], date: str, data_version: str, input_data: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """
+    Error of every model over the ENSEMBLE_WEIGHT_DAYS complete days with actual load before a date
+    
+    Returns:
+        Per model: mae, rmse, r2, hours and the first and last day, cached per model and data version
+    """
+    # Last UTC day whose hours all have an actual load row, and not the forecast date itself
+    last_load = input_data['load'].last_valid_index()
+    if last_load is None:
+        return {custom_name: {"mae": None, "rmse": None, "r2": None, "hours": 0} for custom_name in custom_names}
+    last_day = min(
+        (last_load.tz_convert('UTC') + timedelta(hours=1)).normalize() - timedelta(days=1),
+        pd.Timestamp(date, tz='UTC') - timedelta(days=1),
+    )
+    days = pd.date_range(end=last_day, periods=ENSEMBLE_WEIGHT_DAYS, freq='D')
+    
+    errors = {}
+    for custom_name in custom_names:
+        model_version = _load_model(custom_name).version
+        error = backtest_error_cache.get(custom_name, model_version, data_version, days)
+        if error is None:
+            try:
+                measured = model_error(custom_name, days, input_data)
+            except Exception:
+                logger.exception(f"Could not measure the recent error of model: {custom_name}")
+                measured = {"mae": None, "rmse": None, "r2": None, "hours": 0}
+            error = {
+                **{key: measured[key] for key in ("mae", "rmse", "r2", "hours")},
+                "first_day": str(days[0].date()),
+                "last_day": str(days[-1].date()),
+            }
+            backtest_error_cache.put(custom_name, model_version, data_version, days, error)
+        errors[custom_name] = error
+    return errors
+
+def _input_key(data_version: str, to_forecast_data: pd.DataFrame) -> Hashable:
+    """Feature cache key of a forecast input: the rows it spans of a master data version"""
+    index = to_forecast_data.index
+    return data_version, index[0], index[-1], len(index)
+
+def _forecast_24_hours_shared(custom_name: str, shared: SharedFrame, input_key: Hashable) -> pd.DataFrame:
+    """Process pool entry point: forecast from a window published in shared memory"""
+    return _forecast_24_hours(custom_name, read_shared_frame(shared), input_key)
+
+def _submit_forecasts(custom_names: List[str], shared: SharedFrame, input_key: Hashable) -> Tuple[Any, List[asyncio.Future]]:
+    """
+    Submit the forecasts of several models to the forecast process pool
+    
+    A pool that broke while idle is replaced once before giving up.
+    
+    Returns:
+        The pool the tasks run in and one future per model, in the order of custom_names
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = get_executor("forecast", FORECAST_WORKERS)
+        try:
+            return executor, [
+                loop.run_in_executor(executor, _forecast_24_hours_shared, custom_name, shared, input_key)
+                for custom_name in custom_names
+            ]
+        except BrokenProcessPool:
+            discard_executor("forecast", executor)
+            if attempt:
+                raise
+
+async def _forecast_24_hours_in_pool(custom_names: List[str], to_forecast_data: pd.DataFrame, input_key: Hashable) -> List[Any]:
+    """
+    Run _forecast_24_hours for several models in the forecast process pool
+    
+    The window is serialized once into shared memory; each task only receives its handle.
+    Features are shared between the models handled by the same worker process.
+    
+    Args:
+        custom_names: List of trained model names
+        to_forecast_data: DataFrame with NaN values for hours to be predicted
+        input_key: Identifies to_forecast_data, see _input_key()
+        
+    Returns:
+        Forecast DataFrame or the raised exception for each model, in request order
+    """
+    with publish_frame(to_forecast_data) as shared:
+        executor, futures = _submit_forecasts(custom_names, shared, input_key)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+    if any(isinstance(result, BrokenProcessPool) for result in results):
+        # A worker died (e.g. out of memory): its models fail, the next request gets a fresh pool
+        discard_executor("forecast", executor)
+    return results
+
+async def _forecast_24_hours_as_completed(custom_names: List[str], to_forecast_data: pd.DataFrame, input_key: Hashable, parallel: bool) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Run _forecast_24_hours for several models, yielding each result as soon as it is done
+    
+    Args:
+        custom_names: List of trained model names
+        to_forecast_data: DataFrame with NaN values for hours to be predicted
+        input_key: Identifies to_forecast_data, see _input_key()
+        parallel: Run the models in the forecast process pool instead of one after another
+        
+    Yields:
+        Model name with its forecast DataFrame or the raised exception, in completion order
+    """
+    if not parallel:
+        for custom_name in custom_names:
+            logger.info(f"Starting forecast for model: {custom_name}")
+            try:
+                # In a thread, so the event loop keeps accepting the requests that join this forecast
+                forecast = await asyncio.to_thread(_forecast_24_hours, custom_name, to_forecast_data, input_key)
+            except Exception as e:
+                forecast = e
+            yield custom_name, forecast
+        return
+    
+    with publish_frame(to_forecast_data) as shared:
+        executor, submitted = _submit_forecasts(custom_names, shared, input_key)
+        futures = dict(zip(submitted, custom_names))
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    result = future.exception() or future.result()
+                    if isinstance(result, BrokenProcessPool):
+                        discard_executor("forecast", executor)
+                    yield futures[future], result
+        finally:
+            # The client went away: drop the models that have not started yet
+            for future in pending:
+                future.cancel()
+
+def _prepare_forecast_input(input_data: pd.DataFrame, first_forecast_index: int, lookback: timedelta) -> pd.DataFrame:
+    """
+    Copy the rows needed for a forecast and clear the load of the hours to predict
+    
+    In windowed mode only `lookback` of history before the first forecast hour plus
+    the forecast hours are copied, so the cost does not grow with the history length.
+    The pipeline then forecasts exactly those hours instead of everything up to the
+    end of the data.
+    
+    Args:
+        input_data: Master data
+        first_forecast_index: Position of the first hour to forecast
+        lookback: History required by the model's features
+        
+    Returns:
+        DataFrame with NaN load values for the hours to be predicted
+    """
+    forecast_end_index = first_forecast_index + FORECAST_HOURS
+    with stage_timer("prepare_input"):
+        if FORECAST_WINDOWED_INPUT:
+            to_forecast_data = _history_window(input_data, first_forecast_index, forecast_end_index, lookback).copy(deep=True)
+        else:
+            to_forecast_data = input_data.copy(deep=True)
+        
+        forecast_index = input_data.index[first_forecast_index:forecast_end_index]
+        to_forecast_data.loc[forecast_index, 'load'] = np.nan
+    return to_forecast_data
+
+def _history_window(input_data: pd.DataFrame, first_forecast_index: int, forecast_end_index: int, lookback: timedelta) -> pd.DataFrame:
+    """
+    Rows from `lookback` before the first forecast hour up to the last forecast hour
+    
+    Args:
+        input_data: Master data
+        first_forecast_index: Position of the first hour to forecast
+        forecast_end_index: Position after the last hour to forecast
+        lookback: History required by the model's features
+        
+    Returns:
+        The selected rows, not copied if they are contiguous
+    """
+    window_start = input_data.index[first_forecast_index] - lookback
+    window_start_index = input_data.index.searchsorted(window_start)
+    # openstef aligns its daylight feature to the first year of the input, so keep the
+    # first row of the history to get the same features as a full-history run
+    if window_start_index > 0 and input_data.index[0].year != input_data.index[window_start_index].year:
+        return input_data.iloc[np.concatenate(([0], np.arange(window_start_index, forecast_end_index)))]
+    return input_data.iloc[window_start_index:forecast_end_index]
+
 def calculate_previous_hr_of_forecast(date: str, hour: int) -> datetime:
     # Create UTC datetime from date and hour parameters
     # Handle hour adjustment logic: if hour > 0, subtract 1; if hour == 0, go to previous date at hour 23
@@ -0,0 +1,98 @@
+"""Forecast counts per model, used to pick the models that are loaded at startup"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+from typing import Iterable, List
+
+from services.training_queue import TRAINING_JOBS_DB_PATH, _connect, _init_db, _now
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# Counts are written to the database at most this often, and on shutdown
+USAGE_FLUSH_INTERVAL_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_usage (
+    custom_name TEXT PRIMARY KEY,
+    forecasts INTEGER NOT NULL DEFAULT 0,
+    last_used_at TEXT NOT NULL
+)
+"""
+
+
+class ModelUsage:
+    """
+    Number of forecast requests per model, kept in the training jobs database
+
+    Requests only increment an in-memory counter; the counts are added to the
+    database every USAGE_FLUSH_INTERVAL_SECONDS and on shutdown, so every uvicorn
+    worker contributes its own counts and they survive a restart.
+    """
+
+    def __init__(self, db_path: str = TRAINING_JOBS_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+        self._flushed_at = time.monotonic()
+        self._initialized = False
+
+    def record(self, custom_names: Iterable[str]) -> None:
+        """Count one forecast request for each model"""
+        with self._lock:
+            self._pending.update(custom_names)
+            due = time.monotonic() - self._flushed_at >= USAGE_FLUSH_INTERVAL_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Add the counts recorded since the last flush to the database"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            self._ensure_schema()
+            now = _now()
+            with closing(_connect(self.db_path)) as conn, conn:
+                conn.executemany(
+                    "INSERT INTO model_usage (custom_name, forecasts, last_used_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(custom_name) DO UPDATE SET forecasts = forecasts + excluded.forecasts, "
+                    "last_used_at = excluded.last_used_at",
+                    [(custom_name, count, now) for custom_name, count in pending.items()],
+                )
+        except Exception:
+            logger.exception("Could not store model usage counts")
+
+    def most_used(self, limit: int) -> List[str]:
+        """
+        Names of the most used models, most forecast requests first
+
+        Args:
+            limit: Maximum number of names
+
+        Returns:
+            Model names, including models that no longer exist on disk
+        """
+        self.flush()
+        self._ensure_schema()
+        with closing(_connect(self.db_path)) as conn:
+            rows = conn.execute(
+                "SELECT custom_name FROM model_usage ORDER BY forecasts DESC, last_used_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [row["custom_name"] for row in rows]
+
+    def _ensure_schema(self) -> None:
+        if not self._initialized:
+            _init_db(self.db_path)
+            with closing(_connect(self.db_path)) as conn, conn:
+                conn.execute(_SCHEMA)
+            self._initialized = True
+
+
+# Shared instance updated by the model service
+model_usage = ModelUsage()
@@ -0,0 +1,345 @@
+"""Drift monitoring of the used models, retraining them incrementally when their error grows"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from services.training_queue import TRAINING_JOBS_DB_PATH, _add_columns, _connect, _init_db, _now, training_queue
+from utils.file_lock import file_lock
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# Seconds between automatic drift checks, 0 to only check through /api/retraining/check
+RETRAIN_CHECK_INTERVAL_SECONDS = float(os.getenv("RETRAIN_CHECK_INTERVAL_SECONDS", "3600"))
+# Most used models that are watched
+RETRAIN_WATCH_MODELS = int(os.getenv("RETRAIN_WATCH_MODELS", "8"))
+# Rolling window of the most recent days with actual load the error is measured over
+DRIFT_WINDOW_DAYS = int(os.getenv("DRIFT_WINDOW_DAYS", "7"))
+# Days of the window that must be after the model's training data before it is judged
+DRIFT_MIN_DAYS = int(os.getenv("DRIFT_MIN_DAYS", "3"))
+# Retrain when the rolling MAE exceeds the reference MAE by this factor
+DRIFT_THRESHOLD = float(os.getenv("DRIFT_THRESHOLD", "1.25"))
+# Reference period before the window, used when the model's validation MAE is unknown
+DRIFT_REFERENCE_DAYS = int(os.getenv("DRIFT_REFERENCE_DAYS", "28"))
+# Days of recent data an incremental retrain uses
+RETRAIN_WINDOW_DAYS = int(os.getenv("RETRAIN_WINDOW_DAYS", "90"))
+# A model is not retrained again within this many hours
+RETRAIN_COOLDOWN_HOURS = float(os.getenv("RETRAIN_COOLDOWN_HOURS", "24"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS retraining_checks (
+    id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    seconds REAL,
+    models INTEGER NOT NULL DEFAULT 0,
+    retrains INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS retraining_decisions (
+    check_id TEXT NOT NULL,
+    custom_name TEXT NOT NULL,
+    decided_at TEXT NOT NULL,
+    decision TEXT NOT NULL,
+    reason TEXT,
+    window_start TEXT,
+    window_end TEXT,
+    window_mae REAL,
+    reference_mae REAL,
+    ratio REAL,
+    seconds REAL,
+    job_id TEXT,
+    PRIMARY KEY (check_id, custom_name)
+)
+"""
+
+
+class RetrainingScheduler:
+    """
+    Periodic drift check of the most used models
+
+    Every check measures the MAE of each watched model over the last
+    DRIFT_WINDOW_DAYS days with actual load, from the error aggregates of the
+    forecasts recorded for the dashboard; days that were never forecast are
+    forecast first. Only days after the model's training data count. The MAE
+    is compared with the validation MAE of the model's last training job (or,
+    without one, its MAE over the DRIFT_REFERENCE_DAYS before the window), and
+    above DRIFT_THRESHOLD times that an incremental retrain on the last
+    RETRAIN_WINDOW_DAYS days is queued.
+
+    Checks and decisions are stored with their timings in the training jobs
+    database. With several uvicorn workers, a periodic check is claimed under a
+    lock file and skipped if another worker checked within the interval.
+    """
+
+    def __init__(self, db_path: str = TRAINING_JOBS_DB_PATH, interval_seconds: float = RETRAIN_CHECK_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._check_lock = asyncio.Lock()
+        self._initialized = False
+
+    async def start(self) -> None:
+        """Start checking periodically, unless the interval is 0"""
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Drift check every {self.interval_seconds:g}s for the {RETRAIN_WATCH_MODELS} most used models")
+
+    async def stop(self) -> None:
+        """Stop the periodic checks, a check in progress finishes in its thread"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def check(self, force: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Evaluate the watched models and queue incremental retrains for the drifting ones
+
+        Args:
+            force: Check even if another worker checked within the interval
+
+        Returns:
+            The check with its decisions, see get_check(), or None if it was skipped
+        """
+        self._ensure_schema()
+        async with self._check_lock:
+            # The file lock is waited for in a thread, so a check of another worker does not stall the event loop
+            check_id = await asyncio.to_thread(self._claim, force)
+            if check_id is None:
+                return None
+
+            start = time.perf_counter()
+            decisions: List[Dict[str, Any]] = []
+            error = None
+            try:
+                decisions = await asyncio.to_thread(self._evaluate_models)
+                # Jobs are queued on the event loop, like the jobs submitted by the routes
+                for decision in decisions:
+                    model, train_start, train_end = (decision.pop(key, None) for key in ("model", "train_start", "train_end"))
+                    if decision["decision"] != "retrain":
+                        continue
+                    try:
+                        job = training_queue.submit(model, decision["custom_name"], train_start, train_end, {}, mode="incremental")
+                        decision["job_id"] = job["job_id"]
+                    except Exception as e:
+                        logger.exception(f"Could not queue the retrain of {decision['custom_name']}")
+                        decision.update(decision="failed", reason=f"Could not queue the retrain: {e}")
+            except BaseException as e:
+                error = str(e) or type(e).__name__
+                raise
+            finally:
+                # Also a failed or cancelled check gets its duration, instead of staying unfinished
+                seconds = time.perf_counter() - start
+                self._store(check_id, decisions, seconds, error)
+        logger.info(
+            f"Drift check {check_id} finished in {seconds:.2f}s: "
+            + (", ".join(f"{decision['custom_name']}={decision['decision']}" for decision in decisions) or "no models")
+        )
+        return self.get_check(check_id)
+
+    def status(self, limit: int = 10) -> Dict[str, Any]:
+        """Configuration and the most recent checks with their decisions"""
+        self._ensure_schema()
+        with closing(_connect(self.db_path)) as conn:
+            check_ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM retraining_checks ORDER BY started_at DESC LIMIT ?", (limit,)
+            )]
+        return {
+            "interval_seconds": self.interval_seconds,
+            "watched_models": RETRAIN_WATCH_MODELS,
+            "window_days": DRIFT_WINDOW_DAYS,
+            "threshold": DRIFT_THRESHOLD,
+            "retrain_window_days": RETRAIN_WINDOW_DAYS,
+            "cooldown_hours": RETRAIN_COOLDOWN_HOURS,
+            "checks": [self.get_check(check_id) for check_id in check_ids],
+        }
+
+    def get_check(self, check_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a check with its decisions and the state and duration of the retrains it queued
+
+        Args:
+            check_id: ID of the check
+
+        Returns:
+            Check dict, or None if the ID is unknown
+        """
+        with closing(_connect(self.db_path)) as conn:
+            check = conn.execute("SELECT * FROM retraining_checks WHERE id = ?", (check_id,)).fetchone()
+            if check is None:
+                return None
+            rows = conn.execute(
+                "SELECT * FROM retraining_decisions WHERE check_id = ? ORDER BY custom_name", (check_id,)
+            ).fetchall()
+        decisions = []
+        for row in rows:
+            decision = {key: row[key] for key in row.keys() if key != "check_id"}
+            if row["job_id"]:
+                job = training_queue.get_job(row["job_id"])
+                decision["job"] = {
+                    key: job[key] for key in ("status", "duration_seconds", "metrics", "error")
+                } if job else None
+            decisions.append(decision)
+        return {**dict(check), "decisions": decisions}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.check(force=False)
+            except Exception:
+                logger.exception("Drift check failed, retried at the next interval")
+
+    def _due(self) -> bool:
+        """Whether no worker has checked within the interval"""
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute("SELECT MAX(started_at) AS last FROM retraining_checks").fetchone()
+        if row["last"] is None:
+            return True
+        return datetime.now(timezone.utc) - datetime.fromisoformat(row["last"]) >= timedelta(seconds=self.interval_seconds)
+
+    def _evaluate_models(self) -> List[Dict[str, Any]]:
+        """Decide for every watched model, in a worker thread"""
+        # The model service pulls in the forecast machinery, only needed once a check runs
+        from services.master_data import master_data_store
+        from services.model_service import PARENT_DIR
+        from services.model_usage import model_usage
+
+        _, frame = master_data_store.snapshot()
+        actual = frame["load"].dropna()
+        if actual.empty:
+            return []
+        # Last UTC day whose hours all have data, the forecast endpoints only forecast whole days
+        last_day = (actual.index[-1].tz_convert("UTC") + timedelta(hours=1)).normalize() - timedelta(days=1)
+        trained = [
+            name for name in model_usage.most_used(RETRAIN_WATCH_MODELS)
+            if os.path.isfile(os.path.join(PARENT_DIR, name, "pj.pkl"))
+        ]
+        decisions = []
+        for custom_name in trained:
+            start = time.perf_counter()
+            try:
+                decision = self._evaluate_model(custom_name, last_day)
+            except Exception as e:
+                logger.exception(f"Drift check of {custom_name} failed")
+                decision = {"decision": "failed", "reason": str(e) or type(e).__name__}
+            decisions.append({"custom_name": custom_name, **decision, "seconds": time.perf_counter() - start})
+        return decisions
+
+    def _evaluate_model(self, custom_name: str, last_day: pd.Timestamp) -> Dict[str, Any]:
+        """Measure the rolling error of one model and decide whether to retrain it"""
+        from services.model_service import _load_model
+
+        loaded = _load_model(custom_name)
+        last_job = self._last_job(custom_name)
+        if last_job is not None and last_job["status"] in ("queued", "running"):
+            return {"decision": "skipped", "reason": f"Training job {last_job['id']} is {last_job['status']}"}
+
+        # Only days the model has not been trained on say something about drift
+        window_start = last_day - timedelta(days=DRIFT_WINDOW_DAYS - 1)
+        trained_until = pd.Timestamp(json.loads(last_job["params"])["training_data_end_date"], tz="UTC") if last_job else None
+        if trained_until is not None and trained_until >= window_start:
+            window_start = trained_until + timedelta(days=1)
+        window = pd.date_range(window_start, last_day, freq="D")
+        result = {"window_start": str(window_start.date()), "window_end": str(last_day.date())}
+        if len(window) < DRIFT_MIN_DAYS:
+            return {**result, "decision": "insufficient_data", "reason": f"{len(window)} days since the training data, need {DRIFT_MIN_DAYS}"}
+
+        reference_mae = None
+        if last_job is not None and last_job["metrics"]:
+            reference_mae = (json.loads(last_job["metrics"]).get("validation") or {}).get("mae")
+        if reference_mae is None:
+            reference = pd.date_range(window_start - timedelta(days=DRIFT_REFERENCE_DAYS), window_start - timedelta(days=1), freq="D")
+            reference_mae = self._model_mae(custom_name, reference)
+        window_mae = self._model_mae(custom_name, window)
+        result.update(window_mae=window_mae, reference_mae=reference_mae)
+        if window_mae is None or not reference_mae:
+            return {**result, "decision": "insufficient_data", "reason": "No forecast hours with actual load"}
+
+        ratio = window_mae / reference_mae
+        result["ratio"] = ratio
+        if ratio <= DRIFT_THRESHOLD:
+            return {**result, "decision": "ok", "reason": f"MAE ratio {ratio:.2f} <= {DRIFT_THRESHOLD:g}"}
+        cooldown = self._last_retrain(custom_name)
+        if cooldown is not None and datetime.now(timezone.utc) - datetime.fromisoformat(cooldown) < timedelta(hours=RETRAIN_COOLDOWN_HOURS):
+            return {**result, "decision": "cooldown", "reason": f"Retrained at {cooldown}"}
+        return {
+            **result,
+            "decision": "retrain",
+            "reason": f"MAE ratio {ratio:.2f} > {DRIFT_THRESHOLD:g}",
+            "model": loaded.pj["model"],
+            "train_start": str((last_day - timedelta(days=RETRAIN_WINDOW_DAYS - 1)).date()),
+            "train_end": str(last_day.date()),
+        }
+
+    def _model_mae(self, custom_name: str, days: pd.DatetimeIndex) -> Optional[float]:
+        """MAE of a model over some days, forecasting the days it has no recorded forecast for"""
+        from services.model_service import model_error
+
+        return model_error(custom_name, days)["mae"]
+
+    def _last_job(self, custom_name: str) -> Optional[Dict[str, Any]]:
+        """The most recent training job of a model that did not fail"""
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute(
+                "SELECT * FROM training_jobs WHERE custom_name = ? AND status IN ('queued', 'running', 'succeeded') "
+                "ORDER BY submitted_at DESC LIMIT 1",
+                (custom_name,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _last_retrain(self, custom_name: str) -> Optional[str]:
+        """When the scheduler last queued a retrain of a model"""
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute(
+                "SELECT MAX(decided_at) AS last FROM retraining_decisions WHERE custom_name = ? AND decision = 'retrain'",
+                (custom_name,),
+            ).fetchone()
+        return row["last"]
+
+    def _claim(self, force: bool) -> Optional[str]:
+        """Start a check unless another worker checked within the interval, returns its ID"""
+        # Claiming the check under the lock keeps the other workers from checking too
+        with file_lock(f"{self.db_path}.retraining.lock"):
+            if not force and not self._due():
+                return None
+            check_id = uuid.uuid4().hex
+            with closing(_connect(self.db_path)) as conn, conn:
+                conn.execute("INSERT INTO retraining_checks (id, started_at) VALUES (?, ?)", (check_id, _now()))
+        return check_id
+
+    def _store(self, check_id: str, decisions: List[Dict[str, Any]], seconds: float, error: Optional[str] = None) -> None:
+        columns = ("decision", "reason", "window_start", "window_end", "window_mae", "reference_mae", "ratio", "seconds", "job_id")
+        with closing(_connect(self.db_path)) as conn, conn:
+            conn.executemany(
+                f"INSERT INTO retraining_decisions (check_id, custom_name, decided_at, {', '.join(columns)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in columns)})",
+                [(check_id, decision["custom_name"], _now(), *(decision.get(column) for column in columns)) for decision in decisions],
+            )
+            conn.execute(
+                "UPDATE retraining_checks SET seconds = ?, models = ?, retrains = ?, error = ? WHERE id = ?",
+                (seconds, len(decisions), sum(decision["decision"] == "retrain" for decision in decisions), error, check_id),
+            )
+
+    def _ensure_schema(self) -> None:
+        if not self._initialized:
+            _init_db(self.db_path)
+            with closing(_connect(self.db_path)) as conn, conn:
+                conn.executescript(_SCHEMA)
+                _add_columns(conn, "retraining_checks", {"error": "TEXT"})
+            self._initialized = True
+
+
+# Shared instance started by main.py
+retraining_scheduler = RetrainingScheduler()
@@ -0,0 +1,383 @@
+"""Background queue that runs model training in worker processes"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from services.worker_pool import discard_executor, get_executor
+from utils.metrics import stage_timer
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+TRAINING_JOBS_DB_PATH = os.getenv("TRAINING_JOBS_DB_PATH", "./jobs/training_jobs.sqlite3")
+TRAINING_CONCURRENCY = int(os.getenv("TRAINING_CONCURRENCY", "1"))
+# A running job or sweep whose process has not renewed it for this long counts as abandoned
+TRAINING_LEASE_SECONDS = float(os.getenv("TRAINING_LEASE_SECONDS", "120"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS training_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    model TEXT NOT NULL,
+    custom_name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    submitted_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    metrics TEXT,
+    error TEXT,
+    owner TEXT,
+    heartbeat_at TEXT
+)
+"""
+
+# Added after the first release, so older databases get them on start
+_LEASE_COLUMNS = {"owner": "TEXT", "heartbeat_at": "TEXT"}
+
+
+class TrainingQueue:
+    """
+    Persistent FIFO queue of training jobs
+
+    Jobs are stored in SQLite so their history survives a restart. Up to
+    `concurrency` jobs run at the same time in the 'training' process pool,
+    which keeps XGBoost off the event loop. Workers write their progress
+    straight into the database. A running job is leased to the process that
+    claimed it, which renews the lease while the job runs.
+    """
+
+    def __init__(self, db_path: str = TRAINING_JOBS_DB_PATH, concurrency: int = TRAINING_CONCURRENCY):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.coalesced = 0
+
+    async def start(self) -> None:
+        """Create the database, recover jobs from a previous run and start the dispatchers"""
+        _init_db(self.db_path)
+        self._queue = asyncio.Queue()
+
+        with closing(_connect(self.db_path)) as conn, conn:
+            # A job whose process stopped cannot be resumed; jobs of the other uvicorn workers are left alone
+            abandoned = _abandoned(conn, "training_jobs")
+            conn.executemany(
+                "UPDATE training_jobs SET status = 'interrupted', finished_at = ?, "
+                "error = 'Server stopped while the job was running' WHERE id = ? AND status = 'running'",
+                [(_now(), job_id) for job_id in abandoned],
+            )
+            interrupted = len(abandoned)
+            queued = [row["id"] for row in conn.execute(
+                "SELECT id FROM training_jobs WHERE status = 'queued' ORDER BY submitted_at, rowid"
+            )]
+        for job_id in queued:
+            self._queue.put_nowait(job_id)
+        if interrupted or queued:
+            logger.info(f"Recovered training queue: {len(queued)} queued, {interrupted} interrupted")
+
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.concurrency)]
+        self._heartbeat = asyncio.create_task(renew_leases(self.db_path, "training_jobs"))
+        logger.info(f"Training queue started with concurrency {self.concurrency}")
+
+    async def stop(self) -> None:
+        """Stop dispatching; queued jobs stay queued and are picked up after the next start"""
+        tasks = self._dispatchers + ([self._heartbeat] if self._heartbeat is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatchers = []
+        self._heartbeat = None
+
+    def submit(self, model: str, custom_name: str, training_data_start_date: str, training_data_end_date: str, hyperparams_dict: Dict[str, Any], mode: str = "full") -> Dict[str, Any]:
+        """
+        Queue a training run
+
+        Args:
+            model: Model type (e.g., 'xgb')
+            custom_name: Custom name for the model
+            training_data_start_date: Start date for training data
+            training_data_end_date: End date for training data
+            hyperparams_dict: Dictionary of hyperparameters; for an incremental run only 'rounds' is used
+            mode: 'full' trains a new model, 'incremental' continues the current booster of custom_name
+
+        Returns:
+            The queued job, see get_job(). If an identical job (same model, name and parameters)
+            is still queued or running, that job is returned with 'coalesced' set instead of
+            queueing a second run that would write into the same model directory.
+        """
+        if self._queue is None:
+            raise RuntimeError("Training queue is not started")
+        if mode not in ("full", "incremental"):
+            raise ValueError(f"Training mode must be 'full' or 'incremental', got '{mode}'")
+
+        job_id = uuid.uuid4().hex
+        params = {
+            "training_data_start_date": training_data_start_date,
+            "training_data_end_date": training_data_end_date,
+            "hyperparams_dict": hyperparams_dict,
+            "mode": mode,
+        }
+        # Canonical key order, so identical submissions store identical parameters
+        params_json = json.dumps(params, sort_keys=True)
+        with closing(_connect(self.db_path)) as conn, conn:
+            # Write lock before the lookup, so two uvicorn workers cannot both miss the other's job
+            conn.execute("BEGIN IMMEDIATE")
+            existing = conn.execute(
+                "SELECT id FROM training_jobs WHERE status IN ('queued', 'running') "
+                "AND model = ? AND custom_name = ? AND params = ? ORDER BY submitted_at LIMIT 1",
+                (model, custom_name, params_json),
+            ).fetchone()
+            if existing is None:
+                conn.execute(
+                    "INSERT INTO training_jobs (id, status, model, custom_name, params, submitted_at, stage) "
+                    "VALUES (?, 'queued', ?, ?, ?, ?, 'queued')",
+                    (job_id, model, custom_name, params_json, _now()),
+                )
+        if existing is not None:
+            self.coalesced += 1
+            logger.info(f"Identical training job {existing['id']} for model '{custom_name}' is in progress, not queueing another")
+            return {**self.get_job(existing["id"]), "coalesced": True}
+
+        self.submitted += 1
+        self._queue.put_nowait(job_id)
+        logger.info(f"Queued {mode} training job {job_id} for model '{custom_name}'")
+        return {**self.get_job(job_id), "coalesced": False}
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """Jobs queued and identical submissions answered with a job in progress, by this process"""
+        return {"submitted": self.submitted, "coalesced": self.coalesced}
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job with its queue position, progress, duration and metrics
+
+        Args:
+            job_id: ID returned by submit()
+
+        Returns:
+            Job dict, or None if the ID is unknown
+        """
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute("SELECT rowid, * FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == "queued":
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM training_jobs WHERE status = 'queued' "
+                    "AND (submitted_at < ? OR (submitted_at = ? AND rowid <= ?))",
+                    (row["submitted_at"], row["submitted_at"], row["rowid"]),
+                ).fetchone()[0]
+        return _job_from_row(row, position)
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """List the most recently submitted jobs, newest first"""
+        with closing(_connect(self.db_path)) as conn:
+            rows = conn.execute(
+                "SELECT rowid, * FROM training_jobs ORDER BY submitted_at DESC, rowid DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self.get_job(row["id"]) if row["status"] == "queued" else _job_from_row(row, None) for row in rows]
+
+    async def _dispatch(self) -> None:
+        """Take jobs off the queue and run them in the training pool, one at a time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self._queue.get()
+            try:
+                # Claim the job atomically, with several uvicorn workers every worker recovers the queued jobs
+                with closing(_connect(self.db_path)) as conn, conn:
+                    now = _now()
+                    claimed = conn.execute(
+                        "UPDATE training_jobs SET status = 'running', started_at = ?, stage = 'starting', "
+                        "owner = ?, heartbeat_at = ? WHERE id = ? AND status = 'queued'",
+                        (now, _owner(), now, job_id),
+                    ).rowcount
+                    row = conn.execute("SELECT * FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+                if not claimed:
+                    continue
+
+                executor = get_executor("training", self.concurrency)
+                try:
+                    with stage_timer("training_job", row["custom_name"]):
+                        metrics = await loop.run_in_executor(
+                            executor, _run_training_job, self.db_path, job_id,
+                            row["model"], row["custom_name"], json.loads(row["params"]),
+                        )
+                except BrokenProcessPool as e:
+                    discard_executor("training")
+                    raise RuntimeError("Training worker process crashed") from e
+
+                _update_job(
+                    self.db_path, job_id, status="succeeded", finished_at=_now(),
+                    stage="finished", progress=1.0, metrics=json.dumps(metrics),
+                )
+                _invalidate_model(row["custom_name"])
+                logger.info(f"Training job {job_id} succeeded")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Training job {job_id} failed")
+                _update_job(self.db_path, job_id, status="failed", finished_at=_now(), error=str(e) or type(e).__name__)
+            finally:
+                self._queue.task_done()
+
+
+def _run_training_job(db_path: str, job_id: str, model: str, custom_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Process pool entry point: train one model and record progress in the job database"""
+    # Imported here so the queue module stays light for the web process
+    from services.model_service import RETRAIN_ROUNDS, _retrain_model_incremental, _train_model
+
+    def progress(stage: str, fraction: float) -> None:
+        _update_job(db_path, job_id, stage=stage, progress=fraction)
+
+    if params.get("mode") == "incremental":
+        return _retrain_model_incremental(
+            custom_name,
+            params["training_data_start_date"],
+            params["training_data_end_date"],
+            rounds=int(params["hyperparams_dict"].get("rounds") or RETRAIN_ROUNDS),
+            progress=progress,
+        )
+    return _train_model(
+        model,
+        custom_name,
+        params["training_data_start_date"],
+        params["training_data_end_date"],
+        params["hyperparams_dict"],
+        progress=progress,
+    )
+
+
+def _invalidate_model(custom_name: str) -> None:
+    """Drop the web process's cached copy and forecasts of a model retrained by a worker"""
+    from services.model_service import invalidate_model
+    invalidate_model(custom_name)
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init_db(db_path: str) -> None:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    with closing(_connect(db_path)) as conn, conn:
+        # WAL lets worker processes write progress while the web process reads
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        _add_columns(conn, "training_jobs", _LEASE_COLUMNS)
+
+
+def _add_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]) -> None:
+    """Add the columns a table created by an older version is missing"""
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+
+def _owner() -> str:
+    """Identifies this process among the uvicorn workers of every host sharing the database"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _abandoned(conn: sqlite3.Connection, table: str) -> List[str]:
+    """
+    IDs of the running rows of a table whose process is gone
+
+    A row is abandoned if it has no owner (written before leases existed), belongs
+    to this process (which has only just started, so it is a previous one with the
+    same pid), belongs to a dead process of this host, or its lease has expired.
+    """
+    host, pid = socket.gethostname(), os.getpid()
+    expired = (datetime.now(timezone.utc) - timedelta(seconds=TRAINING_LEASE_SECONDS)).isoformat()
+    abandoned = []
+    for row in conn.execute(f"SELECT id, owner, heartbeat_at FROM {table} WHERE status = 'running'"):
+        if row["owner"] is None or row["heartbeat_at"] is None or row["heartbeat_at"] < expired:
+            abandoned.append(row["id"])
+            continue
+        owner_host, _, owner_pid = row["owner"].rpartition(":")
+        if owner_host == host and (int(owner_pid) == pid or not _process_alive(int(owner_pid))):
+            abandoned.append(row["id"])
+    return abandoned
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill() would terminate the process on Windows, the lease alone decides there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+async def renew_leases(db_path: str, table: str) -> None:
+    """Keep renewing the lease of the running rows of a table owned by this process"""
+    owner = _owner()
+    while True:
+        await asyncio.sleep(TRAINING_LEASE_SECONDS / 4)
+        try:
+            with closing(_connect(db_path)) as conn, conn:
+                conn.execute(
+                    f"UPDATE {table} SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+                    (_now(), owner),
+                )
+        except sqlite3.Error:
+            logger.exception(f"Could not renew the leases of {table}")
+
+
+def _update_job(db_path: str, job_id: str, **fields: Any) -> None:
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute(f"UPDATE training_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _job_from_row(row: sqlite3.Row, queue_position: Optional[int]) -> Dict[str, Any]:
+    started_at = row["started_at"]
+    finished_at = row["finished_at"]
+    duration = None
+    if started_at:
+        end = datetime.fromisoformat(finished_at) if finished_at else datetime.now(timezone.utc)
+        duration = (end - datetime.fromisoformat(started_at)).total_seconds()
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "model": row["model"],
+        "custom_name": row["custom_name"],
+        "params": json.loads(row["params"]),
+        "submitted_at": row["submitted_at"],
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "duration_seconds": duration,
+        "queue_position": queue_position,
+        "stage": row["stage"],
+        "progress": row["progress"],
+        "metrics": json.loads(row["metrics"]) if row["metrics"] else None,
+        "error": row["error"],
+    }
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Shared instance started by main.py
+training_queue = TrainingQueue()
@@ -0,0 +1,154 @@
+"""Startup warm-up of the master data, the forecast pipeline and the most used models"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# 'background': serve right away and warm up in the background, 'blocking': warm up before
+# serving, 'off': load everything on first use
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+WARMUP_MODELS = int(os.getenv("WARMUP_MODELS", "4"))
+
+# openstef modules the services import on first use; they pull in mlflow, xgboost, sklearn and plotly
+PIPELINE_MODULES = (
+    "openstef.pipeline.create_forecast",
+    "openstef.pipeline.train_model",
+    "openstef.model.serializer",
+    "openstef.feature_engineering.feature_applicator",
+    "openstef.model.confidence_interval_applicator",
+    "openstef.model.fallback",
+    "openstef.postprocessing.postprocessing",
+    "openstef.validation.validation",
+)
+
+
+class WarmUp:
+    """
+    Loads what the first requests would otherwise wait for
+
+    The steps run one after another in a thread: master data with its day index
+    and dashboard aggregates, the forecast pipeline imports, then the most used
+    models (most forecast requests first, filled up with the most recently
+    trained ones). A failing step is logged and reported in status() but does not
+    stop the others; the service is ready once all steps have run.
+    """
+
+    def __init__(self, mode: str = STARTUP_WARMUP, model_count: int = WARMUP_MODELS):
+        if mode not in ("background", "blocking", "off"):
+            raise ValueError(f"STARTUP_WARMUP must be 'background', 'blocking' or 'off', got '{mode}'")
+        self.mode = mode
+        self.model_count = model_count
+        self._task: Optional[asyncio.Task] = None
+        self._state = "pending"
+        self._started_at: Optional[datetime] = None
+        self._finished_at: Optional[datetime] = None
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._models: List[str] = []
+
+    @property
+    def ready(self) -> bool:
+        """True once the warm-up has finished or is turned off"""
+        return self._state in ("ready", "off")
+
+    async def start(self) -> None:
+        """Run the warm-up according to the mode, returns right away in background mode"""
+        if self.mode == "off":
+            self._state = "off"
+            logger.info("Startup warm-up is off, models and the forecast pipeline are loaded on first use")
+        elif self.mode == "blocking":
+            await self._run()
+        elif self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel a warm-up still in progress, a step that is running finishes in its thread"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        """State, duration of every step and the preloaded models"""
+        finished = self._finished_at or datetime.now(timezone.utc)
+        return {
+            "ready": self.ready,
+            "state": self._state,
+            "mode": self.mode,
+            "started_at": self._started_at.isoformat() if self._started_at else None,
+            "finished_at": self._finished_at.isoformat() if self._finished_at else None,
+            "seconds": (finished - self._started_at).total_seconds() if self._started_at else None,
+            "steps": self._steps,
+            "models": self._models,
+        }
+
+    async def _run(self) -> None:
+        self._state = "warming_up"
+        self._started_at = datetime.now(timezone.utc)
+        for name, step in (
+            ("master_data", _load_master_data),
+            ("pipeline", _import_pipeline),
+            ("models", self._load_models),
+        ):
+            self._steps[name] = {"state": "running"}
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(step)
+                self._steps[name] = {"state": "done", "seconds": time.perf_counter() - start}
+            except Exception as e:
+                logger.exception(f"Warm-up step '{name}' failed")
+                self._steps[name] = {"state": "failed", "seconds": time.perf_counter() - start, "error": str(e) or type(e).__name__}
+        self._finished_at = datetime.now(timezone.utc)
+        self._state = "ready"
+        logger.info(f"Warm-up finished in {(self._finished_at - self._started_at).total_seconds():.2f}s, models: {self._models}")
+
+    def _load_models(self) -> None:
+        """Load the most used models into the model cache"""
+        from services.model_service import PARENT_DIR, _load_model
+        from services.model_usage import model_usage
+
+        for custom_name in _models_to_load(PARENT_DIR, model_usage.most_used, self.model_count):
+            try:
+                _load_model(custom_name)
+                self._models.append(custom_name)
+            except Exception:
+                logger.exception(f"Could not preload model: {custom_name}")
+
+
+def _load_master_data() -> None:
+    """Parse the master data and build its day index and the dashboard aggregates"""
+    from services.dashboard_metrics import dashboard_metrics
+    from services.master_data import master_data_store
+
+    master_data_store.day_index()
+    dashboard_metrics.refresh()
+
+
+def _import_pipeline() -> None:
+    """Import the openstef modules the services would otherwise import on the first request"""
+    for module in PIPELINE_MODULES:
+        importlib.import_module(module)
+
+
+def _models_to_load(parent_dir: str, most_used: Callable[[int], List[str]], count: int) -> List[str]:
+    """The `count` most used trained models, filled up with the most recently trained ones"""
+    if count <= 0:
+        return []
+    trained = {path.parent.name: path.stat().st_mtime for path in Path(parent_dir).glob("*/pj.pkl")}
+    names = [name for name in most_used(count) if name in trained]
+    recent = sorted(trained, key=trained.get, reverse=True)
+    names.extend(name for name in recent if name not in names)
+    return names[:count]
+
+
+# Shared instance started by main.py
+warmup = WarmUp()
@@ -0,0 +1,67 @@
+"""Process pools for CPU-bound work that should not block the event loop"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", str(os.cpu_count() or 1)))
+
+_lock = threading.Lock()
+_executors: Dict[str, ProcessPoolExecutor] = {}
+
+
+def get_executor(name: str, max_workers: int) -> ProcessPoolExecutor:
+    """
+    Get a named process pool, creating it on first use
+
+    Workers are spawned rather than forked, so they start from a clean
+    interpreter on every platform and do not inherit the server's threads.
+
+    Args:
+        name: Pool name, e.g. 'forecast'
+        max_workers: Number of worker processes when the pool is created
+
+    Returns:
+        The shared ProcessPoolExecutor for that name
+    """
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _executors[name] = executor
+            logger.info(f"Started '{name}' process pool with {max_workers} workers")
+        return executor
+
+
+def discard_executor(name: str, broken: Optional[ProcessPoolExecutor] = None) -> None:
+    """
+    Forget a broken pool so the next get_executor() starts a fresh one
+
+    Args:
+        name: Pool name
+        broken: The pool that broke; if given, a newer pool started under the name in the meantime is kept
+    """
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None or (broken is not None and executor is not broken):
+            return
+        del _executors[name]
+    executor.shutdown(wait=False, cancel_futures=True)
+    logger.warning(f"Discarded '{name}' process pool")
+
+
+def shutdown_executors() -> None:
+    """Stop every pool, waiting for running tasks to finish"""
+    with _lock:
+        for name, executor in _executors.items():
+            executor.shutdown(wait=True, cancel_futures=True)
+            logger.info(f"Stopped '{name}' process pool")
+        _executors.clear()
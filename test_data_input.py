@@ -0,0 +1,78 @@
+"""
+Test that data input edits reach the master data and its dataset, and only ever change existing hours
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes import data_input
+from services.edit_log import EditLog
+from services.master_data import MasterDataStore
+
+EDITED_HOUR = pd.Timestamp("2023-01-02 03:00", tz="UTC")
+
+
+def _store(directory: str) -> MasterDataStore:
+    """A store over three days of master data in a temporary directory"""
+    index = pd.date_range("2023-01-01", periods=72, freq="h", tz="+06:00", name="date_time")
+    frame = pd.DataFrame({"load": np.arange(72, dtype=float), "forecasted_load": np.arange(72, dtype=float)}, index=index)
+    csv_path = os.path.join(directory, "master_data.csv")
+    frame.to_csv(csv_path)
+    return MasterDataStore(
+        csv_path=csv_path,
+        dataset_path=os.path.join(directory, "master_data.arrow"),
+        edit_log=EditLog(os.path.join(directory, "edits.log")),
+        version_path=os.path.join(directory, "master_data.version"),
+    )
+
+
+def _post(client: TestClient, date: str, hourly_data: list):
+    return client.post("/api/data-input", data={"date": date, "hourly_data": json.dumps(hourly_data)})
+
+
+def test_edits_are_applied_and_compacted():
+    """Append an edit, see it after a refresh, compact it into the dataset; hours outside the data are rejected"""
+    shared_store = data_input.master_data_store
+    app = FastAPI()
+    app.include_router(data_input.router)
+    with tempfile.TemporaryDirectory() as directory:
+        store = _store(directory)
+        data_input.master_data_store = store
+        try:
+            client = TestClient(app)
+            version = store.version
+
+            response = _post(client, "2023-01-02", [{"hour": 3, "actual": 1234.5, "predicted": None}])
+            assert response.status_code == 200, response.text
+            assert response.json()["data_version"] != version
+            assert store.get().loc[EDITED_HOUR, "load"] == 1234.5
+            assert len(store.get()) == 72
+
+            # Hours the master data does not have are rejected, and the data keeps its extent
+            response = _post(client, "2250-01-01", [{"hour": 0, "actual": 1.0}])
+            assert response.status_code == 400, response.text
+            assert len(store.get()) == 72
+            assert store.day_index().rows(["2250-01-01"])[0][0] == -1
+
+            # A record for such an hour already in the log is skipped when applied
+            store.edit_log.append([{"timestamp": pd.Timestamp("2250-01-01", tz="UTC"), "load": 1.0}])
+            store.notify_changed()
+            assert len(store.get()) == 72
+
+            assert store.compact_edits() == 2
+            assert os.path.getsize(store.edit_log.path) == 0
+            compacted = _store(directory).get()
+            assert len(compacted) == 72
+            assert compacted.loc[EDITED_HOUR, "load"] == 1234.5
+        finally:
+            data_input.master_data_store = shared_store
+
+
+if __name__ == "__main__":
+    test_edits_are_applied_and_compacted()
+    print("Test completed successfully!")
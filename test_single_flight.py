@@ -0,0 +1,57 @@
+"""
+Test that concurrent sequential forecasts of the same model and day share one pipeline run
+"""
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from services import model_service
+from services.model_service import _day_forecasts_of_models, forecast_flights
+
+DATE = "2025-01-02"
+
+
+def _master_data() -> pd.DataFrame:
+    """Two days of master data; the model is missing, so no model is loaded or cached"""
+    index = pd.date_range("2025-01-01", periods=48, freq="h", tz="UTC")
+    return pd.DataFrame({"load": np.arange(48, dtype=float)}, index=index)
+
+
+def test_sequential_forecasts_are_coalesced():
+    """Two concurrent requests without the process pool: the second one waits for the first's run"""
+    runs = []
+    run_lock = threading.Lock()
+    forecast_24_hours = model_service._forecast_24_hours
+
+    def slow_forecast(custom_name, to_forecast_data, input_key):
+        with run_lock:
+            runs.append(custom_name)
+        # Long enough for the second request to arrive while this one runs
+        time.sleep(0.5)
+        return pd.DataFrame({"forecast": 1.0}, index=to_forecast_data.index)
+
+    async def forecast_twice():
+        data = _master_data()
+        return await asyncio.gather(*(
+            _day_forecasts_of_models(["no_such_model"], DATE, "test", data, parallel=False) for _ in range(2)
+        ))
+
+    coalesced = forecast_flights.coalesced
+    model_service._forecast_24_hours = slow_forecast
+    try:
+        first, second = asyncio.run(forecast_twice())
+    finally:
+        model_service._forecast_24_hours = forecast_24_hours
+
+    assert runs == ["no_such_model"]
+    assert forecast_flights.coalesced == coalesced + 1
+    assert len(first[0]) == 24
+    assert first[0] is second[0]
+
+
+if __name__ == "__main__":
+    test_sequential_forecasts_are_coalesced()
+    print("Test completed successfully!")
@@ -0,0 +1,48 @@
+"""
+Test that a forecast process pool with a crashed worker is replaced
+"""
+import asyncio
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from services.model_service import _forecast_24_hours_in_pool
+from services.worker_pool import get_executor, shutdown_executors
+
+
+def _window() -> pd.DataFrame:
+    """A small forecast window; the model is missing, so workers fail without openstef doing any work"""
+    index = pd.date_range("2025-01-01", periods=48, freq="h", tz="UTC")
+    return pd.DataFrame({"load": np.arange(48, dtype=float)}, index=index)
+
+
+async def _forecast(window: pd.DataFrame):
+    return await _forecast_24_hours_in_pool(["no_such_model"], window, ("test", len(window)))
+
+
+def test_broken_forecast_pool_is_replaced():
+    """Kill a forecast worker: that request fails at most, the next one runs in a fresh pool"""
+    window = _window()
+    try:
+        executor = get_executor("forecast", 1)
+        # Start the worker, then kill it like the OOM killer would
+        executor.submit(os.getpid).result()
+        for pid in list(executor._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        first = asyncio.run(_forecast(window))
+        assert isinstance(first[0], (BrokenProcessPool, FileNotFoundError)), repr(first[0])
+
+        second = asyncio.run(_forecast(window))
+        assert isinstance(second[0], FileNotFoundError), repr(second[0])
+        assert get_executor("forecast", 1) is not executor
+    finally:
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    test_broken_forecast_pool_is_replaced()
+    print("Test completed successfully!")
@@ -0,0 +1,82 @@
+"""Exclusive file locks that work across threads and processes"""
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive advisory lock on a lock file for the duration of the block
+
+    Every caller opens the file itself, so the lock also excludes other threads of
+    the same process. The lock file is created if needed and never removed.
+
+    Args:
+        path: Path of the lock file, e.g. '<protected file>.lock'
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def is_locked(path: str) -> bool:
+    """
+    Check whether another holder currently has the lock of file_lock(path)
+
+    Only a hint: the lock may be taken or released right after the check.
+
+    Args:
+        path: Path of the lock file
+
+    Returns:
+        True if the lock is held, False if it is free or the lock file does not exist
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        file = open(path, "a+b")
+    except OSError:
+        return False
+    with file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            return True
+    return False
+
+
+def fsync_directory(path: str) -> None:
+    """Make a rename or file creation in a directory durable, where the platform supports it"""
+    if os.name == "nt":
+        return
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
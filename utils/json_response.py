@@ -0,0 +1,56 @@
+"""JSON responses with an opt-in fast encoder"""
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Optional, only needed with FAST_JSON=1
+    orjson = None
+
+# Get logger for this module (configuration is done in main.py)
+logger = logging.getLogger(__name__)
+
+# Serialize the forecast and data responses with orjson instead of the standard library encoder
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+if FAST_JSON and orjson is None:
+    logger.warning("FAST_JSON is set but orjson is not installed, using the standard JSON encoder")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson, which also accepts numpy values and writes NaN as null"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def use_fast_json() -> bool:
+    """Whether responses are encoded with orjson"""
+    return FAST_JSON and orjson is not None
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """
+    Build a JSON response with the configured encoder
+
+    Args:
+        content: JSON-serializable content
+        status_code: HTTP status code
+        headers: Additional response headers
+
+    Returns:
+        FastJSONResponse if FAST_JSON is enabled and orjson is installed, else a JSONResponse
+    """
+    response_class = FastJSONResponse if use_fast_json() else JSONResponse
+    return response_class(content, status_code=status_code, headers=headers)
+
+
+def dumps(content: Any) -> str:
+    """Serialize content for a streamed response with the configured encoder"""
+    if use_fast_json():
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(content)
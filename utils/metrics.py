@@ -0,0 +1,122 @@
+"""Per-stage timers exported as Prometheus histograms and Server-Timing headers"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import multiprocess
+from starlette.requests import Request
+from starlette.routing import Match
+
+# Durations from a cache hit up to a training run
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "dpdc_stage_duration_seconds",
+    "Duration of a processing stage",
+    ["endpoint", "stage", "model"],
+    buckets=_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "dpdc_request_duration_seconds",
+    "Duration of an HTTP request",
+    ["endpoint", "method", "status"],
+    buckets=_BUCKETS,
+)
+
+# Stages recorded outside a request (queues, worker processes) are labelled with this endpoint
+BACKGROUND_ENDPOINT = "background"
+
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default=BACKGROUND_ENDPOINT)
+_timings: ContextVar[Optional[List[Tuple[str, str, float]]]] = ContextVar("metrics_timings", default=None)
+
+
+@contextmanager
+def stage_timer(stage: str, model: str = "") -> Iterator[None]:
+    """
+    Time a block as a stage of the current request
+
+    Args:
+        stage: Stage name, e.g. 'model_load'; must be a valid Server-Timing token
+        model: Model name the stage belongs to, empty if it is shared by all models
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, model)
+
+
+def record_stage(stage: str, seconds: float, model: str = "") -> None:
+    """Record an already measured stage duration, see stage_timer()"""
+    STAGE_SECONDS.labels(_endpoint.get(), stage, model).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, model, seconds))
+
+
+def begin_request(endpoint: str) -> List[Tuple[str, str, float]]:
+    """
+    Start collecting the stages of a request handled in the current context
+
+    Args:
+        endpoint: Route template of the request, e.g. '/api/train/jobs/{job_id}'
+
+    Returns:
+        The list the request's stages are appended to, for server_timing_header()
+    """
+    timings: List[Tuple[str, str, float]] = []
+    _endpoint.set(endpoint)
+    _timings.set(timings)
+    return timings
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    """Record the total duration of a request"""
+    REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(seconds)
+
+
+def route_template(request: Request) -> str:
+    """Route path of a request with its parameters unresolved, so label values stay bounded"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+def server_timing_header(timings: List[Tuple[str, str, float]], total_seconds: float) -> str:
+    """
+    Format the stages of a request as a Server-Timing header value
+
+    Repeated stages of the same model are summed, durations are in milliseconds.
+    """
+    totals = {}
+    for stage, model, seconds in timings:
+        totals[(stage, model)] = totals.get((stage, model), 0.0) + seconds
+    entries = []
+    for (stage, model), seconds in totals.items():
+        name = model.replace('"', "")
+        description = f';desc="{name}"' if name else ""
+        entries.append(f"{stage}{description};dur={seconds * 1000:.1f}")
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """
+    Render all metrics in the Prometheus text format
+
+    With PROMETHEUS_MULTIPROC_DIR set, the metrics of every process writing to
+    that directory are combined, including the forecast and training workers.
+
+    Returns:
+        Payload and its content type
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
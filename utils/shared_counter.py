@@ -0,0 +1,64 @@
+"""Counter shared by every process on the host through a memory-mapped file"""
+import mmap
+import os
+import struct
+import threading
+from typing import Optional
+
+from utils.file_lock import file_lock
+
+_FORMAT = "<q"
+_SIZE = struct.calcsize(_FORMAT)
+
+
+class SharedCounter:
+    """
+    64-bit counter stored in a small file that every process memory-maps
+
+    Reading is a load from the mapping, cheap enough to do on every request.
+    Increments are serialized with a lock file, so processes never lose an
+    increment. The counter only tells that something changed, not what: a torn
+    read at worst makes a reader check its sources once more.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+
+    def value(self) -> int:
+        """Current value of the counter"""
+        return struct.unpack_from(_FORMAT, self._mapping(), 0)[0]
+
+    def increment(self) -> int:
+        """
+        Add one to the counter
+
+        Returns:
+            The new value
+        """
+        mapping = self._mapping()
+        with file_lock(self.lock_path):
+            value = struct.unpack_from(_FORMAT, mapping, 0)[0] + 1
+            struct.pack_into(_FORMAT, mapping, 0, value)
+        return value
+
+    def _mapping(self) -> mmap.mmap:
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    self._map = self._open()
+        return self._map
+
+    def _open(self) -> mmap.mmap:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with file_lock(self.lock_path):
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                if os.fstat(fd).st_size < _SIZE:
+                    # A new file reads as zeros, i.e. a counter at 0
+                    os.ftruncate(fd, _SIZE)
+                return mmap.mmap(fd, _SIZE)
+            finally:
+                os.close(fd)
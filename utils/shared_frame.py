@@ -0,0 +1,61 @@
+"""Share read-only DataFrames with worker processes through shared memory"""
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Iterator, NamedTuple
+
+import pandas as pd
+import pyarrow as pa
+
+
+class SharedFrame(NamedTuple):
+    """Picklable handle of a DataFrame published in a shared memory block"""
+    name: str
+    size: int
+
+
+@contextmanager
+def publish_frame(frame: pd.DataFrame) -> Iterator[SharedFrame]:
+    """
+    Serialize a DataFrame once into shared memory as an Arrow IPC stream
+
+    Only the small handle is pickled when it is sent to workers. The block is
+    released when the context exits, so workers must be done with it by then.
+
+    Args:
+        frame: DataFrame to share, the index is preserved
+
+    Yields:
+        Handle to pass to read_shared_frame
+    """
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    buffer = sink.getvalue()
+
+    block = shared_memory.SharedMemory(create=True, size=max(buffer.size, 1))
+    try:
+        block.buf[:buffer.size] = memoryview(buffer).cast("B")
+        yield SharedFrame(block.name, buffer.size)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def read_shared_frame(shared: SharedFrame) -> pd.DataFrame:
+    """
+    Rebuild a DataFrame published with publish_frame
+
+    Args:
+        shared: Handle received from the publishing process
+
+    Returns:
+        A private, writeable copy of the shared DataFrame
+    """
+    block = shared_memory.SharedMemory(name=shared.name)
+    try:
+        # One memcpy out of the block, so nothing references it once it is closed
+        payload = bytes(block.buf[:shared.size])
+    finally:
+        block.close()
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
@@ -0,0 +1,117 @@
+"""Single-flight coalescing of identical in-flight computations of the event loop"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Sequence, Tuple
+
+
+class SingleFlight:
+    """
+    Runs a computation once for all concurrent callers asking for the same key
+
+    The first caller of a key leads: it computes the value and publishes it to
+    every caller that asked for the key in the meantime, then the key is
+    forgotten, so a later call computes again (results are not cached here).
+    Keys must hold every input the result depends on. Leaders, coalesced
+    callers and failures are counted.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def claim(self, key: Hashable) -> Tuple[asyncio.Future, bool]:
+        """
+        Join the flight of a key, or start it
+
+        Args:
+            key: Identifies the computation and all its inputs
+
+        Returns:
+            The future of the value and whether the caller leads; a leader must
+            call resolve() for the key, also when it fails or is cancelled
+        """
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.leaders += 1
+        return future, True
+
+    def resolve(self, key: Hashable, value: Any) -> None:
+        """Publish the value of a led flight to its callers; an exception value is raised to them"""
+        future = self._flights.pop(key, None)
+        if future is None or future.done():
+            return
+        if isinstance(value, BaseException):
+            self.failures += 1
+            if isinstance(value, asyncio.CancelledError):
+                # The followers did not cancel anything themselves
+                value = RuntimeError("The shared computation was cancelled")
+            future.set_exception(value)
+            # Followers retrieve it; a flight without followers must not log it as never retrieved
+            future.exception()
+        else:
+            future.set_result(value)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await compute() once for all concurrent callers of the key
+
+        Args:
+            key: Identifies the computation and all its inputs
+            compute: Coroutine function computing the value, only called by the leader
+
+        Returns:
+            The value, exceptions of compute() are raised to every caller
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            # Shielded, so a follower that goes away does not cancel the others
+            return await asyncio.shield(future)
+        try:
+            value = await compute()
+        except BaseException as e:
+            self.resolve(key, e)
+            raise
+        self.resolve(key, value)
+        return value
+
+    async def run_many(self, keys: Sequence[Hashable], compute_many: Callable[[List[int]], Awaitable[List[Any]]]) -> List[Any]:
+        """
+        Compute the values of several keys, joining the ones already in flight
+
+        Args:
+            keys: One key per value
+            compute_many: Coroutine function given the positions this caller leads, returning
+                their values in the same order, with exceptions as values for failed ones
+
+        Returns:
+            The value or exception of every key, in the order of keys
+        """
+        claims = [self.claim(key) for key in keys]
+        led = [position for position, (_, leader) in enumerate(claims) if leader]
+        if led:
+            try:
+                values = await compute_many(led)
+            except BaseException as e:
+                for position in led:
+                    self.resolve(keys[position], e)
+                raise
+            for position, value in zip(led, values):
+                self.resolve(keys[position], value)
+        results = await asyncio.gather(*(asyncio.shield(future) for future, _ in claims), return_exceptions=True)
+        return list(results)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and the number of computations in flight"""
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / calls if calls else 0.0,
+            "failures": self.failures,
+        }